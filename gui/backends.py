@@ -0,0 +1,334 @@
+# backends.py
+"""
+Excel automation backends and their registry.
+
+Every way of running a macro on a workbook implements ExcelBackend, the operations used by
+worker.process_excel_file:
+
+    start()                          starts the session (once per worker, again after a restart)
+    open(path) -> book               opens a workbook
+    import_macro(book, macro_file)   imports a .bas module into it
+    run(book, macro_name, *args)     runs a macro on it, returns the macro's return value
+    run_sheets(book, macro_name, on_sheet)  runs it once per worksheet (see ExcelBackend.run_sheets)
+    modified(book)                   whether the macro changed the workbook (None if unknown)
+    save(book)                       saves it
+    close(book, save_changes=False)  closes it
+    stop()                           ends the session (worker exit, restart)
+    process_id()                     OS process id of the automated application, or None
+
+The backend of a run is chosen by name from BACKENDS (Gvar.excel_backend, cli.py --backend,
+the VBA_PYTHON_BACKEND environment variable for the default), instead of by which module is
+found under the name win32com:
+
+    com      Excel through pywin32 (Windows, Excel installed)
+    cpp      the pybind11 extension excel_vba built from cpp_lib/ (Windows, Excel installed)
+    fake     the simulated Excel of fake_excel.py (latency and failures from FAKE_EXCEL_PROFILE)
+    native   openpyxl and the VBA interpreter of vba_interp.py (native_excel.py)
+
+check() tells, without starting anything, why a backend cannot be used on this machine.
+A backend that can stop in the middle of a workbook watches cancel_event (set by the worker to the
+cancel event of the run) and raises Cancelled.
+"""
+import os
+import sys
+import time
+import logging
+
+# Backend mặc định; biến môi trường VBA_PYTHON_BACKEND cho phép đổi (ví dụ "fake" khi phát triển trên Linux).
+DEFAULT_BACKEND = os.environ.get("VBA_PYTHON_BACKEND", "com")
+CPP_LIB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cpp_lib")
+
+
+class Cancelled(Exception):
+    """
+    The run was cancelled while a workbook was being processed; it was closed without saving.
+    """
+
+class ExcelBackend:
+    """
+    One automation session of a worker process (see the module docstring for the operations).
+    """
+    name = None
+    cancel_event = None
+    # True khi backend luôn chạy macro một lần cho mỗi trang tính (run() gọi run_sheets()).
+    per_sheet = False
+
+    @classmethod
+    def check(cls):
+        """
+        Returns the reason this backend cannot be used here, or None if it can.
+        """
+        return None
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def open(self, path):
+        raise NotImplementedError
+
+    def import_macro(self, book, macro_file):
+        raise NotImplementedError
+
+    def run(self, book, macro_name, *args):
+        raise NotImplementedError
+
+    def sheet_names(self, book):
+        raise NotImplementedError
+
+    def run_sheets(self, book, macro_name, on_sheet=None):
+        """
+        Runs macro_name once per worksheet with the worksheet name as argument (like
+        RunVBA(sheetName) of macro_test.bas) and calls on_sheet(sheet, value, error, duration) after
+        each one. Stops at the first failing worksheet and raises its error; raises Cancelled when
+        cancel_event is set before a worksheet. Returns the number of worksheets run.
+        """
+        count = 0
+        for sheet in self.sheet_names(book):
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                raise Cancelled(f"Đã huỷ giữa chừng, trước trang {sheet}")
+            start = time.time()
+            try:
+                value = self.run(book, macro_name, sheet)
+            except Exception as e:
+                if on_sheet is not None:
+                    on_sheet(sheet, None, str(e), time.time() - start)
+                raise
+            if on_sheet is not None:
+                on_sheet(sheet, value, None, time.time() - start)
+            count += 1
+        return count
+
+    def modified(self, book):
+        return None
+
+    def save(self, book):
+        raise NotImplementedError
+
+    def close(self, book, save_changes=False):
+        raise NotImplementedError
+
+    def process_id(self):
+        return None
+
+
+class DispatchBackend(ExcelBackend):
+    """
+    Backend driving an object with the Excel.Application COM interface (Workbooks.Open,
+    VBProject.VBComponents.Import, Application.Run, Save, Close, Quit), created by dispatch().
+    """
+    def __init__(self):
+        self.app = None
+
+    def dispatch(self):
+        raise NotImplementedError
+
+    def start(self):
+        if self.app is None:
+            self.app = self.dispatch()
+
+    def stop(self):
+        if self.app is None:
+            return
+        try:
+            self.app.Application.Quit()
+        finally:
+            self.app = None
+
+    def open(self, path):
+        return self.app.Workbooks.Open(path)
+
+    def import_macro(self, book, macro_file):
+        book.VBProject.VBComponents.Import(macro_file)
+
+    def run(self, book, macro_name, *args):
+        return self.app.Application.Run(macro_name, *args)
+
+    def sheet_names(self, book):
+        worksheets = book.Worksheets
+        return [worksheets(i).Name for i in range(1, worksheets.Count + 1)]
+
+    def modified(self, book):
+        try:
+            return not book.Saved
+        except Exception:
+            return None
+
+    def save(self, book):
+        book.Save()
+
+    def close(self, book, save_changes=False):
+        book.Close(SaveChanges=save_changes)
+
+
+class ComBackend(DispatchBackend):
+    name = "com"
+
+    @classmethod
+    def check(cls):
+        try:
+            import win32com.client  # noqa: F401
+        except ImportError:
+            return "cần pywin32 và Microsoft Excel (chỉ có trên Windows)"
+        return None
+
+    def dispatch(self):
+        import win32com.client
+        app = win32com.client.gencache.EnsureDispatch("Excel.Application")
+        app.Visible = False
+        return app
+
+    def process_id(self):
+        # Cho phép bộ giám sát dừng một Excel bị treo.
+        if self.app is None:
+            return None
+        try:
+            import win32process
+            _, pid = win32process.GetWindowThreadProcessId(self.app.Hwnd)
+            return pid
+        except Exception:
+            return None
+
+
+class FakeBackend(DispatchBackend):
+    name = "fake"
+
+    def dispatch(self):
+        import fake_excel
+        app = fake_excel.gencache.EnsureDispatch("Excel.Application")
+        app.Visible = False
+        return app
+
+
+class NativeBackend(DispatchBackend):
+    name = "native"
+
+    @classmethod
+    def check(cls):
+        import native_excel
+        if native_excel.openpyxl is None:
+            return "cần thư viện openpyxl (pip install openpyxl)"
+        return None
+
+    def dispatch(self):
+        import native_excel
+        return native_excel.NativeExcel()
+
+    def sheet_names(self, book):
+        return [ws.title for ws in book.wb.worksheets]
+
+
+class CppBook:
+    def __init__(self, path):
+        self.path = path
+        self.macro_file = None
+        self.results = None
+
+
+class CppBackend(ExcelBackend):
+    """
+    The excel_vba extension (cpp_lib/excel_vba.cpp): one excel_vba.Session per worker, which runs a
+    workbook in one native call without holding the GIL. The macro is called once per worksheet
+    with its name (like RunVBA(sheetName) of macro_test.bas); every per-sheet result is logged as
+    soon as it arrives and kept in book.results. open / import_macro only record the job;
+    run_sheets() makes the call, saves the workbook when every sheet succeeded and closes it, so
+    save / close have nothing left to do. cancel_event is checked by the extension before every
+    worksheet. An error record in the results fails the file, as an exception of the COM and
+    native backends does. Whether the macro changed the workbook is not known (modified() is None).
+    """
+    name = "cpp"
+    per_sheet = True
+
+    def __init__(self):
+        self.module = None
+        self.session = None
+        self.logger = None
+
+    @classmethod
+    def check(cls):
+        try:
+            cls._import()
+        except ImportError:
+            return f"chưa build phần mở rộng excel_vba (xem {CPP_LIB_DIR})"
+        return None
+
+    @staticmethod
+    def _import():
+        if CPP_LIB_DIR not in sys.path:
+            sys.path.append(CPP_LIB_DIR)
+        import excel_vba
+        return excel_vba
+
+    def start(self):
+        if self.session is None:
+            # gv nhập module này, nên mpp_logger (nhập gv) chỉ được nhập khi khởi động phiên.
+            from mpp_logger import LoggingMultiProcess
+            self.logger = logging.getLogger(LoggingMultiProcess.MAIN_LOGGER)
+            self.module = self._import()
+            self.session = self.module.Session()
+
+    def stop(self):
+        if self.session is None:
+            return
+        try:
+            self.session.quit()
+        finally:
+            self.session = None
+
+    def open(self, path):
+        return CppBook(path)
+
+    def import_macro(self, book, macro_file):
+        book.macro_file = macro_file
+
+    def run(self, book, macro_name, *args):
+        if args:
+            raise ValueError("Backend cpp chỉ truyền tên trang tính cho macro")
+        self.run_sheets(book, macro_name)
+        return None
+
+    def run_sheets(self, book, macro_name, on_sheet=None):
+        last = [time.time()]
+
+        def deliver(record):
+            # Gọi từ phần mở rộng ngay khi một trang xong (đang giữ GIL).
+            now = time.time()
+            if record.ok:
+                self.logger.info(f"{record.path} [{record.sheet}]: {record.result}")
+            else:
+                self.logger.error(f"{record.path} [{record.sheet}]: {record.error}")
+            if on_sheet is not None and record.sheet:
+                on_sheet(record.sheet, record.result if record.ok else None, record.error or None, now - last[0])
+            last[0] = now
+
+        try:
+            book.results = self.session.run_file(book.macro_file, book.path, macro_name, callback=deliver,
+                                                 cancel=self.cancel_event, save_changes=True)
+        except self.module.Cancelled:
+            raise Cancelled(f"Đã huỷ giữa chừng: {book.path}")
+        # Bản ghi lỗi (của cả workbook hoặc của một trang) trả về thay vì ngoại lệ: tệp vẫn là lỗi.
+        failure = next((record for record in book.results if not record.ok), None)
+        if failure is not None:
+            raise RuntimeError(f"{failure.sheet}: {failure.error}" if failure.sheet else failure.error)
+        return len(book.results)
+
+    def save(self, book):
+        pass    # run() đã lưu workbook
+
+    def close(self, book, save_changes=False):
+        pass
+
+
+# Các backend chọn được theo tên.
+BACKENDS = {backend.name: backend for backend in (ComBackend, CppBackend, FakeBackend, NativeBackend)}
+
+
+def create_backend(name):
+    """
+    Returns a new, not yet started, session of the backend name.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Backend không hợp lệ: {name} (chọn một trong {', '.join(BACKENDS)})")
+    return BACKENDS[name]()
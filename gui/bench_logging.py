@@ -0,0 +1,491 @@
+# bench_logging.py
+"""
+Micro-benchmarks of the multiprocess logging pipeline (mpp_logger.LoggingMultiProcess).
+
+Each case starts a fresh LoggingMultiProcess and N producer processes set up like workers
+(worker.worker_logging_setup: a BoundedQueueHandler on a LogChannel of their own, logger level =
+the shared log level). The producers log records of a given message size, cycling through DEBUG,
+INFO, WARNING and ERROR, and the pipeline level decides how many of them pass. On the listener
+side the records are fanned out to the real sinks of the application:
+
+    terminal    StreamHandler on stdout with PrettyFormatter (stdout goes to os.devnull
+                unless --verbose, so the terminal itself is not measured)
+    file        JsonlFileHandler with JsonFormatter (logfile: one JSON line per record, compressed
+                with --compression), reported as "log_file" too: bytes per record on disk, and the
+                time to export the session as .json and .jsonl and to read it back (read_records)
+    memory      MemoryLogHandler appending to log_store (logstore.LogStore, capped by --store-mb)
+
+The GUI log view (logview.LogView) has no sink of its own: it reads the window on screen from
+log_store. It runs on a stub Text widget (no Tk) whose after() callbacks a thread standing in for
+the Tk event loop runs, and is reported as "view": redraws, records and characters in the widget
+per redraw, time per render (tick), the most new records one tick had to catch up on, time from
+the last log call until the view showed the last record and, once the run is over, the time to
+jump to the top, middle and end of the log and to change the filter (SCROLL_STEPS). With a virtualized view these stay flat as the log grows.
+
+Reported per case and per sink: records/sec, end-to-end latency from the producer's log call
+(record.created) to the end of the sink (p50 / p95 / p99, the sinks being called one after the
+other by the listener thread) and the time spent in the sink per record. The producer side
+reports the cost of a log call, and the memory side the growth of log_store (records, records
+spilled to disk, estimated bytes per record in memory, process RSS growth from /proc/self/statm
+when available). Records dropped by the overflow policy of the log channels (--queue-size,
+--overflow) are reported per level.
+
+A filter change of the view (LogView.show_levels) only redraws its window and is timed with the
+scroll steps. Reading every record of a filter (LogStore.texts: save_log and the export of the
+GUI log) is timed on the stored records for a few filters (RELOAD_FILTERS): "cached" uses the
+level indexes and formatted text of the store, "format" filters and formats every record again,
+as the GUI did before the store kept its text.
+
+Results are saved as JSON (default: <cache>/benchmarks/); --compare prints the change of
+records/sec against a previous result file.
+
+Example:
+    python bench_logging.py --producers 1 4 --sizes 64 1024 --levels DEBUG WARNING --records 2000
+    python bench_logging.py --producers 8 --records 20000 --queue-size 500 --overflow sample
+    python bench_logging.py --producers 4 --records 20000 --compression gzip
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import heapq
+import threading
+import argparse
+import platform
+import multiprocessing
+
+from bench_pipeline import latency_stats
+
+# Các mức log mà producer lần lượt ghi.
+PRODUCER_LEVELS = (logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR)
+SINK_NAMES = ("terminal", "file", "memory")
+# Thời gian chờ tối đa (giây) để mọi bản ghi tới các sink.
+DRAIN_TIMEOUT = 300.0
+# Các bộ lọc (mức, chỉ đúng mức) dùng để đo thời gian đọc toàn bộ văn bản log của một bộ lọc.
+RELOAD_FILTERS = (("DEBUG", False), ("INFO", True), ("ERROR", False))
+# Các thao tác cuộn / đổi bộ lọc được đo trên vùng log sau mỗi lượt: (tên, hàm nhận LogView).
+SCROLL_STEPS = (
+    ("top", lambda view: view.yview("moveto", 0.0)),
+    ("middle", lambda view: view.yview("moveto", 0.5)),
+    ("page", lambda view: view.yview("scroll", 1, "pages")),
+    ("end", lambda view: view.yview("moveto", 1.0)),
+    ("filter", lambda view: view.show_levels(logging.ERROR, True)),
+)
+
+
+class StubText:
+    """
+    Stands in for the Tk Text widget of LogView: keeps the size of its content, counts the redraws
+    and runs the after() callbacks on a thread of its own, when they are due, like the Tk event
+    loop, until stop().
+    """
+    HEIGHT = 600    # chiều cao (pixel) giả định của vùng log
+
+    def __init__(self):
+        self.draws = 0
+        self.records = 0
+        self.characters = 0
+        self.max_characters = 0
+        self._content = []
+        self._timers = []
+        self._order = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def after(self, delay, callback, *args):
+        with self._lock:
+            self._order += 1
+            heapq.heappush(self._timers, (time.perf_counter() + delay / 1000, self._order, callback, args))
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            with self._lock:
+                due = self._timers[0] if self._timers and self._timers[0][0] <= time.perf_counter() else None
+                if due is not None:
+                    heapq.heappop(self._timers)
+            if due is None:
+                time.sleep(0.002)
+            else:
+                due[2](*due[3])
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def configure(self, **kwargs):
+        pass
+
+    def bind(self, sequence, callback):
+        pass
+
+    def winfo_height(self):
+        return self.HEIGHT
+
+    def delete(self, first, last):
+        self._content = []
+
+    def insert(self, index, *chunks):
+        self._content.extend(chunks[::2])
+        characters = sum(len(text) for text in self._content)
+        self.draws += 1
+        self.records += len(self._content)
+        self.characters += characters
+        self.max_characters = max(self.max_characters, characters)
+
+    def count(self, first, last, *options):
+        return (sum(text.count("\n") for text in self._content),)
+
+    def yview(self, *args):
+        pass
+
+
+class StubScrollbar:
+    def configure(self, **kwargs):
+        pass
+
+    def set(self, first, last):
+        pass
+
+
+class StubFont:
+    def metrics(self, name):
+        return 15
+
+
+class SinkTimer:
+    """
+    Wraps handler.handle() to count the records a sink accepted, their end-to-end latency and
+    the time spent in the sink. Only benchmark records (extra={"bench": True}) are measured.
+    """
+    def __init__(self, name, handler):
+        self.name = name
+        self.count = 0
+        self.busy = 0.0
+        self.latencies = []
+        self.first_created = None
+        self.last_done = None
+        # Mỗi kênh log có một luồng listener riêng: các bộ đếm được cập nhật dưới khoá.
+        self._lock = threading.Lock()
+        self._handle = handler.handle
+        handler.handle = self.handle
+
+    def handle(self, record):
+        start = time.perf_counter()
+        accepted = self._handle(record)
+        end = time.perf_counter()
+        if accepted and getattr(record, "bench", False):
+            now = time.time()
+            with self._lock:
+                self.count += 1
+                self.busy += end - start
+                self.latencies.append(now - record.created)
+                if self.first_created is None or record.created < self.first_created:
+                    self.first_created = record.created
+                self.last_done = now
+        return accepted
+
+    def report(self):
+        span = (self.last_done - self.first_created) if self.count else 0.0
+        return {
+            "records": self.count,
+            "records_per_sec": self.count / span if span > 0 else 0.0,
+            "latency": latency_stats(self.latencies),
+            "service_time": self.busy / self.count if self.count else 0.0,
+        }
+
+
+def producer(log_channel, shared_log_level, records, message_size, ready, go, result_queue):
+    """
+    Producer process: sets up logging like a worker, then logs records as fast as possible.
+    """
+    import worker
+    worker.worker_logging_setup(log_channel, shared_log_level)
+    logger = worker.logger
+    payload = "x" * message_size
+    ready.put(os.getpid())
+    go.wait()
+    start = time.perf_counter()
+    for i in range(records):
+        logger.log(PRODUCER_LEVELS[i % len(PRODUCER_LEVELS)], payload, extra={"bench": True})
+    result_queue.put(time.perf_counter() - start)
+
+
+def rss_bytes():
+    """
+    Resident set size of this process from /proc/self/statm, or None when unavailable.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def filter_key(level_name, is_exact):
+    return f"{'=' if is_exact else '>='}{level_name}"
+
+
+def measure_reload(mp_logging):
+    """
+    Times the text of every record kept by each of RELOAD_FILTERS (what save_log writes), from the
+    cached text of the store and by formatting every record again. Returns {filter: {"records", "cached", "format"}}.
+    """
+    from mpp_logger import LOG_LEVELS
+    store, formatter = mp_logging.log_store, mp_logging.pretty_formatter
+    timings = {}
+    for level_name, is_exact in RELOAD_FILTERS:
+        level = LOG_LEVELS[level_name]
+        start = time.perf_counter()
+        texts = store.texts(level, is_exact)
+        "\n".join(texts)
+        cached = time.perf_counter() - start
+        start = time.perf_counter()
+        "\n".join(formatter.format(rec) for rec in store
+                  if (rec.levelno == level if is_exact else rec.levelno >= level))
+        timings[filter_key(level_name, is_exact)] = {"records": len(texts), "cached": cached,
+                                                     "format": time.perf_counter() - start}
+    return timings
+
+
+def expected_records(records, level):
+    return sum(1 for i in range(records) if PRODUCER_LEVELS[i % len(PRODUCER_LEVELS)] >= level)
+
+
+def measure_log_file(mp_logging):
+    """
+    Size on disk of the JSONL log file and the time to export it (.json, .jsonl) and read it back.
+    """
+    from logfile import read_records
+    handler = mp_logging.file_handler
+    export = {}
+    for name in ("export.json", "export.jsonl"):
+        path = os.path.join(mp_logging.log_dir, name)
+        start = time.perf_counter()
+        mp_logging.export_log(path)
+        export[name.split(".")[1]] = time.perf_counter() - start
+    start = time.perf_counter()
+    count = sum(1 for _ in read_records(os.path.join(mp_logging.log_dir, "export.jsonl")))
+    read = time.perf_counter() - start
+    size = sum(os.path.getsize(path) for path in handler.segments)
+    return {"compression": handler.compression, "segments": len(handler.segments), "records": count,
+            "bytes_per_record": size / count if count else 0.0, "export": export, "read": read}
+
+
+def run_case(num_producers, message_size, level_name, records, queue_size, overflow, store_bytes, compression):
+    """
+    Runs one benchmark case on a fresh LoggingMultiProcess and returns its metrics.
+    """
+    from mpp_logger import LoggingMultiProcess, LOG_LEVELS
+    from logview import LogView
+    level = LOG_LEVELS[level_name]
+    mp_logging = LoggingMultiProcess(queue_size, overflow, store_bytes, compression)
+    mp_logging.select_log_level(level)
+
+    stub = StubText()
+    view = LogView(stub, StubScrollbar(), mp_logging.log_store, StubFont())
+    view.level_filter = (level, False)
+    render_times = []
+    backlogs = []   # số bản ghi mới mà mỗi lần vẽ phải bắt kịp
+    render = view.render
+
+    def timed_render(force=False):
+        shown = view._shown
+        backlogs.append(view.store.count(level, False) - (view.first + shown[2] if shown else 0))
+        start = time.perf_counter()
+        render(force)
+        render_times.append(time.perf_counter() - start)
+    view.render = timed_render
+    timers = [SinkTimer(name, handler) for name, handler in zip(SINK_NAMES, mp_logging.handlers)]
+
+    rss_before = rss_bytes()
+    store_before = len(mp_logging.log_store)
+    ready, go, results = mp_logging.manager.Queue(), mp_logging.manager.Event(), mp_logging.manager.Queue()
+    channels = [mp_logging.open_channel() for _ in range(num_producers)]
+    procs = [multiprocessing.Process(target=producer, args=(channel, level, records, message_size,
+                                                             ready, go, results))
+             for channel in channels]
+    for proc in procs:
+        proc.start()
+    for _ in procs:
+        ready.get()
+    go.set()
+    emit_times = [results.get() for _ in procs]
+    emitted = time.time()
+    for proc in procs:
+        proc.join()
+
+    dropped = mp_logging.dropped_counts()
+    expected = expected_records(records, level) * num_producers - sum(dropped.values())
+    deadline = time.time() + DRAIN_TIMEOUT
+    while any(t.count < expected for t in timers) and time.time() < deadline:
+        time.sleep(0.05)
+    log_store = mp_logging.log_store
+    last = log_store.window(level, False, log_store.count(level, False) - 1, 1)
+    while last and (view._shown is None or view._shown[1] != last[0][0]) and time.time() < deadline:
+        time.sleep(0.005)
+    caught_up = time.time() - emitted
+    stub.stop()
+    view.render = render
+    scroll = {}
+    for name, step in SCROLL_STEPS:
+        start = time.perf_counter()
+        step(view)
+        scroll[name] = time.perf_counter() - start
+
+    for channel in channels:
+        mp_logging.close_channel(channel)
+    store = mp_logging.log_store.stats()
+    rss_after = rss_bytes()
+    reload = measure_reload(mp_logging)
+    log_file = measure_log_file(mp_logging)
+    result = {
+        "producers": num_producers,
+        "message_size": message_size,
+        "level": level_name,
+        "records_per_producer": records,
+        "queue_size": queue_size,
+        "overflow": overflow,
+        "expected_per_sink": expected,
+        "dropped": dropped,
+        "producer": {
+            "call_time": sum(emit_times) / (records * num_producers),
+            "calls_per_sec": records * num_producers / max(emit_times) if max(emit_times) > 0 else 0.0,
+        },
+        "sinks": {t.name: t.report() for t in timers},
+        "view": {
+            "draws": stub.draws,
+            "records_per_draw": stub.records / stub.draws if stub.draws else 0.0,
+            "chars_per_draw": stub.characters / stub.draws if stub.draws else 0.0,
+            "max_chars": stub.max_characters,
+            "render_time": latency_stats(render_times),
+            "max_backlog": max(backlogs, default=0),
+            "catch_up": caught_up,
+            "scroll": scroll,
+        },
+        "log_store": {
+            "records": store["records"] - store_before,
+            "spilled": store["spilled"],
+            "bytes_per_record": store["bytes"] / store["in_memory"] if store["in_memory"] else 0.0,
+            "rss_growth": (rss_after - rss_before) if rss_before is not None and rss_after is not None else None,
+        },
+        "reload": reload,
+        "log_file": log_file,
+    }
+
+    mp_logging.shutdown()
+    mp_logging.logger.handlers.clear()
+    shutil.rmtree(mp_logging.log_dir, ignore_errors=True)
+    return result
+
+
+def case_key(case):
+    return f"{case['producers']}p/{case['message_size']}B/{case['level']}"
+
+
+def compare(cases, previous_path):
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = {case_key(c): c for c in json.load(f)["cases"]}
+    lines = []
+    for case in cases:
+        before = previous.get(case_key(case))
+        if before is None:
+            continue
+        for sink in SINK_NAMES:
+            old, new = before["sinks"][sink]["records_per_sec"], case["sinks"][sink]["records_per_sec"]
+            change = (new - old) / old * 100 if old else 0.0
+            lines.append(f"  {case_key(case)} {sink}: {old:.0f} -> {new:.0f} bản ghi/giây ({change:+.1f}%)")
+    return lines
+
+
+def parse_args(argv=None):
+    from mpp_logger import LOG_LEVELS, LOG_QUEUE_SIZE, LOG_OVERFLOW, OVERFLOW_POLICIES
+    from logstore import LOG_STORE_MAX_BYTES
+    from logfile import LOG_FILE_COMPRESSION, COMPRESSIONS
+    parser = argparse.ArgumentParser(description="Đo hiệu năng của hệ thống log đa tiến trình.")
+    parser.add_argument("--producers", type=int, nargs="+", default=[1, 4], help="Số tiến trình ghi log")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 1024], help="Độ dài thông điệp (ký tự)")
+    parser.add_argument("--levels", nargs="+", default=["DEBUG", "WARNING"],
+                        choices=[n for n in LOG_LEVELS if n != "NOTSET"], help="Mức log của hệ thống")
+    parser.add_argument("--records", type=int, default=1000, help="Số bản ghi mỗi tiến trình")
+    parser.add_argument("--queue-size", type=int, default=LOG_QUEUE_SIZE,
+                        help="Số bản ghi tối đa trên đường đi của mỗi kênh log")
+    parser.add_argument("--overflow", default=LOG_OVERFLOW, choices=OVERFLOW_POLICIES,
+                        help="Chính sách khi kênh log đầy")
+    parser.add_argument("--store-mb", type=float, default=LOG_STORE_MAX_BYTES / 1048576,
+                        help="Bộ nhớ tối đa của kho log (MB) trước khi chuyển bản ghi cũ ra đĩa")
+    parser.add_argument("--compression", default=LOG_FILE_COMPRESSION, choices=list(COMPRESSIONS),
+                        help="Nén các đoạn file log JSONL")
+    parser.add_argument("--output", default=None, help="Tệp JSON kết quả (mặc định: <cache>/benchmarks/)")
+    parser.add_argument("--compare", default=None, help="Tệp JSON kết quả trước đó để so sánh")
+    parser.add_argument("--label", default="", help="Nhãn ghi kèm kết quả")
+    parser.add_argument("--verbose", action="store_true", help="Giữ log trên terminal")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = sys.stdout
+    if not args.verbose:
+        # Bản ghi log của sink terminal đi vào os.devnull; báo cáo giữ stdout gốc.
+        sys.stdout.flush()
+        report = os.fdopen(os.dup(1), "w", encoding="utf-8", buffering=1)
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        os.close(devnull)
+
+    cases = []
+    for level_name in args.levels:
+        for message_size in args.sizes:
+            for num_producers in args.producers:
+                case = run_case(num_producers, message_size, level_name, args.records,
+                                args.queue_size, args.overflow, int(args.store_mb * 1048576), args.compression)
+                cases.append(case)
+                sinks = ", ".join(f"{name} {s['records_per_sec']:.0f}/s p95 {s['latency']['p95'] * 1000:.1f}ms "
+                                  f"({s['service_time'] * 1e6:.0f}µs)" for name, s in case["sinks"].items())
+                store = case["log_store"]
+                print(f"{case_key(case)}: log() {case['producer']['call_time'] * 1e6:.1f}µs | {sinks} | "
+                      f"log_store {store['records']} bản ghi ({store['spilled']} trên đĩa), "
+                      f"~{store['bytes_per_record']:.0f}B/bản ghi"
+                      + (f" | bỏ {sum(case['dropped'].values())} bản ghi" if any(case["dropped"].values()) else ""),
+                      file=report)
+                reload = ", ".join(f"{key} {r['records']} bản ghi {r['cached'] * 1000:.1f}ms "
+                                   f"(định dạng lại {r['format'] * 1000:.1f}ms)" for key, r in case["reload"].items())
+                print(f"  đọc toàn bộ log: {reload}", file=report)
+                view = case["view"]
+                scroll = ", ".join(f"{name} {t * 1000:.2f}ms" for name, t in view["scroll"].items())
+                print(f"  vùng log: {view['draws']} lần vẽ, {view['records_per_draw']:.0f} bản ghi/lần "
+                      f"({view['chars_per_draw']:.0f} ký tự, tối đa {view['max_chars']}), "
+                      f"vẽ p95 {view['render_time']['p95'] * 1000:.2f}ms, tồn tối đa {view['max_backlog']} bản ghi/nhịp, "
+                      f"theo kịp sau {view['catch_up'] * 1000:.0f}ms | {scroll}", file=report)
+                log_file = case["log_file"]
+                print(f"  file log ({log_file['compression']}): {log_file['segments']} đoạn, "
+                      f"~{log_file['bytes_per_record']:.0f}B/bản ghi, xuất .json {log_file['export']['json'] * 1000:.0f}ms, "
+                      f".jsonl {log_file['export']['jsonl'] * 1000:.0f}ms, đọc lại {log_file['read'] * 1000:.0f}ms",
+                      file=report)
+
+    from gv import CACHE_DIR
+    result = {
+        "label": args.label,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count()},
+        "cases": cases,
+    }
+    output = args.output or os.path.join(CACHE_DIR, "benchmarks", time.strftime("logging_%Y%m%d_%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=4)
+    print(f"Kết quả lưu tại: {output}", file=report)
+    if args.compare:
+        print(f"So sánh với {args.compare}:", file=report)
+        for line in compare(cases, args.compare):
+            print(line, file=report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
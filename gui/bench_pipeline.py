@@ -0,0 +1,334 @@
+# bench_pipeline.py
+"""
+End-to-end benchmark of the batch pipeline, by default against the fake Excel (fake_excel.py).
+
+A run goes through the same steps as the GUI: file discovery (run_manifest.scan_excel_files),
+dispatch ordering and scheduling (scheduler.run_files), the supervised worker pool, the shared
+logging queue (LoggingMultiProcess) and a progress consumer draining the progress queue like
+MainWindow.update_progress. Only Excel is simulated: the per-operation latency distributions
+and the failure rate of the fake are set through FAKE_EXCEL_PROFILE (see fake_excel.py),
+either from a preset of PROFILES or from a JSON string / file.
+
+--backend runs the same job through several backends (backends.BACKENDS) one after the other,
+e.g. --backend fake native, and reports each of them. For a backend other than fake the
+workbooks are real .xlsx files (a "Planning" sheet of --rows rows) and the default macro is
+CreateGrandTotalAndChart of macro_module.bas; backends that cannot run here are skipped.
+
+Reported per run:
+    files_per_sec               files reaching their final outcome per second of wall time.
+    latency p50 / p95 / p99     per-file processing time measured in the workers (all attempts).
+    overhead_per_file           worker-seconds not spent processing a file (start-up, queueing,
+                                idle tail), divided by the number of files.
+    startup                     time from the start of the run to the first file started.
+
+Results are saved as JSON (default: <cache>/benchmarks/) so that runs can be compared over
+time; --compare prints the change against a previous result file.
+
+Example:
+    python bench_pipeline.py --files 200 --workers 4 --profile fast --failure-rate 0.01
+    python bench_pipeline.py --files 50 --backend fake native
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import threading
+
+# Cấu hình có sẵn cho Excel giả lập (giây); xem fake_excel.py cho định dạng.
+PROFILES = {
+    # Chỉ đo chi phí điều phối: mọi thao tác Excel tức thời.
+    "instant": {"latency": {op: 0.0 for op in ("dispatch", "open", "import", "run", "save", "close", "quit")}},
+    # Thao tác nhanh, macro có phân phối lệch phải.
+    "fast": {"latency": {"dispatch": 0.2, "open": 0.01, "import": 0.01,
+                         "run": {"dist": "lognormal", "mean": 0.05, "sigma": 0.5},
+                         "save": 0.01, "close": 0.005, "quit": 0.1}},
+    # Gần với một máy Excel thật: khởi động chậm, macro từ vài trăm ms tới vài giây.
+    "realistic": {"latency": {"dispatch": 2.0, "open": {"dist": "uniform", "low": 0.1, "high": 0.5},
+                              "import": 0.05, "run": {"dist": "lognormal", "mean": 0.8, "sigma": 0.7},
+                              "save": {"dist": "uniform", "low": 0.1, "high": 0.4}, "close": 0.05, "quit": 0.5}},
+    # Mô phỏng mặc định cũ: 1 giây cho mỗi thao tác.
+    "default": {},
+}
+
+RESULTS_DIR_NAME = "benchmarks"
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Công việc mặc định: macro_test.bas khi chỉ đo Excel giả, macro thật trên tệp thật với các backend khác.
+FAKE_MACRO_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "macro_test.bas")
+REAL_MACRO_FILE = os.path.join(PROJECT_DIR, "macro_module.bas")
+REAL_MACRO_NAME = "CreateGrandTotalAndChart"
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of values (0 for an empty list).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def latency_stats(values):
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0.0,
+    }
+
+
+def load_profile(name_or_json, failure_rate=None, seed=None):
+    """
+    Returns the fake Excel profile for a preset name, a JSON string or a JSON file.
+    """
+    if name_or_json in PROFILES:
+        profile = json.loads(json.dumps(PROFILES[name_or_json]))
+    elif os.path.isfile(name_or_json):
+        with open(name_or_json, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+    else:
+        profile = json.loads(name_or_json)
+    if failure_rate is not None:
+        profile["failure_rate"] = failure_rate
+    if seed is not None:
+        profile["seed"] = seed
+    profile.setdefault("quiet", True)
+    return profile
+
+
+def make_workbooks(directory, count, size=1024, rows=None):
+    """
+    Creates count workbooks in directory: placeholders of size bytes, or, when rows is given,
+    real workbooks with a "Planning" sheet of rows data rows (needs openpyxl).
+    """
+    if rows is None:
+        payload = b"\0" * size
+    else:
+        import io
+        import openpyxl
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = "Planning"
+        ws.append(["Month", "Sales"])
+        for r in range(rows):
+            ws.append([f"M{r + 1}", (r * 37) % 101 + 1])
+        buffer = io.BytesIO()
+        wb.save(buffer)
+        payload = buffer.getvalue()
+    for i in range(count):
+        # Tên tệp chỉ gồm chữ cái: worker.process_excel_file coi các đường dẫn chứa "0003" là lỗi (thử nghiệm).
+        name = "".join("abcdefghij"[int(d)] for d in f"{i:06d}")
+        with open(os.path.join(directory, f"bench_{name}.xlsx"), "wb") as f:
+            f.write(payload)
+
+
+def run_benchmark(args, mp_logging, backend="fake"):
+    """
+    Runs the pipeline once with backend on a fresh directory of args.files workbooks and returns the metrics.
+    """
+    import scheduler
+    import run_manifest
+    from ordering import DurationHistory
+
+    work_dir = tempfile.mkdtemp(prefix="vba_bench_")
+    try:
+        make_workbooks(work_dir, args.files, args.file_size, None if backend == "fake" else args.rows)
+        progress_queue = mp_logging.manager.Queue()
+        progressed = []
+        done = threading.Event()
+
+        def consume_progress():
+            # Như MainWindow.update_progress: rút hàng đợi tiến trình định kỳ.
+            while not done.is_set() or not progress_queue.empty():
+                while not progress_queue.empty():
+                    progressed.append(progress_queue.get())
+                time.sleep(0.1)
+
+        consumer = threading.Thread(target=consume_progress, daemon=True)
+        consumer.start()
+
+        run_start = time.time()
+        scanned = run_manifest.scan_excel_files(work_dir)
+        discovery = time.time() - run_start
+        history = DurationHistory(path=os.path.join(work_dir, "durations.json"))
+        summary = scheduler.run_files([path for path, _ in scanned], args.workers, mp_logging, progress_queue,
+                                      max_chunk=args.max_chunk, ordering=args.ordering, history=history,
+                                      retry_backoff=args.retry_backoff, macro_file=args.bas,
+                                      macro_name=args.macro, backend=backend)
+        wall = time.time() - run_start
+        done.set()
+        consumer.join()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    durations = [e["end"] - e["start"] for e in summary.events]
+    busy = sum(durations)
+    first_start = min((e["start"] for e in summary.events), default=run_start)
+    return {
+        "wall_time": wall,
+        "discovery_time": discovery,
+        "startup": first_start - run_start,
+        "files_per_sec": args.files / wall if wall > 0 else 0.0,
+        "latency": latency_stats(durations),
+        "overhead_per_file": max(wall * summary.num_workers - busy, 0.0) / max(args.files, 1),
+        "processed": summary.processed,
+        "failed": len(summary.failed),
+        "retried": summary.retried,
+        "progress_updates": len(progressed),
+    }
+
+
+def compare(current, previous_path, backend="fake"):
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = json.load(f)
+    # Kết quả cũ (trước --backend) chỉ có một "summary", đo trên Excel giả.
+    previous = previous.get("backends", {"fake": {"summary": previous["summary"]}}).get(backend, {}).get("summary")
+    if previous is None:
+        return [f"  (không có kết quả backend {backend} để so sánh)"]
+    lines = []
+    for key in ("files_per_sec", "overhead_per_file"):
+        before, after = previous[key], current[key]
+        change = (after - before) / before * 100 if before else 0.0
+        lines.append(f"  {key}: {before:.4f} -> {after:.4f} ({change:+.1f}%)")
+    for key in ("p50", "p95", "p99"):
+        before, after = previous["latency"][key], current["latency"][key]
+        change = (after - before) / before * 100 if before else 0.0
+        lines.append(f"  latency {key}: {before:.4f}s -> {after:.4f}s ({change:+.1f}%)")
+    return lines
+
+
+def summarize(runs):
+    """
+    Median of each metric over the repeated runs.
+    """
+    def median(values):
+        return percentile(values, 50)
+    return {
+        "files_per_sec": median([r["files_per_sec"] for r in runs]),
+        "overhead_per_file": median([r["overhead_per_file"] for r in runs]),
+        "startup": median([r["startup"] for r in runs]),
+        "latency": {key: median([r["latency"][key] for r in runs]) for key in ("mean", "p50", "p95", "p99", "max")},
+    }
+
+
+def parse_args(argv=None):
+    import ordering
+    import backends
+    from concurrency import default_worker_count
+    from mpp_logger import LOG_LEVELS
+
+    parser = argparse.ArgumentParser(description="Đo hiệu năng toàn bộ quy trình với Excel giả lập.")
+    parser.add_argument("--files", type=int, default=100, help="Số tệp Excel giả")
+    parser.add_argument("--file-size", type=int, default=1024, help="Dung lượng mỗi tệp giả (byte, backend fake)")
+    parser.add_argument("--rows", type=int, default=100, help="Số dòng dữ liệu mỗi tệp thật (backend khác fake)")
+    parser.add_argument("--backend", nargs="+", default=["fake"], choices=sorted(backends.BACKENDS),
+                        help="Các backend chạy cùng một công việc để so sánh")
+    parser.add_argument("--workers", type=int, default=default_worker_count(), help="Số worker")
+    parser.add_argument("--profile", default="fast",
+                        help=f"Cấu hình Excel giả: {', '.join(PROFILES)}, chuỗi JSON hoặc tệp JSON")
+    parser.add_argument("--failure-rate", type=float, default=None, help="Xác suất macro lỗi")
+    parser.add_argument("--seed", type=int, default=None, help="Hạt giống ngẫu nhiên của Excel giả")
+    parser.add_argument("--ordering", default="history", choices=sorted(ordering.ORDERINGS))
+    parser.add_argument("--max-chunk", type=int, default=4, help="Số tệp tối đa mỗi lần phát việc")
+    parser.add_argument("--retry-backoff", type=float, default=0.0, help="Thời gian chờ trước khi thử lại")
+    parser.add_argument("--repeat", type=int, default=1, help="Số lần chạy (báo cáo trung vị)")
+    parser.add_argument("--log-level", default="INFO", choices=[n for n in LOG_LEVELS if n != "NOTSET"])
+    parser.add_argument("--bas", default=None, help="Tệp .bas truyền cho worker (mặc định theo backend)")
+    parser.add_argument("--macro", default=None, help="Tên macro (mặc định theo backend)")
+    parser.add_argument("--output", default=None, help="Tệp JSON kết quả (mặc định: <cache>/benchmarks/)")
+    parser.add_argument("--compare", default=None, help="Tệp JSON kết quả trước đó để so sánh")
+    parser.add_argument("--label", default="", help="Nhãn ghi kèm kết quả")
+    parser.add_argument("--verbose", action="store_true", help="Hiện log và các dòng in của worker")
+    args = parser.parse_args(argv)
+    if args.bas is None:
+        only_fake = set(args.backend) == {"fake"}
+        args.bas = FAKE_MACRO_FILE if only_fake else REAL_MACRO_FILE
+        args.macro = args.macro or (None if only_fake else REAL_MACRO_NAME)
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    profile = load_profile(args.profile, args.failure_rate, args.seed)
+    os.environ["FAKE_EXCEL_PROFILE"] = json.dumps(profile)
+
+    import backends
+    selected = []
+    for backend in dict.fromkeys(args.backend):
+        reason = backends.BACKENDS[backend].check()
+        if reason:
+            print(f"Bỏ qua backend {backend}: {reason}", file=sys.stderr)
+        else:
+            selected.append(backend)
+    if not selected:
+        return 2
+
+    report = sys.stdout
+    if not args.verbose:
+        # Giữ stdout cho báo cáo; các dòng in và log của tiến trình này và của worker bị bỏ đi.
+        sys.stdout.flush()
+        report = os.fdopen(os.dup(1), "w", encoding="utf-8", buffering=1)
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        os.close(devnull)
+
+    from gv import CACHE_DIR
+    from mpp_logger import get_mp_logger, LOG_LEVELS
+    mp_logging = get_mp_logger()
+    mp_logging.select_log_level(LOG_LEVELS[args.log_level])
+
+    results = {}
+    for backend in selected:
+        runs = []
+        for i in range(args.repeat):
+            metrics = run_benchmark(args, mp_logging, backend)
+            runs.append(metrics)
+            lat = metrics["latency"]
+            print(f"[{backend}] Lần {i + 1}/{args.repeat}: {metrics['files_per_sec']:.2f} tệp/giây, "
+                  f"p50 {lat['p50'] * 1000:.1f}ms, p95 {lat['p95'] * 1000:.1f}ms, p99 {lat['p99'] * 1000:.1f}ms, "
+                  f"chi phí điều phối {metrics['overhead_per_file'] * 1000:.1f}ms/tệp, "
+                  f"khởi động {metrics['startup']:.2f}s, {metrics['retried']} lần thử lại, {metrics['failed']} lỗi",
+                  file=report)
+        results[backend] = {"summary": summarize(runs), "runs": runs}
+    mp_logging.shutdown()
+
+    result = {
+        "label": args.label,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {key: getattr(args, key) for key in ("files", "file_size", "rows", "workers", "ordering",
+                                                         "max_chunk", "retry_backoff", "repeat", "log_level",
+                                                         "bas", "macro")},
+        "profile": profile,
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count()},
+        # "summary" / "runs" của backend đầu tiên, giữ định dạng của các kết quả cũ.
+        "summary": results[selected[0]]["summary"],
+        "runs": results[selected[0]]["runs"],
+        "backends": results,
+    }
+    output = args.output or os.path.join(CACHE_DIR, RESULTS_DIR_NAME,
+                                         time.strftime("pipeline_%Y%m%d_%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=4)
+    for backend, entry in results.items():
+        summary = entry["summary"]
+        print(f"Kết quả [{backend}]: {summary['files_per_sec']:.2f} tệp/giây, p99 {summary['latency']['p99'] * 1000:.1f}ms, "
+              f"chi phí điều phối {summary['overhead_per_file'] * 1000:.1f}ms/tệp", file=report)
+        if args.compare:
+            print(f"  so sánh với {args.compare}:", file=report)
+            for line in compare(summary, args.compare, backend):
+                print(line, file=report)
+    print(f"-> {output}", file=report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# bench_range.py
+"""
+Per-cell vs bulk cell access (bulk_range.py) on the fake Excel of fake_excel.py.
+
+A sheet of --rows x --cols values is written and read back twice: cell by cell (one Range.Value
+call per cell, as a loop over ws.Cells(r, c).Value does over COM) and with bulk_range
+(one call per chunk). --call-latency sets the cost of one COM call on the fake ("range" latency
+of FAKE_EXCEL_PROFILE); a cross-process COM call to a real Excel costs roughly 0.1-1 ms.
+The per-cell case is measured on at most --sample-rows rows and extrapolated.
+
+Example:
+    python bench_range.py --rows 50000 --cols 4 --call-latency 0.0002
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="So sánh đọc / ghi từng ô với đọc / ghi hàng loạt qua COM (Excel giả lập).")
+    parser.add_argument("--rows", type=int, default=50000, help="Số dòng")
+    parser.add_argument("--cols", type=int, default=4, help="Số cột")
+    parser.add_argument("--call-latency", type=float, default=0.0002, help="Độ trễ (giây) mỗi lượt gọi COM")
+    parser.add_argument("--sample-rows", type=int, default=500, help="Số dòng đo cho cách từng ô (rồi ngoại suy)")
+    parser.add_argument("--chunk-cells", type=int, default=None, help="Số ô tối đa mỗi lượt gọi hàng loạt")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ["FAKE_EXCEL_PROFILE"] = json.dumps({"quiet": True, "latency": {
+        "dispatch": 0, "open": 0, "import": 0, "run": 0, "save": 0, "close": 0, "quit": 0,
+        "range": args.call_latency}})
+    import fake_excel
+    import bulk_range
+
+    chunk_cells = args.chunk_cells or bulk_range.CHUNK_CELLS
+    ws = fake_excel.gencache.EnsureDispatch("Excel.Application").Workbooks.Open("bench.xlsx").Worksheets(1)
+    data = [[r * args.cols + c for c in range(args.cols)] for r in range(args.rows)]
+    sample = min(args.sample_rows, args.rows)
+    scale = args.rows / sample if sample else 0.0
+
+    start = time.perf_counter()
+    for r in range(sample):
+        for c in range(args.cols):
+            ws.Cells(r + 1, c + 1).Value = data[r][c]
+    cell_write = (time.perf_counter() - start) * scale
+    start = time.perf_counter()
+    for r in range(sample):
+        for c in range(args.cols):
+            ws.Cells(r + 1, c + 1).Value
+    cell_read = (time.perf_counter() - start) * scale
+
+    start = time.perf_counter()
+    write_calls = bulk_range.write_range(ws, 1, 1, data, chunk_cells)
+    bulk_write = time.perf_counter() - start
+    start = time.perf_counter()
+    _, _, back = bulk_range.read_used_range(ws, chunk_cells)
+    bulk_read = time.perf_counter() - start
+    if back != data:
+        print("Lỗi: dữ liệu đọc lại khác dữ liệu đã ghi")
+        return 1
+
+    cells = args.rows * args.cols
+    print(f"{args.rows} dòng x {args.cols} cột, {args.call_latency * 1000:.2f}ms mỗi lượt gọi COM")
+    print(f"  từng ô    : ghi {cell_write:8.2f}s, đọc {cell_read:8.2f}s ({cells} lượt gọi mỗi chiều, ngoại suy từ {sample} dòng)")
+    print(f"  hàng loạt : ghi {bulk_write:8.2f}s, đọc {bulk_read:8.2f}s ({write_calls} lượt gọi ghi)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
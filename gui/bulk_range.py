@@ -0,0 +1,140 @@
+# bulk_range.py
+"""
+Bulk cell access over COM: read or write a whole block of a worksheet with one Range.Value call
+instead of one cross-process call per cell.
+
+    first_row, first_col, data = read_used_range(ws)        # 2-D list of the used range
+    write_range(ws, first_row, first_col + 3, results)       # 2-D block written back
+    array = to_array(data)                                   # NumPy float array, empty cells = nan
+
+Values are converted on the way in and out:
+    read    empty cell -> None; dates (pywintypes time, a timezone-aware datetime) -> naive datetime,
+            the wall-clock time shown in Excel; other values unchanged (COM errors such as #N/A
+            arrive as their negative integer codes).
+    write   None and NaN -> empty cell; NumPy scalars -> Python numbers; date -> datetime;
+            Decimal -> float; rows shorter than the block are padded with empty cells.
+
+Large blocks are transferred in chunks of whole rows (at most CHUNK_CELLS cells per call), which
+bounds the size of the SAFEARRAY marshalled by COM. ws is any object with the Excel COM worksheet
+interface (Cells, Range, UsedRange): a real worksheet or the fake one of fake_excel.py.
+"""
+import math
+import decimal
+import datetime
+
+# Số ô tối đa trong một lần gọi Range.Value.
+CHUNK_CELLS = 500000
+
+
+def _block(ws, first_row, first_col, rows, cols):
+    return ws.Range(ws.Cells(first_row, first_col), ws.Cells(first_row + rows - 1, first_col + cols - 1))
+
+
+def chunk_rows(cols, chunk_cells=CHUNK_CELLS):
+    """
+    Number of rows of cols columns transferred per call.
+    """
+    return max(1, chunk_cells // max(cols, 1))
+
+
+def from_com(value):
+    """
+    Converts one value read from Excel.
+    """
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        return datetime.datetime(value.year, value.month, value.day, value.hour, value.minute, value.second,
+                                 value.microsecond)
+    return value
+
+
+def to_com(value):
+    """
+    Converts one value before writing it to Excel.
+    """
+    if value is None:
+        return None
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        value = value.item()    # numpy scalar
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        return datetime.datetime(value.year, value.month, value.day)
+    return value
+
+
+def _rows_of(value, rows, cols):
+    # Range.Value trả về một giá trị khi vùng chỉ có một ô, ngược lại là tuple các dòng.
+    if rows == 1 and cols == 1 and not isinstance(value, (tuple, list)):
+        return [[from_com(value)]]
+    return [[from_com(v) for v in row] for row in value]
+
+
+def read_range(ws, first_row, first_col, rows, cols, chunk_cells=CHUNK_CELLS):
+    """
+    Reads rows x cols cells starting at (first_row, first_col) as a list of rows.
+    """
+    data = []
+    step = chunk_rows(cols, chunk_cells)
+    for offset in range(0, rows, step):
+        count = min(step, rows - offset)
+        data.extend(_rows_of(_block(ws, first_row + offset, first_col, count, cols).Value, count, cols))
+    return data
+
+
+def used_range(ws):
+    """
+    (first_row, first_col, rows, cols) of the used range of ws.
+    """
+    used = ws.UsedRange
+    return used.Row, used.Column, used.Rows.Count, used.Columns.Count
+
+
+def read_used_range(ws, chunk_cells=CHUNK_CELLS):
+    """
+    Reads the used range of ws. Returns (first_row, first_col, data), data being a list of rows.
+    """
+    first_row, first_col, rows, cols = used_range(ws)
+    return first_row, first_col, read_range(ws, first_row, first_col, rows, cols, chunk_cells)
+
+
+def write_range(ws, first_row, first_col, data, chunk_cells=CHUNK_CELLS):
+    """
+    Writes data (a sequence of rows, or a 2-D NumPy array) to the block starting at
+    (first_row, first_col). Returns the number of Range.Value calls made.
+    """
+    rows = [list(row) for row in data]
+    if not rows:
+        return 0
+    cols = max(len(row) for row in rows)
+    if cols == 0:
+        return 0
+    block = tuple(tuple(to_com(v) for v in row) + (None,) * (cols - len(row)) for row in rows)
+    step = chunk_rows(cols, chunk_cells)
+    calls = 0
+    for offset in range(0, len(block), step):
+        part = block[offset:offset + step]
+        _block(ws, first_row + offset, first_col, len(part), cols).Value = part
+        calls += 1
+    return calls
+
+
+def to_array(data, dtype=float):
+    """
+    2-D NumPy array of data. With a float dtype, empty and non-numeric cells become NaN;
+    with dtype=object the values are kept as they are.
+    """
+    import numpy as np
+    if dtype is object:
+        array = np.empty((len(data), max((len(r) for r in data), default=0)), dtype=object)
+        for i, row in enumerate(data):
+            array[i, :len(row)] = row
+        return array
+
+    def number(value):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return math.nan
+        return value
+
+    return np.array([[number(v) for v in row] for row in data], dtype=dtype)
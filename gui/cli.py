@@ -0,0 +1,183 @@
+# cli.py
+"""
+Headless command-line runner: runs a macro over a directory (or a list) of workbooks with the
+same multiprocess pipeline as the GUI (scheduler.run_files), without importing tkinter.
+
+One JSON line is written per file as soon as its final outcome is known:
+
+    {"path": ..., "status": "ok" | "failed" | "timeout" | "cancelled" | "skipped",
+     "duration": seconds, "pid": worker pid, "attempts": n, "error": message or null}
+
+Results go to stdout (default) or to the --output file. When they go to stdout, the logs are
+moved to stderr, so stdout can be piped straight into another program. Directories are
+incremental like the GUI (run_manifest): unchanged workbooks are reported as "skipped"
+unless --force is given.
+
+Ctrl+C cancels the run cooperatively (a second Ctrl+C exits at once).
+Exit status: 0 when every file succeeded or was skipped, 1 when some failed, 130 when cancelled.
+
+Example:
+    python cli.py C:\\data\\excel --bas macro_module.bas --macro ProcessWorkbook --workers 4 > results.jsonl
+"""
+import os
+import sys
+import json
+import signal
+import argparse
+import threading
+
+def parse_args(argv=None):
+    import worker
+    import backends
+    import ordering
+    import recipes
+    import scheduler
+    from mpp_logger import LOG_LEVELS
+    from concurrency import default_worker_count
+
+    parser = argparse.ArgumentParser(description="Chạy macro VBA trên các tệp Excel, không cần giao diện.")
+    parser.add_argument("paths", nargs="+", help="Thư mục chứa tệp .xlsx, hoặc danh sách tệp Excel")
+    parser.add_argument("--bas", default=worker.DEFAULT_MACRO_FILE, help="Tệp module VBA (.bas) nhập vào mỗi tệp")
+    parser.add_argument("--macro", default=worker.DEFAULT_MACRO_NAME, help="Tên macro chạy trên mỗi tệp")
+    parser.add_argument("--recipe", default=None, choices=sorted(recipes.RECIPES),
+                        help="Recipe Python áp dụng thay cho macro (không cần Excel)")
+    parser.add_argument("--workers", default=str(default_worker_count()),
+                        help="Số tiến trình worker, hoặc 'auto' để tự điều chỉnh theo thông lượng")
+    parser.add_argument("--min-workers", type=int, default=1, help="Số worker tối thiểu khi --workers auto")
+    parser.add_argument("--max-workers", type=int, default=None,
+                        help="Số worker tối đa khi --workers auto (mặc định: số lõi CPU)")
+    parser.add_argument("--backend", default=backends.DEFAULT_BACKEND, choices=sorted(backends.BACKENDS),
+                        help="Backend tự động hoá Excel (com, cpp, fake = Excel giả lập, native = openpyxl)")
+    parser.add_argument("--output", "-o", default="-", help="Tệp kết quả JSONL ('-' = stdout)")
+    parser.add_argument("--per-sheet", action="store_true",
+                        help="Chạy macro một lần cho mỗi trang tính với tên trang (như RunVBA(sheetName))")
+    parser.add_argument("--export", default=None,
+                        help="Xuất bảng kết quả (tệp và từng trang) khi xong: tệp .csv hoặc .jsonl")
+    parser.add_argument("--ordering", default="history", choices=sorted(ordering.ORDERINGS),
+                        help="Thứ tự phát tệp")
+    parser.add_argument("--timeout", type=float, default=scheduler.FILE_TIMEOUT,
+                        help="Thời hạn (giây) cho mỗi tệp; 0 để tắt")
+    parser.add_argument("--force", action="store_true", help="Chạy lại cả các tệp không đổi")
+    parser.add_argument("--log-level", default="INFO", choices=[n for n in LOG_LEVELS if n != "NOTSET"],
+                        help="Mức log ghi ra stderr")
+    args = parser.parse_args(argv)
+    if args.workers != "auto":
+        if not args.workers.isdigit() or int(args.workers) < 1:
+            parser.error("--workers phải là số >= 1 hoặc 'auto'")
+        args.workers = int(args.workers)
+    if args.recipe is None:
+        reason = backends.BACKENDS[args.backend].check()
+        if reason:
+            parser.error(f"Backend {args.backend} không dùng được ở đây: {reason}")
+    return args
+
+
+def collect_files(paths, job, force):
+    """
+    Expands directories into their workbooks, skipping the ones unchanged since the last run.
+    Returns (files to process, skipped files, {directory: RunManifest}).
+    """
+    import run_manifest
+
+    files, skipped, manifests = [], [], {}
+    for path in paths:
+        if os.path.isdir(path):
+            manifest = manifests[path] = run_manifest.RunManifest.for_directory(path)
+            to_process, unchanged = manifest.split(run_manifest.scan_excel_files(path), job, force)
+            files.extend(to_process)
+            skipped.extend(unchanged)
+        else:
+            files.append(os.path.abspath(path))
+    return files, skipped, manifests
+
+
+def open_results(output):
+    """
+    Opens the JSONL result stream. For stdout, the original stdout is kept for the results and
+    file descriptor 1 is pointed at stderr, so prints and logs of this process and of the workers
+    (which inherit it) never mix with the results.
+    """
+    if output != "-":
+        return open(output, "w", encoding="utf-8", buffering=1)
+    sys.stdout.flush()
+    results = os.fdopen(os.dup(1), "w", encoding="utf-8", buffering=1)
+    os.dup2(2, 1)
+    return results
+
+
+def install_interrupt_handler(stop_event):
+    def on_interrupt(signum, frame):
+        if stop_event.is_set():
+            raise KeyboardInterrupt
+        print("Đang huỷ lượt chạy (Ctrl+C lần nữa để thoát ngay)...", file=sys.stderr)
+        stop_event.set()
+    signal.signal(signal.SIGINT, on_interrupt)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = open_results(args.output)
+    lock = threading.Lock()
+
+    def write_result(record):
+        with lock:
+            results.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    import scheduler
+    import run_manifest
+    from mpp_logger import get_mp_logger, LOG_LEVELS
+    from concurrency import AdaptiveConcurrency
+
+    mp_logging = get_mp_logger()
+    mp_logging.select_log_level(LOG_LEVELS[args.log_level])
+    logger = mp_logging.logger
+
+    stop_event = threading.Event()
+    install_interrupt_handler(stop_event)
+
+    job = run_manifest.job_key(args.bas, args.macro, args.recipe)
+    files, skipped, manifests = collect_files(args.paths, job, args.force)
+    for path in skipped:
+        write_result({"path": path, "status": "skipped", "duration": 0.0, "pid": None,
+                      "attempts": 0, "error": None})
+    logger.info(f"{len(files)} tệp cần xử lý, bỏ qua {len(skipped)} tệp không đổi")
+
+    concurrency = None
+    num_workers = args.workers
+    if num_workers == "auto":
+        concurrency = AdaptiveConcurrency(args.min_workers, args.max_workers)
+        num_workers = concurrency.max_workers
+
+    summary = None
+    if files:
+        summary = scheduler.run_files(files, num_workers, mp_logging, mp_logging.manager.Queue(),
+                                      ordering=args.ordering, file_timeout=args.timeout or None,
+                                      stop_event=stop_event, macro_file=args.bas, macro_name=args.macro,
+                                      backend=args.backend, on_file_done=write_result,
+                                      concurrency=concurrency, recipe=args.recipe, per_sheet=args.per_sheet)
+        for line in summary.format_lines():
+            logger.info(line)
+        dropped = mp_logging.format_dropped()
+        if dropped:
+            logger.warning(f"Kênh log đầy, đã bỏ bản ghi ({mp_logging.overflow}): {dropped}")
+        if args.export:
+            for path in summary.results.export(args.export):
+                logger.info(f"Đã xuất bảng kết quả: {path}")
+        for directory, manifest in manifests.items():
+            prefix = os.path.join(os.path.abspath(directory), "")
+            for path, outcome in summary.outcomes.items():
+                if outcome["status"] == "ok" and path.startswith(prefix):
+                    manifest.record(path, job)
+            manifest.save()
+
+    results.close()
+    mp_logging.shutdown()
+    if summary is None:
+        return 0
+    if summary.cancelled_run:
+        return 130
+    return 1 if summary.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+# concurrency.py
+"""
+Worker count of a run.
+
+default_worker_count() is the fixed guess used so far (CPU count minus 2), kept at 1 or more
+on small machines. Excel automation is often bound by disk I/O, COM round-trips or memory
+rather than by CPU, so the best count depends on the host and on the workbooks.
+
+AdaptiveConcurrency finds it while the run is going (hill climbing): the run starts with
+min_workers; after each measurement window the throughput (files per second) is compared with
+the best one seen so far, and one worker is added as long as it improves the throughput by at
+least min_gain. When it stops improving, the pool goes back to the best count and stays there.
+Workers are retired whenever the available system memory (MemAvailable in /proc/meminfo, not
+available on Windows) falls below min_available_memory.
+
+The measurements (workers, files/sec, available memory) are kept in curve and logged, so the
+limits can be tuned per host.
+"""
+import os
+import time
+import logging
+
+from mpp_logger import LoggingMultiProcess
+
+logger = logging.getLogger(LoggingMultiProcess.MAIN_LOGGER)
+
+# Số lõi CPU để dành cho hệ điều hành và giao diện.
+RESERVED_CPUS = 2
+# Độ dài tối thiểu (giây) của một lần đo thông lượng.
+MEASURE_WINDOW = 10.0
+# Mức cải thiện thông lượng tối thiểu (tỉ lệ) để giữ thêm một worker.
+MIN_GAIN = 0.05
+# Tỉ lệ bộ nhớ trống tối thiểu; dưới mức này thì bớt worker.
+MIN_AVAILABLE_MEMORY = 0.10
+MEMINFO_PATH = "/proc/meminfo"
+
+
+def default_worker_count(reserved=RESERVED_CPUS):
+    """
+    CPU count minus reserved, at least 1 (os.cpu_count() may be 1, or None when unknown).
+    """
+    return max((os.cpu_count() or 1) - reserved, 1)
+
+
+def available_memory_ratio(path=MEMINFO_PATH):
+    """
+    Returns MemAvailable / MemTotal read from /proc/meminfo, or None when it cannot be read.
+    """
+    values = {}
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in ("MemTotal", "MemAvailable"):
+                    values[name] = int(rest.split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    if not values.get("MemTotal") or "MemAvailable" not in values:
+        return None
+    return values["MemAvailable"] / values["MemTotal"]
+
+
+class AdaptiveConcurrency:
+    """
+    Hill-climbing controller of the number of workers of one run (see module docstring).
+    """
+    def __init__(self, min_workers=1, max_workers=None, window=MEASURE_WINDOW, min_gain=MIN_GAIN,
+                 min_available_memory=MIN_AVAILABLE_MEMORY):
+        self.max_workers = max(max_workers or default_worker_count(reserved=0), 1)
+        self.min_workers = min(max(min_workers, 1), self.max_workers)
+        self.window = window
+        self.min_gain = min_gain
+        self.min_available_memory = min_available_memory
+        self.workers = self.min_workers
+        self.best = None          # (số worker, tệp/giây) tốt nhất đã đo
+        self.settled = False
+        self.curve = []           # [(số worker, tệp/giây, tỉ lệ bộ nhớ trống hoặc None)]
+        self._window_start = None
+        self._window_completed = 0
+
+    def start(self, now=None, workers=None):
+        """
+        Starts measuring, from workers workers (clamped to min/max; by default the current count),
+        e.g. the size of a warm pool kept from the previous run. Returns the number of workers.
+        """
+        if workers is not None:
+            self.workers = min(max(workers, self.min_workers), self.max_workers)
+        self._window_start = time.time() if now is None else now
+        self._window_completed = 0
+        return self.workers
+
+    def update(self, now, completed, remaining):
+        """
+        Called periodically by the supervisor with the number of files completed so far and the
+        number of files not finished yet. Returns the number of workers to use from now on.
+        """
+        if self._window_start is None:
+            self.start(now)
+        elapsed = now - self._window_start
+        done = completed - self._window_completed
+        if elapsed < self.window or done < self.workers:
+            return self.workers
+        if remaining < 2 * self.workers:
+            # Cuối lượt chạy: không đủ tệp cho mọi worker, thông lượng đo được không còn ý nghĩa.
+            return self.workers
+        rate = done / elapsed
+        memory = available_memory_ratio()
+        self.curve.append((self.workers, rate, memory))
+        memory_text = f", bộ nhớ trống {memory:.0%}" if memory is not None else ""
+        logger.info(f"Đo thông lượng: {self.workers} worker -> {rate:.2f} tệp/giây{memory_text}")
+        self._window_start, self._window_completed = now, completed
+
+        if memory is not None and memory < self.min_available_memory and self.workers > self.min_workers:
+            self.workers -= 1
+            self.settled = True
+            logger.warning(f"Bộ nhớ trống thấp ({memory:.0%}), giảm còn {self.workers} worker")
+        elif not self.settled:
+            if self.best is None or rate > self.best[1] * (1 + self.min_gain):
+                self.best = (self.workers, rate)
+                if self.workers < self.max_workers:
+                    self.workers += 1
+                else:
+                    self.settled = True
+            else:
+                self.workers = self.best[0]
+                self.settled = True
+                logger.info(f"Thông lượng không tăng thêm, chọn {self.workers} worker "
+                            f"({self.best[1]:.2f} tệp/giây)")
+        return self.workers
+
+    def format_lines(self):
+        """
+        Returns the chosen concurrency and the throughput curve as report lines.
+        """
+        lines = [f"  Số worker tự điều chỉnh ({self.min_workers}-{self.max_workers}): chọn {self.workers}"]
+        for workers, rate, memory in self.curve:
+            memory_text = f", bộ nhớ trống {memory:.0%}" if memory is not None else ""
+            lines.append(f"    {workers} worker: {rate:.2f} tệp/giây{memory_text}")
+        return lines
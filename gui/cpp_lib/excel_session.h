@@ -0,0 +1,36 @@
+// excel_session.h
+// The Excel operations used by excel_vba.cpp, behind an interface so that the module can be built
+// with the real COM automation (excel_session_com.cpp, Windows with Microsoft Excel installed) or
+// with a stub (excel_session_stub.cpp) on any platform.
+//
+// A session is one Excel instance, started by create_excel_session() and quit when it is destroyed.
+// It holds at most one open workbook at a time. Every method reports a failure by throwing
+// std::runtime_error. None of them touches Python, so they are called without the GIL.
+
+#pragma once
+
+#include <memory>
+#include <string>
+#include <vector>
+
+class ExcelSession {
+public:
+    virtual ~ExcelSession() {}
+
+    // Opens the workbook at path.
+    virtual void open(const std::string &path) = 0;
+    // Imports the VBA module of a .bas file into the open workbook (via its VBProject).
+    virtual void import_module(const std::string &bas_file) = 0;
+    // Names of the worksheets of the open workbook, in order.
+    virtual std::vector<std::string> sheet_names() = 0;
+    // Runs macro with one string argument and returns its result converted to a string.
+    virtual std::string run(const std::string &macro, const std::string &argument) = 0;
+    // Removes the imported module, saves the workbook if save_changes and closes it.
+    virtual void close(bool save_changes) = 0;
+};
+
+// Starts a new Excel session.
+std::unique_ptr<ExcelSession> create_excel_session();
+
+// "com" or "stub": the implementation this module was built with.
+const char *excel_session_kind();
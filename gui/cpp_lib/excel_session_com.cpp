@@ -0,0 +1,153 @@
+// excel_session_com.cpp
+// ExcelSession implemented with COM automation of Microsoft Excel.
+// NOTE: This code must be compiled on Windows with Microsoft Excel installed.
+// Also, ensure "Trust access to the VBA project object model" is enabled in Excel.
+
+#include "excel_session.h"
+
+#include <cstdio>
+#include <stdexcept>
+#include <comdef.h>
+
+// The following #import directives import type libraries for Excel and the VBA Extensibility objects.
+// Adjust the paths if necessary depending on your Office version and installation path.
+#import "C:\\Program Files\\Microsoft Office\\root\\Office16\\EXCEL.EXE" \
+    rename("DialogBox", "ExcelDialogBox") \
+    rename("RGB", "ExcelRGB")
+#import "C:\\Program Files\\Common Files\\Microsoft Shared\\VBA\\VBA6\\VBE6EXT.olb" \
+    rename("EOF", "VBEOF")
+
+namespace {
+
+std::runtime_error com_failure(const _com_error &e) {
+    char code[16];
+    std::snprintf(code, sizeof code, "0x%08lX", static_cast<unsigned long>(e.Error()));
+    std::string message = std::string("COM error ") + code;
+    _bstr_t description = e.Description();
+    if (description.length() > 0) {
+        message += std::string(": ") + static_cast<const char *>(description);
+    }
+    return std::runtime_error(message);
+}
+
+class ComSession : public ExcelSession {
+public:
+    ComSession() {
+        // COM is initialized for the calling thread: the session must be used from the thread that created it.
+        HRESULT hr = CoInitialize(NULL);
+        if (FAILED(hr)) {
+            throw std::runtime_error("Failed to initialize COM library.");
+        }
+        hr = excel_.CreateInstance("Excel.Application");
+        if (FAILED(hr)) {
+            CoUninitialize();
+            throw std::runtime_error("Failed to create Excel application instance.");
+        }
+        try {
+            excel_->Visible = VARIANT_FALSE;
+        } catch (const _com_error &) {
+        }
+    }
+
+    ~ComSession() override {
+        try {
+            if (workbook_) {
+                workbook_->Close(VARIANT_FALSE);
+            }
+        } catch (const _com_error &) {
+        }
+        try {
+            excel_->Quit();
+        } catch (const _com_error &) {
+        }
+        // The smart pointers must be released before COM is uninitialized.
+        module_ = nullptr;
+        components_ = nullptr;
+        workbook_ = nullptr;
+        excel_ = nullptr;
+        CoUninitialize();
+    }
+
+    void open(const std::string &path) override {
+        try {
+            workbook_ = excel_->Workbooks->Open(_bstr_t(path.c_str()));
+        } catch (const _com_error &e) {
+            throw com_failure(e);
+        }
+    }
+
+    void import_module(const std::string &bas_file) override {
+        try {
+            // Programmatic access to the VBA project must be enabled.
+            VBE6::VBProjectPtr project = workbook_->VBProject;
+            components_ = project->VBComponents;
+            module_ = components_->Import(_bstr_t(bas_file.c_str()));
+        } catch (const _com_error &e) {
+            throw com_failure(e);
+        }
+    }
+
+    std::vector<std::string> sheet_names() override {
+        std::vector<std::string> names;
+        try {
+            Excel::SheetsPtr sheets = workbook_->Worksheets;
+            long count = 0;
+            sheets->get_Count(&count);
+            for (long i = 1; i <= count; i++) {
+                Excel::_WorksheetPtr sheet = sheets->Item[i];
+                names.push_back(static_cast<const char *>(sheet->Name));
+            }
+        } catch (const _com_error &e) {
+            throw com_failure(e);
+        }
+        return names;
+    }
+
+    std::string run(const std::string &macro, const std::string &argument) override {
+        try {
+            _variant_t result = excel_->Run(_bstr_t(macro.c_str()), _variant_t(argument.c_str()));
+            _bstr_t text(result);
+            return text.length() > 0 ? std::string(static_cast<const char *>(text)) : std::string();
+        } catch (const _com_error &e) {
+            throw com_failure(e);
+        }
+    }
+
+    void close(bool save_changes) override {
+        try {
+            if (module_) {
+                components_->Remove(module_);
+            }
+            module_ = nullptr;
+            components_ = nullptr;
+            if (workbook_) {
+                if (save_changes) {
+                    workbook_->Save();
+                }
+                workbook_->Close(VARIANT_FALSE);
+            }
+            workbook_ = nullptr;
+        } catch (const _com_error &e) {
+            module_ = nullptr;
+            components_ = nullptr;
+            workbook_ = nullptr;
+            throw com_failure(e);
+        }
+    }
+
+private:
+    Excel::_ApplicationPtr excel_;
+    Excel::_WorkbookPtr workbook_;
+    VBE6::VBComponentsPtr components_;
+    VBE6::VBComponentPtr module_;
+};
+
+}  // namespace
+
+std::unique_ptr<ExcelSession> create_excel_session() {
+    return std::unique_ptr<ExcelSession>(new ComSession());
+}
+
+const char *excel_session_kind() {
+    return "com";
+}
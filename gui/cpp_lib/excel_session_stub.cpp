@@ -0,0 +1,107 @@
+// excel_session_stub.cpp
+// ExcelSession without Excel, used where COM is not available (Linux) or when the module is built
+// with -DEXCEL_VBA_STUB=ON, to build and exercise excel_vba anywhere. Workbooks are only checked
+// for existence and never modified. The behaviour is set through environment variables:
+//   EXCEL_VBA_STUB_SHEETS    comma-separated worksheet names of every workbook (default "Sheet1")
+//   EXCEL_VBA_STUB_DELAY_MS  time taken by every macro call, in milliseconds (default 0)
+//   EXCEL_VBA_STUB_FAIL      the macro fails on the last worksheet of the workbooks whose path
+//                            contains this string
+// A macro call returns "<macro>(<argument>)".
+
+#include "excel_session.h"
+
+#include <chrono>
+#include <cstdlib>
+#include <fstream>
+#include <stdexcept>
+#include <thread>
+
+namespace {
+
+std::string environment(const char *name, const char *fallback) {
+    const char *value = std::getenv(name);
+    return value != nullptr ? std::string(value) : std::string(fallback);
+}
+
+std::vector<std::string> split(const std::string &text, char separator) {
+    std::vector<std::string> parts;
+    std::string::size_type start = 0;
+    while (true) {
+        std::string::size_type end = text.find(separator, start);
+        std::string part = text.substr(start, end == std::string::npos ? std::string::npos : end - start);
+        if (!part.empty()) {
+            parts.push_back(part);
+        }
+        if (end == std::string::npos) {
+            return parts;
+        }
+        start = end + 1;
+    }
+}
+
+class StubSession : public ExcelSession {
+public:
+    StubSession()
+        : sheets_(split(environment("EXCEL_VBA_STUB_SHEETS", "Sheet1"), ',')),
+          delay_ms_(std::atoi(environment("EXCEL_VBA_STUB_DELAY_MS", "0").c_str())),
+          fail_(environment("EXCEL_VBA_STUB_FAIL", "")) {}
+
+    void open(const std::string &path) override {
+        if (!path_.empty()) {
+            throw std::runtime_error("A workbook is already open: " + path_);
+        }
+        if (!std::ifstream(path)) {
+            throw std::runtime_error("Cannot open workbook: " + path);
+        }
+        path_ = path;
+    }
+
+    void import_module(const std::string &bas_file) override {
+        require_open();
+        if (!std::ifstream(bas_file)) {
+            throw std::runtime_error("Cannot import VBA module: " + bas_file);
+        }
+    }
+
+    std::vector<std::string> sheet_names() override {
+        require_open();
+        return sheets_;
+    }
+
+    std::string run(const std::string &macro, const std::string &argument) override {
+        require_open();
+        if (delay_ms_ > 0) {
+            std::this_thread::sleep_for(std::chrono::milliseconds(delay_ms_));
+        }
+        if (!fail_.empty() && path_.find(fail_) != std::string::npos && !sheets_.empty() && argument == sheets_.back()) {
+            throw std::runtime_error("Macro '" + macro + "' failed on " + argument + " (stub)");
+        }
+        return macro + "(" + argument + ")";
+    }
+
+    void close(bool) override {
+        path_.clear();
+    }
+
+private:
+    void require_open() const {
+        if (path_.empty()) {
+            throw std::runtime_error("No workbook is open.");
+        }
+    }
+
+    std::vector<std::string> sheets_;
+    int delay_ms_;
+    std::string fail_;
+    std::string path_;
+};
+
+}  // namespace
+
+std::unique_ptr<ExcelSession> create_excel_session() {
+    return std::unique_ptr<ExcelSession>(new StubSession());
+}
+
+const char *excel_session_kind() {
+    return "stub";
+}
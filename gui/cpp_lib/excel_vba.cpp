@@ -1,105 +1,259 @@
 // excel_vba.cpp
-// NOTE: This code uses COM automation. It must be compiled on Windows with Microsoft Excel installed.
-// Also, ensure "Trust access to the VBA project object model" is enabled in Excel.
+// Python module running a VBA macro on every worksheet of Excel workbooks.
+// The Excel side is an ExcelSession (excel_session.h): COM automation on Windows, a stub elsewhere.
+//
+// The COM work runs without the GIL, so other Python threads (progress, logging, a GUI) keep
+// running. Each worksheet produces a SheetResult delivered to an optional Python callback as soon
+// as it is known, and a cancellation flag is checked before every worksheet. A workbook that fails
+// is reported as a SheetResult carrying the error; the results of the other workbooks are kept.
 
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
+#include <atomic>
+#include <memory>
 #include <vector>
 #include <string>
 #include <stdexcept>
-#include <comdef.h>
+
+#include "excel_session.h"
 
 namespace py = pybind11;
 
-// The following #import directives import type libraries for Excel and the VBA Extensibility objects.
-// Adjust the paths if necessary depending on your Office version and installation path.
-#import "C:\\Program Files\\Microsoft Office\\root\\Office16\\EXCEL.EXE" \
-    rename("DialogBox", "ExcelDialogBox") \
-    rename("RGB", "ExcelRGB")
-#import "C:\\Program Files\\Common Files\\Microsoft Shared\\VBA\\VBA6\\VBE6EXT.olb" \
-    rename("EOF", "VBEOF")
+// Outcome of the macro on one worksheet; error is empty when it succeeded. A workbook that fails
+// before its worksheets are run (open, import) gives one record with an empty sheet.
+struct SheetResult {
+    std::string path;
+    std::string sheet;
+    std::string result;
+    std::string error;
+};
 
-// run_vba_on_all_files:
-//    vba_script_file : Path to a .bas file containing VBA code.
-//    excel_file_list : A list of Excel file paths.
-// For each Excel file, the function:
-//   - Opens the workbook.
-//   - Imports the VBA module from the .bas file into the workbook (via its VBProject).
-//   - Iterates over every worksheet and calls the VBA macro "RunVBA" with the worksheet name as argument.
-//   - Collects the returned string from the macro.
-std::vector<std::string> run_vba_on_all_files(const std::string &vba_script_file, const std::vector<std::string> &excel_file_list) {
-    std::vector<std::string> results;
-
-    // Initialize COM library
-    HRESULT hr = CoInitialize(NULL);
-    if (FAILED(hr)) {
-        throw std::runtime_error("Failed to initialize COM library.");
+// Cancellation flag that can be set from any thread without waiting for the running call.
+class CancelToken {
+public:
+    void cancel() { flag_ = true; }
+    bool cancelled() const { return flag_; }
+
+private:
+    std::atomic<bool> flag_{false};
+};
+
+// Raised by Session.run_file when it is cancelled before the workbook is finished.
+class Cancelled : public std::runtime_error {
+public:
+    explicit Cancelled(const std::string &message) : std::runtime_error(message) {}
+};
+
+// The Python callback and cancellation flag of one call. Created and destroyed with the GIL held;
+// cancelled() and deliver() are called without it and take it only when Python has to be called.
+// An exception raised by Python stops the call and is re-raised once the GIL is back.
+class Hooks {
+public:
+    Hooks(py::object callback, py::object cancel) : callback_(callback), cancel_(cancel), token_(nullptr), failed_(false) {
+        if (!cancel_.is_none() && py::isinstance<CancelToken>(cancel_)) {
+            token_ = cancel_.cast<CancelToken *>();
+        }
     }
 
-    try {
-        // Create an instance of Excel
-        Excel::_ApplicationPtr pXL;
-        hr = pXL.CreateInstance("Excel.Application");
-        if (FAILED(hr)) {
-            throw std::runtime_error("Failed to create Excel application instance.");
+    bool cancelled() {
+        if (failed_) {
+            return true;
+        }
+        if (token_ != nullptr) {
+            return token_->cancelled();
         }
+        if (cancel_.is_none()) {
+            return false;
+        }
+        // Any object with is_set(): threading.Event, multiprocessing.Event, a Manager Event proxy.
+        py::gil_scoped_acquire gil;
+        try {
+            return cancel_.attr("is_set")().cast<bool>();
+        } catch (py::error_already_set &e) {
+            fail(e);
+            return true;
+        }
+    }
 
-        // (Optional) Make Excel visible for debugging purposes.
-        pXL->Visible = VARIANT_TRUE;
-
-        // Loop over the provided Excel file list
-        for (const auto &excelFile : excel_file_list) {
-            // Open the workbook
-            Excel::_WorkbookPtr pWB = pXL->Workbooks->Open(_bstr_t(excelFile.c_str()));
-
-            // Import the VBA module from the specified .bas file.
-            // Note: For this to work, programmatic access to the VBA project must be enabled.
-            VBE6::VBProjectPtr pVBProj = pWB->VBProject;
-            VBE6::VBComponentsPtr pVBComps = pVBProj->VBComponents;
-            VBE6::VBComponentPtr pModule = pVBComps->Import(_bstr_t(vba_script_file.c_str()));
-
-            // Get the collection of worksheets in the workbook.
-            Excel::SheetsPtr pSheets = pWB->Worksheets;
-            long sheetCount = 0;
-            pSheets->get_Count(&sheetCount);
-
-            // Process each worksheet. Here we assume that the imported .bas file
-            // defines a function "RunVBA" that accepts a worksheet name (or other parameter)
-            // and returns a value convertible to a string.
-            for (long i = 1; i <= sheetCount; i++) {
-                Excel::_WorksheetPtr pSheet = pSheets->Item[i];
-                _variant_t vtSheetName = _variant_t(pSheet->Name);
-                _variant_t vtResult = pXL->Run(_bstr_t("RunVBA"), vtSheetName);
-
-                // Convert the result to a string and store it.
-                _bstr_t bstrResult(vtResult);
-                results.push_back(std::string((const char*)bstrResult));
-            }
+    void deliver(const SheetResult &record) {
+        if (callback_.is_none() || failed_) {
+            return;
+        }
+        py::gil_scoped_acquire gil;
+        try {
+            callback_(record);
+        } catch (py::error_already_set &e) {
+            fail(e);
+        }
+    }
 
-            // Optionally remove the imported module from the VBComponents.
-            if (pModule) {
-                pVBComps->Remove(pModule);
-            }
-            // Close the workbook without saving changes.
-            pWB->Close(VARIANT_FALSE);
+    // Called with the GIL held, after the COM work.
+    void raise_if_failed() {
+        if (failed_) {
+            throw py::error_already_set();
         }
+    }
 
-        // Quit Excel.
-        pXL->Quit();
-    } catch (const _com_error &e) {
-        CoUninitialize();
-        throw std::runtime_error(std::string("COM error: ") + (const char*)e.ErrorMessage());
+private:
+    void fail(py::error_already_set &e) {
+        e.restore();
+        failed_ = true;
     }
 
-    // Uninitialize COM library.
-    CoUninitialize();
+    py::object callback_;
+    py::object cancel_;
+    CancelToken *token_;
+    bool failed_;
+};
+
+enum class Outcome { done, cancelled, failed };
+
+// Runs macro on every worksheet of the workbook at path, appending one record per worksheet to
+// results (or one error record). Called without the GIL. The workbook is saved only when every
+// worksheet succeeded and save_changes is set.
+Outcome process_workbook(ExcelSession &session, const std::string &vba_script_file, const std::string &path,
+                         const std::string &macro_name, bool save_changes, Hooks &hooks,
+                         std::vector<SheetResult> &results) {
+    std::string sheet;
+    bool opened = false;
+    try {
+        session.open(path);
+        opened = true;
+        session.import_module(vba_script_file);
+        for (const auto &name : session.sheet_names()) {
+            if (hooks.cancelled()) {
+                opened = false;
+                session.close(false);
+                return Outcome::cancelled;
+            }
+            sheet = name;
+            results.push_back(SheetResult{path, sheet, session.run(macro_name, sheet), std::string()});
+            hooks.deliver(results.back());
+        }
+        sheet.clear();
+        opened = false;
+        session.close(save_changes);
+        return Outcome::done;
+    } catch (const std::exception &e) {
+        if (opened) {
+            try {
+                session.close(false);
+            } catch (const std::exception &) {
+            }
+        }
+        results.push_back(SheetResult{path, sheet, std::string(), e.what()});
+        hooks.deliver(results.back());
+        return Outcome::failed;
+    }
+}
+
+// run_vba_on_all_files:
+//    vba_script_file : Path to a .bas file containing VBA code.
+//    excel_file_list : A list of Excel file paths.
+//    macro_name      : Macro called with the name of every worksheet (default "RunVBA").
+//    callback        : Called with each SheetResult as soon as it is known (optional).
+//    cancel          : CancelToken, or any object with is_set(); checked before every worksheet.
+//    save_changes    : Save each workbook whose worksheets all succeeded.
+// One Excel instance is started for the whole list. Returns the SheetResult of every worksheet
+// processed; after a cancellation, the results up to that point.
+std::vector<SheetResult> run_vba_on_all_files(const std::string &vba_script_file,
+                                              const std::vector<std::string> &excel_file_list,
+                                              const std::string &macro_name, py::object callback,
+                                              py::object cancel, bool save_changes) {
+    std::vector<SheetResult> results;
+    Hooks hooks(callback, cancel);
+    {
+        py::gil_scoped_release release;
+        std::unique_ptr<ExcelSession> session = create_excel_session();
+        for (const auto &path : excel_file_list) {
+            if (hooks.cancelled() ||
+                process_workbook(*session, vba_script_file, path, macro_name, save_changes, hooks, results)
+                    == Outcome::cancelled) {
+                break;
+            }
+        }
+    }
+    hooks.raise_if_failed();
     return results;
 }
 
-// Expose the function as a pybind11 module.
+// An Excel instance kept open across calls, e.g. for the lifetime of a worker process.
+// It must be used from the thread that created it.
+class Session {
+public:
+    Session() {
+        py::gil_scoped_release release;
+        session_ = create_excel_session();
+    }
+
+    // Runs macro_name on every worksheet of one workbook. Returns its SheetResults; raises
+    // RuntimeError when the workbook fails and Cancelled when it is cancelled before the end
+    // (the workbook is then closed without saving; results already delivered to callback stand).
+    std::vector<SheetResult> run_file(const std::string &vba_script_file, const std::string &path,
+                                      const std::string &macro_name, py::object callback, py::object cancel,
+                                      bool save_changes) {
+        if (!session_) {
+            throw std::runtime_error("The Excel session has been quit.");
+        }
+        std::vector<SheetResult> results;
+        Hooks hooks(callback, cancel);
+        Outcome outcome;
+        {
+            py::gil_scoped_release release;
+            outcome = process_workbook(*session_, vba_script_file, path, macro_name, save_changes, hooks, results);
+        }
+        hooks.raise_if_failed();
+        if (outcome == Outcome::failed) {
+            const SheetResult &failure = results.back();
+            throw std::runtime_error(failure.sheet.empty() ? failure.error : failure.sheet + ": " + failure.error);
+        }
+        if (outcome == Outcome::cancelled) {
+            throw Cancelled("Cancelled: " + path);
+        }
+        return results;
+    }
+
+    // Quits Excel.
+    void quit() {
+        py::gil_scoped_release release;
+        session_.reset();
+    }
+
+private:
+    std::unique_ptr<ExcelSession> session_;
+};
+
+// Expose the module with pybind11.
 PYBIND11_MODULE(excel_vba, m) {
     m.doc() = "Module to run a VBA script on Excel files via COM automation";
+    m.attr("IMPLEMENTATION") = excel_session_kind();
+
+    py::register_exception<Cancelled>(m, "Cancelled");
+
+    py::class_<SheetResult>(m, "SheetResult")
+        .def_readonly("path", &SheetResult::path)
+        .def_readonly("sheet", &SheetResult::sheet)
+        .def_readonly("result", &SheetResult::result)
+        .def_readonly("error", &SheetResult::error)
+        .def_property_readonly("ok", [](const SheetResult &r) { return r.error.empty(); })
+        .def("__repr__", [](const SheetResult &r) {
+            return "<SheetResult " + r.path + " [" + r.sheet + "] " + (r.error.empty() ? r.result : "error: " + r.error) + ">";
+        });
+
+    py::class_<CancelToken>(m, "CancelToken")
+        .def(py::init<>())
+        .def("cancel", &CancelToken::cancel, "Stop the running call before its next worksheet")
+        .def_property_readonly("cancelled", &CancelToken::cancelled);
+
+    py::class_<Session>(m, "Session")
+        .def(py::init<>())
+        .def("run_file", &Session::run_file, "Run a macro on every worksheet of one Excel file",
+             py::arg("vba_script_file"), py::arg("excel_file"), py::arg("macro_name") = "RunVBA",
+             py::arg("callback") = py::none(), py::arg("cancel") = py::none(), py::arg("save_changes") = false)
+        .def("quit", &Session::quit, "Quit Excel");
+
     m.def("run_vba_on_all_files", &run_vba_on_all_files,
           "Execute a .bas VBA script on all worksheets in provided Excel files",
-          py::arg("vba_script_file"), py::arg("excel_file_list"));
+          py::arg("vba_script_file"), py::arg("excel_file_list"), py::arg("macro_name") = "RunVBA",
+          py::arg("callback") = py::none(), py::arg("cancel") = py::none(), py::arg("save_changes") = false);
 }
@@ -0,0 +1,292 @@
+# File: fake_excel.py
+# Excel giả lập với giao diện COM của win32com.client, dùng cho backend "fake" (backends.py)
+# để test ứng dụng khi không có Excel.
+#
+# Giả lập macro bị treo (hộp thoại modal, vòng lặp vô tận...): đặt biến môi trường
+# FAKE_EXCEL_HANG thành một chuỗi con của đường dẫn tệp, ví dụ FAKE_EXCEL_HANG=0004;
+# khi đó Run() trên workbook tương ứng sẽ không bao giờ trả về.
+#
+# Độ trễ và tỉ lệ lỗi được cấu hình bằng biến môi trường FAKE_EXCEL_PROFILE: một chuỗi JSON
+# hoặc đường dẫn tới tệp JSON, ví dụ
+#     {"latency": {"run": {"dist": "lognormal", "mean": 0.5, "sigma": 0.4}, "save": 0.1},
+#      "failure_rate": 0.02, "seed": 1, "quiet": true}
+# - latency: độ trễ (giây) của từng thao tác trong OPERATIONS; một số cố định, hoặc một phân phối
+#   {"dist": "uniform", "low", "high"}, {"dist": "normal", "mean", "stddev"},
+#   {"dist": "lognormal", "mean", "sigma"} (mean là trung vị), {"dist": "exponential", "mean"}.
+#   Thao tác không khai báo giữ độ trễ mặc định (DEFAULT_LATENCY).
+# - failure_rate: xác suất Run() báo lỗi.
+# - seed: hạt giống ngẫu nhiên (cộng với pid để mỗi worker có chuỗi riêng).
+# - quiet: không in ra các dòng "Fake ...".
+# Các tiến trình worker thừa hưởng biến môi trường này từ tiến trình cha.
+#
+# Mỗi workbook giả có các trang tính lưu ô trong bộ nhớ (Worksheets, Cells, Range, UsedRange,
+# Range.Value đọc / ghi một ô hoặc một khối 2 chiều như Excel), để thử các thao tác đọc / ghi
+# hàng loạt (bulk_range.py). Ngày tháng đọc ra có múi giờ như pywintypes. Số lượt gọi Range.Value
+# được đếm trong FakeProfile.calls.
+#
+# Run(macro, đối số...) trả về chuỗi "macro(đối số...)" và đánh dấu workbook đang mở là đã sửa
+# (Saved = False, như Workbook.Saved của Excel), để thử kênh kết quả (result_table.py).
+import os
+import re
+import json
+import time
+import random
+import datetime
+
+OPERATIONS = ("dispatch", "open", "import", "run", "save", "close", "quit", "range")
+# Độ trễ mặc định (giây) của từng thao tác; "range" là mỗi lần đọc / ghi Range.Value (một lượt gọi COM).
+DEFAULT_LATENCY = {"dispatch": 1.0, "open": 0.0, "import": 1.0, "run": 1.0, "save": 1.0, "close": 1.0, "quit": 1.0,
+                   "range": 0.0}
+
+
+class FakeProfile:
+    """
+    Latency distributions and failure rate of the fake Excel, read from FAKE_EXCEL_PROFILE.
+    """
+    def __init__(self, config=None):
+        config = config or {}
+        self.latency = dict(DEFAULT_LATENCY)
+        self.latency.update(config.get("latency", {}))
+        self.failure_rate = float(config.get("failure_rate", 0.0))
+        self.quiet = bool(config.get("quiet", False))
+        seed = config.get("seed")
+        self.rng = random.Random(None if seed is None else seed + os.getpid())
+        self.calls = {}
+
+    @classmethod
+    def from_env(cls):
+        value = os.environ.get("FAKE_EXCEL_PROFILE")
+        if not value:
+            return cls()
+        if os.path.isfile(value):
+            with open(value, "r", encoding="utf-8") as f:
+                return cls(json.load(f))
+        return cls(json.loads(value))
+
+    def sample(self, operation):
+        spec = self.latency.get(operation, 0.0)
+        if isinstance(spec, (int, float)):
+            return float(spec)
+        dist = spec.get("dist", "fixed")
+        if dist == "uniform":
+            value = self.rng.uniform(spec["low"], spec["high"])
+        elif dist == "normal":
+            value = self.rng.gauss(spec["mean"], spec["stddev"])
+        elif dist == "lognormal":
+            value = spec["mean"] * self.rng.lognormvariate(0.0, spec["sigma"])
+        elif dist == "exponential":
+            value = self.rng.expovariate(1.0 / spec["mean"]) if spec["mean"] > 0 else 0.0
+        else:
+            value = spec.get("value", 0.0)
+        return max(value, 0.0)
+
+    def delay(self, operation):
+        self.calls[operation] = self.calls.get(operation, 0) + 1
+        seconds = self.sample(operation)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def log(self, message):
+        if not self.quiet:
+            print(message)
+
+
+_profile = None
+_profile_pid = None
+
+def profile():
+    # Đọc lại cấu hình trong mỗi tiến trình (worker fork từ tiến trình cha có chuỗi ngẫu nhiên riêng).
+    global _profile, _profile_pid
+    if _profile is None or _profile_pid != os.getpid():
+        _profile = FakeProfile.from_env()
+        _profile_pid = os.getpid()
+    return _profile
+
+
+def _column_number(letters):
+    number = 0
+    for ch in letters.upper():
+        number = number * 26 + ord(ch) - 64
+    return number
+
+
+class FakeCount:
+    def __init__(self, count):
+        self.Count = count
+
+
+class FakeRange:
+    """
+    Block of cells of a FakeWorksheet; every access to Value counts as one COM call ("range").
+    """
+    def __init__(self, sheet, row1, col1, row2=None, col2=None):
+        row2, col2 = row1 if row2 is None else row2, col1 if col2 is None else col2
+        self.sheet = sheet
+        self.Row, self.Column = min(row1, row2), min(col1, col2)
+        self.last_row, self.last_col = max(row1, row2), max(col1, col2)
+        self.Rows = FakeCount(self.last_row - self.Row + 1)
+        self.Columns = FakeCount(self.last_col - self.Column + 1)
+        self.Count = self.Rows.Count * self.Columns.Count
+
+    def Cells(self, row, column):
+        return FakeRange(self.sheet, self.Row + row - 1, self.Column + column - 1)
+
+    @staticmethod
+    def _out(value):
+        # pywin32 trả ngày tháng dạng pywintypes.datetime có múi giờ UTC
+        if isinstance(value, datetime.datetime) and value.tzinfo is None:
+            return value.replace(tzinfo=datetime.timezone.utc)
+        return value
+
+    @property
+    def Value(self):
+        profile().delay("range")
+        cells = self.sheet.cells
+        if self.Count == 1:
+            return self._out(cells.get((self.Row, self.Column)))
+        return tuple(tuple(self._out(cells.get((r, c))) for c in range(self.Column, self.last_col + 1))
+                     for r in range(self.Row, self.last_row + 1))
+
+    @Value.setter
+    def Value(self, value):
+        profile().delay("range")
+        if isinstance(value, (tuple, list)):
+            rows = [row if isinstance(row, (tuple, list)) else (row,) for row in value]
+        else:
+            rows = [[value] * self.Columns.Count] * self.Rows.Count
+        for i in range(self.Rows.Count):
+            for j in range(self.Columns.Count):
+                # Như Excel: mảng nhỏ hơn vùng ô cho #N/A ở phần thừa.
+                item = rows[i][j] if i < len(rows) and j < len(rows[i]) else "#N/A"
+                self.sheet.set(self.Row + i, self.Column + j, item)
+
+
+class FakeWorksheet:
+    def __init__(self, name):
+        self.Name = name
+        self.cells = {}
+
+    def set(self, row, column, value):
+        if value is None or value == "":
+            self.cells.pop((row, column), None)
+        else:
+            self.cells[(row, column)] = value
+
+    def Cells(self, row, column):
+        return FakeRange(self, row, column)
+
+    def Range(self, cell1, cell2=None):
+        if cell2 is not None:
+            return FakeRange(self, cell1.Row, cell1.Column, cell2.last_row, cell2.last_col)
+        m = re.fullmatch(r"\$?([A-Za-z]+)\$?(\d+)(?::\$?([A-Za-z]+)\$?(\d+))?", cell1)
+        first_col, first_row = _column_number(m.group(1)), int(m.group(2))
+        if m.group(3):
+            return FakeRange(self, first_row, first_col, int(m.group(4)), _column_number(m.group(3)))
+        return FakeRange(self, first_row, first_col)
+
+    @property
+    def UsedRange(self):
+        if not self.cells:
+            return FakeRange(self, 1, 1)
+        rows = [r for r, _ in self.cells]
+        cols = [c for _, c in self.cells]
+        return FakeRange(self, min(rows), min(cols), max(rows), max(cols))
+
+
+class FakeWorksheets:
+    def __init__(self):
+        self.items = [FakeWorksheet("Sheet1")]
+
+    def __call__(self, key):
+        if isinstance(key, str):
+            for sheet in self.items:
+                if sheet.Name.lower() == key.lower():
+                    return sheet
+            raise KeyError(key)
+        return self.items[key - 1]
+
+    def __iter__(self):
+        return iter(self.items)
+
+    @property
+    def Count(self):
+        return len(self.items)
+
+    def Add(self, name=None):
+        sheet = FakeWorksheet(name or f"Sheet{len(self.items) + 1}")
+        self.items.append(sheet)
+        return sheet
+
+
+class FakeVBComponents:
+    def Import(self, macro_file):
+        profile().log(f"Fake VBComponents: Nhập macro từ '{macro_file}'")
+        profile().delay("import")
+
+class FakeVBProject:
+    def __init__(self):
+        self.VBComponents = FakeVBComponents()
+
+class FakeWorkbook:
+    def __init__(self, path):
+        self.path = path
+        self.VBProject = FakeVBProject()
+        self.Worksheets = self.Sheets = FakeWorksheets()
+        self.Saved = True   # False sau khi macro chạy (coi như macro đã sửa workbook)
+
+    @property
+    def ActiveSheet(self):
+        return self.Worksheets(1)
+
+    def Save(self):
+        profile().log(f"Fake Workbook: Lưu tệp '{self.path}'")
+        profile().delay("save")
+        self.Saved = True
+
+    def Close(self, SaveChanges=None):
+        profile().log(f"Fake Workbook: Đóng tệp '{self.path}'")
+        profile().delay("close")
+
+class FakeWorkbooks:
+    def __init__(self):
+        self.active = None  # Workbook mở gần nhất (macro sẽ chạy trên workbook này)
+
+    def Open(self, path):
+        profile().log(f"Fake Workbooks: Mở tệp '{path}'")
+        profile().delay("open")
+        self.active = FakeWorkbook(path)
+        return self.active
+
+class FakeExcel:
+    def __init__(self):
+        self.Visible = False
+        self.Application = self  # Giả lập thuộc tính Application
+        self.Workbooks = FakeWorkbooks()
+
+    def Run(self, macro_name, *args):
+        profile().log(f"Fake Excel: Chạy macro '{macro_name}'")
+        profile().delay("run")
+        hang_pattern = os.environ.get("FAKE_EXCEL_HANG")
+        active = self.Workbooks.active
+        if hang_pattern and active is not None and hang_pattern in active.path:
+            print(f"Fake Excel: Macro '{macro_name}' bị treo trên '{active.path}'")
+            while True:
+                time.sleep(1)
+        if profile().failure_rate and profile().rng.random() < profile().failure_rate:
+            raise RuntimeError(f"Fake Excel: macro '{macro_name}' lỗi (giả lập)")
+        if active is not None:
+            active.Saved = False
+        return f"{macro_name}({', '.join(str(arg) for arg in args)})"
+
+    def Quit(self):
+        profile().log("Fake Excel: Thoát Excel")
+        profile().delay("quit")
+
+class FakeCache:
+    def EnsureDispatch(self, prog_id):
+        profile().log(f"Fake win32com: EnsureDispatch('{prog_id}') được gọi")
+        profile().delay("dispatch")
+        return FakeExcel()
+
+# Tạo đối tượng gencache để mô phỏng việc gọi win32com.client.gencache.EnsureDispatch()
+gencache = FakeCache()
@@ -2,10 +2,11 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import logging
 import glob, os, threading
-from multiprocessing import Pool
-import worker
-from worker import worker_logging_setup
-from mpp_logger import get_mp_logger, LOG_LEVELS, TextHandler, DynamicLevelFilter, PrettyFormatter
+from pool_service import PoolService
+from concurrency import default_worker_count
+from gv import Gvar as gv
+from mpp_logger import get_mp_logger, LOG_LEVELS
+from logfile import is_json_export
 from logtext import LogText  # Lớp LogText do bạn định nghĩa, dùng để hiển thị log trong giao diện
 
 # Khai báo biến toàn cục logger, sẽ được gán trong MainWindow
@@ -39,6 +40,8 @@ class MainWindow(tk.Tk):
         self.vba_file = None
         self.excel_directory = None
         self.stop_event = threading.Event()
+        # Nhóm worker dùng chung cho mọi lượt chạy, khởi động ở lượt chạy đầu tiên.
+        self.pool_service = PoolService(self.mp_logging, gv.excel_backend)
 
         # ----------------------
         # Khu vực thanh công cụ (Taskbar) bên trái
@@ -87,20 +90,11 @@ class MainWindow(tk.Tk):
 
         self.after_id_progress = self.after(500, self.update_progress)
 
-        # Gắn TextHandler cho giao diện (GUI) vào QueueListener của hệ thống logging
+        # Vùng log (LogText) đọc trực tiếp từ kho log mà QueueListener ghi vào; hiển thị theo mức log
+        # được chọn và cờ is_exact
         if self.mp_logging.listener is not None:
-            # Tạo một instance của TextHandler để ghi log vào vùng Text của giao diện
-            gui_handler = TextHandler(self.log_container.log_text)
-            from mpp_logger import PrettyFormatter  # Sử dụng định nghĩa PrettyFormatter từ mpp_logger
-            gui_formatter = PrettyFormatter(datefmt="%Y-%m-%dT%H:%M:%S%z")
-            gui_handler.setFormatter(gui_formatter)
-            # Tạo bộ lọc động sử dụng mức log được chọn và cờ is_exact
             current_level = LOG_LEVELS.get(self.log_level_var.get(), logging.INFO)
-            gui_handler.addFilter(DynamicLevelFilter(current_level, self.is_exact_var.get()))
-            # Lưu lại tham chiếu của gui_handler để dễ dàng cập nhật bộ lọc sau này
-            self.gui_handler = gui_handler
-            # Gắn gui_handler vào danh sách các handler của QueueListener (chỉ một lần)
-            self.mp_logging.listener.handlers = self.mp_logging.listener.handlers + (gui_handler,)
+            self.log_container.show_levels(current_level, self.is_exact_var.get())
         else:
             print("Cảnh báo: Không có listener hoạt động.")
 
@@ -134,10 +128,8 @@ class MainWindow(tk.Tk):
         """
         current_level = LOG_LEVELS.get(self.log_level_var.get(), logging.INFO)
         is_exact = self.is_exact_var.get()
-        # Loại bỏ các filter cũ đã được gắn vào GUI handler.
-        self.gui_handler.filters = [f for f in self.gui_handler.filters if not isinstance(f, DynamicLevelFilter)]
-        # Thêm filter mới với các giá trị cập nhật.
-        self.gui_handler.addFilter(DynamicLevelFilter(current_level, is_exact))
+        # Chỉ vẽ lại phần log đang xem từ kho log.
+        self.log_container.show_levels(current_level, is_exact)
 
     def select_log_level(self, selected):
         """
@@ -152,23 +144,25 @@ class MainWindow(tk.Tk):
     def save_log(self):
         """
         Mở hộp thoại lưu file với hai định dạng: JSON và TXT.
-        Nếu người dùng chọn JSON, file log tạm (đã ghi log dưới định dạng JSON)
-        sẽ được copy sang file được chọn.
-        Nếu người dùng chọn TXT, nội dung hiển thị trong log_text sẽ được lưu.
+        Nếu người dùng chọn JSON (.json, .jsonl, có thể thêm .gz), các đoạn file log JSONL
+        của phiên sẽ được xuất sang file được chọn.
+        Nếu người dùng chọn TXT, các bản ghi theo bộ lọc hiện tại được lưu (đọc từ kho log).
         """
-        import shutil
         path = filedialog.asksaveasfilename(
             title="Lưu Log vào tập tin",
             defaultextension=".txt",
-            filetypes=[("Tệp văn bản (*.txt)", "*.txt"), ("Tệp JSON (*.json)", "*.json")]
+            filetypes=[("Tệp văn bản (*.txt)", "*.txt"), ("Tệp JSON (*.json)", "*.json"),
+                       ("Tệp JSON Lines (*.jsonl)", "*.jsonl")]
         )
         if path:
             try:
-                if path.lower().endswith(".json"):
-                    shutil.copyfile(self.mp_logging.log_temp_file_path, path)
+                if is_json_export(path):
+                    self.mp_logging.export_log(path)
                 else:
+                    current_level = LOG_LEVELS.get(self.log_level_var.get(), logging.INFO)
                     with open(path, "w", encoding="utf-8") as f:
-                        f.write(self.log_container.log_text.get("1.0", tk.END))
+                        for text in self.mp_logging.log_store.texts(current_level, self.is_exact_var.get()):
+                            f.write(text + "\n")
                 messagebox.showinfo("Thông báo", "Log đã được lưu thành công.")
                 logger.info("Log đã được lưu thành công")
             except Exception as e:
@@ -242,7 +236,7 @@ class MainWindow(tk.Tk):
         Thực hiện xử lý:
           - Đọc thông tin từ giao diện.
           - Tìm các tệp Excel trong thư mục đã chọn.
-          - Phân lô các tệp Excel và khởi chạy các tiến trình xử lý.
+          - Đưa các tệp Excel vào hàng đợi chung của nhóm worker dùng chung (PoolService.run -> scheduler.run_files).
           - Cập nhật tiến trình và ghi log các bước thực hiện.
         """
         logger.info("Bắt đầu chạy VBA trên các tệp Excel.")
@@ -265,35 +259,21 @@ class MainWindow(tk.Tk):
         self.progress_bar["maximum"] = self.total_files
         self.progress_bar["value"] = 0
 
-        num_processes = os.cpu_count() - 2 or 1
-        batch_size = self.total_files // num_processes
-        remainder = self.total_files % num_processes
-        batches = []
-        start = 0
-        for i in range(num_processes):
-            extra = 1 if i < remainder else 0
-            end = start + batch_size + extra
-            batches.append(excel_files[start:end])
-            start = end
+        num_processes = default_worker_count()
 
-        logger.info(f"Bắt đầu chạy VBA trên {self.total_files} tệp, chia thành {num_processes} batch")
+        logger.info(f"Bắt đầu chạy VBA trên {self.total_files} tệp với {num_processes} worker (hàng đợi chung)")
 
         if self.mp_logging.queue is None:
             raise ValueError("Hàng đợi logging chia sẻ chưa được thiết lập!")
         from mpp_logger import get_mp_logger
         self.progress_queue = get_mp_logger().manager.Queue()
-        shared_queue = self.mp_logging.queue
 
-        from multiprocessing import Pool
-        pool = Pool(
-            processes=num_processes,
-            initializer=worker_logging_setup,
-            initargs=(shared_queue, self.mp_logging.log_level.value)
-        )
-        for batch in batches:
-            pool.apply_async(worker.process_batch, args=(batch, self.progress_queue, self.mp_logging.queue))
-        pool.close()
-        pool.join()
+        summary = self.pool_service.run(excel_files, num_processes, self.progress_queue,
+                                     ordering=gv.job_ordering, file_timeout=gv.file_timeout,
+                                     macro_file=self.vba_file if os.path.isfile(self.vba_file) else None,
+                                     macro_name=gv.macro_name, backend=gv.excel_backend)
+        for line in summary.format_lines():
+            logger.info(line)
 
         import time
         time.sleep(1)
@@ -309,6 +289,7 @@ class MainWindow(tk.Tk):
         self.running = False
         if hasattr(self, 'vba_thread') and self.vba_thread.is_alive():
             self.vba_thread.join(timeout=5)
+        self.pool_service.shutdown()
         self.mp_logging.shutdown()
         if self.after_id_progress is not None:
             self.after_cancel(self.after_id_progress)
@@ -3,34 +3,27 @@ import os
 import glob
 import time
 import threading
-import shutil
 import tkinter as tk
 from tkinter import messagebox, filedialog
 import logging
-from multiprocessing import Pool
 
-from gv import Gvar as gv
-from mpp_logger import LOG_LEVELS, DynamicLevelFilter
-from worker import worker_logging_setup
-import worker
+from gv import Gvar as gv, CACHE_DIR
+from mpp_logger import LOG_LEVELS
+from logfile import is_json_export
+import scheduler
+import run_manifest
+from concurrency import default_worker_count, AdaptiveConcurrency
 
 logger = None
 
 def update_gui_filter():
     """
-    Update the GUI handler filter based on the current log level and is_exact flag.
+    Update the GUI log view based on the current log level and is_exact flag.
     If is_exact is True, only log records with exactly the chosen level are shown;
     if False, all records with levels greater than or equal to the chosen level are displayed.
+    Only the records on screen are drawn again, read by position from the log store (see logview.LogView).
     """
-    current_level = LOG_LEVELS.get(gv.log_level_var.get(), logging.INFO)
-    is_exact = gv.is_exact_var.get()
-    print(f'is_exact:{is_exact}')
-
-    # Clear existing DynamicLevelFilter filters.
-    gv.root.gui_handler.filters = [f for f in gv.root.gui_handler.filters
-                                   if not isinstance(f, DynamicLevelFilter)]
-    gv.root.gui_handler.addFilter(DynamicLevelFilter(current_level, is_exact))
-    reload_log_text()  # Make sure we reload
+    gv.root.log_container.show_levels(*log_filter())
 
 def select_log_level(selected):
     
@@ -41,27 +34,26 @@ def select_log_level(selected):
 
     gv.mp_logging.select_log_level(level)
     update_gui_filter()
-    reload_log_text()   # <<--- Add this line
     logger.info(f"Log level changed to {selected}")
 
 def save_log():
     """
     Open a save file dialog to store the log.
-    If the chosen extension is JSON, copy the temporary JSON file.
-    Otherwise, write the log text from the log_text_widget.
+    If the chosen extension is JSON (.json, .jsonl, optionally .gz), export the JSONL log file.
+    Otherwise, write the log text from the log store.
     """
     path = filedialog.asksaveasfilename(
         title="Lưu Log vào tập tin",
         defaultextension=".log",
-        filetypes=[("Tệp văn bản (*.log)", "*.log"), ("Tệp JSON (*.json)", "*.json")]
+        filetypes=[("Tệp văn bản (*.log)", "*.log"), ("Tệp JSON (*.json)", "*.json"),
+                   ("Tệp JSON Lines (*.jsonl)", "*.jsonl"), ("Tệp JSON Lines nén gzip (*.jsonl.gz)", "*.jsonl.gz")]
     )
     if path:
         try:
-            if path.lower().endswith(".json"):
-                shutil.copyfile(gv.root.mp_logging.log_temp_file_path, path)
+            if is_json_export(path):
+                gv.root.mp_logging.export_log(path)
             else:
-                with open(path, "w", encoding="utf-8") as f:
-                    f.write(gv.root.log_container.log_text.get("1.0", tk.END))
+                write_log_text(path)
             messagebox.showinfo("Thông báo", "Log đã được lưu thành công.")
             logger.info("Log đã được lưu thành công")
         except Exception as e:
@@ -119,15 +111,18 @@ def update_progress():
             gv.root.progress_count += 1
             gv.progress_bar["value"] = gv.root.progress_count
             percent = int((gv.root.progress_count / gv.root.total_files) * 100) if gv.root.total_files > 0 else 0
-            gv.progress_label.config(text=f"{percent}%")
+            skipped = f" (bỏ qua {gv.root.skipped_files} tệp không đổi)" if gv.root.skipped_files else ""
+            gv.progress_label.config(text=f"{percent}%{skipped}")
     gv.root.after_id_progress = gv.root.after(1000, update_progress)
 
 def run_vba_on_all():
     """
     Process Excel files by:
       - Reading file paths from the UI.
-      - Searching for Excel files in the chosen directory.
-      - Batching the files and launching a multiprocessing Pool.
+      - Searching for Excel files in the chosen directory and skipping the ones already processed
+        with the same macro (run_manifest), unless "force" is checked.
+      - Feeding the files to the application's warm worker pool through a shared queue
+        (PoolService.run -> scheduler.run_files).
       - Updating progress and logging each step.
     """
     logger.info("Bắt đầu chạy VBA trên các tệp Excel.")
@@ -139,48 +134,72 @@ def run_vba_on_all():
         gv.root.vba_file = os.path.join(gv.root.excel_directory, 'test_macro.bas')
     globals()["global_vba_file_path"] = gv.root.vba_file
 
-    excel_files = glob.glob(os.path.join(gv.root.excel_directory, "*.xlsx"))
-    if not excel_files:
+    scanned = run_manifest.scan_excel_files(gv.root.excel_directory)
+    if not scanned:
         messagebox.showwarning("Cảnh báo", "Không tìm thấy tệp Excel nào trong thư mục đã chọn.")
         return
 
-    gv.root.total_files = len(excel_files)
-    gv.root.progress_count = 0
+    manifest = run_manifest.RunManifest.for_directory(gv.root.excel_directory)
+    job = run_manifest.job_key(gv.root.vba_file, gv.macro_name, gv.recipe)
+    force = bool(gv.force_var.get()) if gv.force_var is not None else False
+    excel_files, skipped = manifest.split(scanned, job, force, gv.use_content_hash)
+    logger.info(f"Tìm thấy {len(scanned)} tệp: {len(excel_files)} cần xử lý, "
+                f"bỏ qua {len(skipped)} tệp không đổi{' (chạy lại tất cả)' if force else ''}")
+
+    gv.root.total_files = len(scanned)
+    gv.root.skipped_files = len(skipped)
+    gv.root.progress_count = len(skipped)
     gv.progress_bar["maximum"] = gv.root.total_files
-    gv.progress_bar["value"] = 0
+    gv.progress_bar["value"] = gv.root.progress_count
+    if not excel_files:
+        logger.info("Mọi tệp đều đã được xử lý với macro này, không có gì để chạy.")
+        gv.progress_label.config(text=f"100% (bỏ qua {len(skipped)} tệp không đổi)")
+        return
 
-    num_processes = os.cpu_count() - 2 or 1
-    batch_size = gv.root.total_files // num_processes
-    remainder = gv.root.total_files % num_processes
-    batches = []
-    start = 0
-    for i in range(num_processes):
-        extra = 1 if i < remainder else 0
-        end = start + batch_size + extra
-        batches.append(excel_files[start:end])
-        start = end
+    num_processes = default_worker_count()
+    concurrency = AdaptiveConcurrency(gv.min_workers, gv.max_workers) if gv.adaptive_workers else None
 
-    logger.info(f"Bắt đầu chạy VBA trên {gv.root.total_files} tệp, chia thành {num_processes} batch")
+    if concurrency is not None:
+        logger.info(f"Bắt đầu chạy VBA trên {len(excel_files)} tệp, số worker tự điều chỉnh "
+                    f"{concurrency.min_workers}-{concurrency.max_workers} (hàng đợi chung)")
+    else:
+        logger.info(f"Bắt đầu chạy VBA trên {len(excel_files)} tệp với {num_processes} worker (hàng đợi chung)")
 
     if gv.root.mp_logging.queue is None:
         raise ValueError("Hàng đợi logging chia sẻ chưa được thiết lập!")
     from mpp_logger import get_mp_logger
     gv.root.progress_queue = get_mp_logger().manager.Queue()
-    shared_queue = gv.root.mp_logging.queue
 
-    pool = Pool(
-        processes=num_processes,
-        initializer=worker_logging_setup,
-        initargs=(shared_queue, gv.root.mp_logging.log_level.value)
-    )
-    for batch in batches:
-        pool.apply_async(worker.process_batch, args=(batch, gv.root.progress_queue, gv.root.mp_logging.queue))
-    pool.close()
-    pool.join()
+    summary = gv.root.pool_service.run(excel_files, num_processes, gv.root.progress_queue,
+                                       ordering=gv.job_ordering, file_timeout=gv.file_timeout,
+                                       stop_event=gv.root.stop_event, cancel_grace=gv.cancel_grace,
+                                       macro_file=gv.root.vba_file if os.path.isfile(gv.root.vba_file) else None,
+                                       macro_name=gv.macro_name, backend=gv.excel_backend,
+                                       concurrency=concurrency, recipe=gv.recipe, per_sheet=gv.per_sheet)
+    for line in summary.format_lines():
+        logger.info(line)
+    if gv.results_export:
+        export_path = os.path.join(CACHE_DIR, "results",
+                                   time.strftime(f"results_%Y%m%d_%H%M%S.{gv.results_export}"))
+        try:
+            for path in summary.results.export(export_path):
+                logger.info(f"Bảng kết quả: {path}")
+        except OSError as e:
+            logger.error(f"Không xuất được bảng kết quả {export_path}: {e}")
+    if skipped:
+        logger.info(f"  Bỏ qua {len(skipped)} tệp không đổi kể từ lần chạy trước")
+
+    for file_path, outcome in summary.outcomes.items():
+        if outcome["status"] == "ok":
+            manifest.record(file_path, job, gv.use_content_hash)
+    manifest.save()
 
     time.sleep(1)
-    logger.info(f"Đã chạy VBA trên {gv.root.total_files} tệp Excel.")
-    reload_log_text()
+    if summary.cancelled_run:
+        logger.warning(f"Đã dừng theo yêu cầu: {summary.processed} tệp xong, {len(skipped)} bỏ qua, "
+                       f"{len(summary.cancelled)} huỷ, {len(summary.failed)} lỗi.")
+    else:
+        logger.info(f"Đã chạy VBA trên {gv.root.total_files} tệp Excel.")
 
 def run_vba_on_all_thread():
     """
@@ -190,6 +209,18 @@ def run_vba_on_all_thread():
     gv.root.vba_thread = threading.Thread(target=run_vba_on_all)
     gv.root.vba_thread.start()
 
+def stop_run():
+    """
+    Cooperatively cancel the running batch: workers stop picking up new files at once, the files in
+    progress finish (or are aborted after Gvar.cancel_grace seconds) and Excel sessions are closed.
+    """
+    if gv.root.vba_thread is None or not gv.root.vba_thread.is_alive():
+        logger.info("Không có lượt chạy nào đang diễn ra.")
+        return
+    if not gv.root.stop_event.is_set():
+        logger.warning("Đã yêu cầu dừng lượt chạy hiện tại.")
+        gv.root.stop_event.set()
+
 def copy_text():
     """
     Copy the selected text from the log_text_widget to the clipboard.
@@ -250,60 +281,52 @@ def toggle_wrap():
     current_wrap = gv.root.log_container.log_text.cget("wrap")
     new_wrap = "none" if current_wrap == "word" else "word"
     gv.root.log_container.log_text.configure(wrap=new_wrap)
+    gv.root.log_container.refresh()
 
 
 def exit_app():
     """
     Cleanly shut down the application:
-      - Stop background threads.
+      - Cancel the running batch, if any, and wait for it to stop.
+      - Stop the warm worker pool (each worker closes its Excel session).
       - Shutdown logging.
       - Cancel scheduled UI callbacks.
       - Destroy the main window.
     """
     gv.root.running = False
     if hasattr(gv.root, 'vba_thread') and gv.root.vba_thread is not None and gv.root.vba_thread.is_alive():
-        gv.root.vba_thread.join(timeout=5)
+        # Huỷ lượt chạy đang diễn ra và chờ các worker đóng Excel của mình.
+        gv.root.stop_event.set()
+        gv.root.vba_thread.join(timeout=(gv.cancel_grace or 0) + 10)
+    gv.root.pool_service.shutdown()
     gv.root.mp_logging.shutdown()
     if gv.root.after_id_progress is not None:
         gv.root.after_cancel(gv.root.after_id_progress)
     gv.root.destroy()
 
 
-def reload_log_text():
+def log_filter():
     """
-    Clear the log display and reload all log entries from mp_logging.log_store
-    that satisfy the filter, then convert each record to text using the PrettyFormatter.
+    Returns the GUI log filter: (chosen level, is_exact), exact or "and above".
     """
-    # Get the text widget (assumed to be a Tkinter Text widget)
-    widget = gv.root.log_container.log_text
-    widget.configure(state="normal")
-    widget.delete("1.0", tk.END)
-    widget.configure(state="disabled")
-    
-    # Retrieve the current log level and exact matching flag from the GUI's shared variables.
-    current_level = LOG_LEVELS.get(gv.log_level_var.get(), logging.INFO)
-    is_exact = gv.is_exact_var.get()
-    
-    # Define a filter function for the raw log record.
-    def passes_filter(rec):
-        # Compare using the raw record's 'levelno' attribute.
-        return rec.levelno == current_level if is_exact else rec.levelno >= current_level
+    return LOG_LEVELS.get(gv.log_level_var.get(), logging.INFO), gv.is_exact_var.get()
 
-    # Filter the raw log records stored in the MemoryLogHandler.
-    filtered_records = [rec for rec in gv.root.mp_logging.log_store if passes_filter(rec)]
-    
-    # Format each record using the PrettyFormatter.
-    # The PrettyFormatter uses create_log_record with diacritics=True.
-    formatted_logs = [
-        gv.root.mp_logging.pretty_formatter.format(rec)
-        for rec in filtered_records
-    ]
-    
-    # Join the formatted log entries with newline characters.
-    full_text = "\n".join(formatted_logs)
-    
-    # Insert the combined log text into the log container.
-    gv.root.log_container.insert_log(full_text)
+def write_log_text(path):
+    """
+    Write the log records that satisfy the GUI filter to path as text (PrettyFormatter), including
+    the records the log store has spilled to disk.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        for text in gv.root.mp_logging.log_store.texts(*log_filter()):
+            f.write(text + "\n")
+
+def reload_log_text():
+    """
+    Draw the log display again from mp_logging.log_store with the current filter. The view only
+    holds the records on screen (see logview.LogView), whose text the store keeps formatted.
+    """
+    gv.root.log_container.show_levels(*log_filter())
+    gv.root.log_container.refresh()
 
 
 
@@ -317,6 +340,7 @@ action_list = {
     "update_progress": update_progress,
     "run_macro_thread": run_vba_on_all_thread,
     "run_macro": run_vba_on_all,
+    "stop_run": stop_run,
     "copy_text": copy_text,
     "paste_text": paste_text,
     "select_fonts": select_fonts,
@@ -324,5 +348,6 @@ action_list = {
     "font_size_down": font_size_down,
     "toggle_wrap": toggle_wrap,
     "reload_log_text": reload_log_text,
+    "write_log_text": write_log_text,
     "exit_app": exit_app,
 }
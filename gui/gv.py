@@ -1,8 +1,14 @@
+import os
+import backends
+
 # Định nghĩa kiểu dáng chung cho các widget giao diện
 COMMON_WIDGET_STYLE = {"font": ("Arial", 18, "bold"), "width": 25, "height": 3}
 FONT_BASIC = ("Arial", 15, "normal")
 font_options = ["Arial", "Courier New", "Times New Roman", "Verdana", "Tahoma"]
 
+# Thư mục cache của ứng dụng (lịch sử thời gian xử lý, ...); có thể đổi bằng biến môi trường VBA_PYTHON_CACHE.
+CACHE_DIR = os.environ.get("VBA_PYTHON_CACHE") or os.path.join(os.path.expanduser("~"), ".cache", "vba_python")
+
 def create_log_record(record, with_diacritics=False):
     """
     Tạo một bản ghi log dưới dạng từ điển từ một đối tượng ghi log.
@@ -63,3 +69,17 @@ class Gvar:
     progress_queue = None     # Hàng đợi xử lý tiến trình
     log_level_var = None      # Biến lưu cấp độ log
     is_exact_var = None       # Biến lưu trạng thái tìm kiếm chính xác hay không
+    job_ordering = "history"  # Thứ tự phát tệp: "fifo", "size" hoặc "history" (xem ordering.ORDERINGS)
+    file_timeout = 600.0      # Thời hạn (giây) cho mỗi tệp trước khi worker bị dừng; None để tắt
+    skipped_files = 0         # Số tệp được bỏ qua vì không đổi kể từ lần chạy trước
+    force_var = None          # Biến (checkbox) "chạy lại tất cả", bỏ qua manifest
+    use_content_hash = False  # So sánh thêm nội dung (SHA-256) khi mtime đổi mà dung lượng không đổi
+    macro_name = "ProcessWorkbook"   # Macro chạy trên mỗi tệp (trong tệp VBA đã tải)
+    adaptive_workers = True   # Tự điều chỉnh số worker theo thông lượng (xem concurrency.AdaptiveConcurrency)
+    min_workers = 1           # Số worker tối thiểu khi tự điều chỉnh
+    max_workers = None        # Số worker tối đa khi tự điều chỉnh; None = số lõi CPU
+    excel_backend = backends.DEFAULT_BACKEND  # Backend tự động hoá Excel (xem backends.BACKENDS)
+    recipe = None             # Recipe Python áp dụng thay cho macro (xem recipes.RECIPES); None = chạy macro
+    per_sheet = False         # Chạy macro một lần cho mỗi trang tính với tên trang (như RunVBA(sheetName))
+    results_export = "csv"    # Định dạng xuất bảng kết quả sau mỗi lượt chạy vào <cache>/results ("csv", "jsonl"); None để tắt
+    cancel_grace = 30.0       # Thời gian (giây) cho tệp đang xử lý khi dừng lượt chạy; None để chờ tệp xong
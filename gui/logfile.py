@@ -0,0 +1,333 @@
+# logfile.py
+"""
+File sink of the log (LoggingMultiProcess.file_handler): compact JSON lines, one record per line
+(mpp_logger.JsonFormatter), written to size-rotated segments, optionally compressed as they are
+written.
+
+Segments are named <stem>.000.jsonl, <stem>.001.jsonl, ... with ".gz" (gzip, standard library)
+or ".zst" (zstd, needs the zstandard package; gzip is used when it is missing) appended when
+compressed. A new segment starts once the current one holds max_bytes of uncompressed JSON;
+with max_segments, the oldest segments are removed beyond that number (not while an export or a
+records() read is running: the removal waits for it to end).
+
+To read a compressed segment while it is written, a snapshot ends the gzip member or zstd frame
+being written (only when records were written since the previous snapshot) and the next records
+go to a new member / frame of the same segment: the bytes up to that point are complete, and a
+snapshot never starts a new segment.
+
+export() writes the whole session to one file, chosen by the extension of the path:
+
+    .jsonl          JSON lines, as written
+    .json           one JSON array, one record per line
+    + .gz / .zst    compressed
+
+When the file is JSON lines compressed like the segments (or both uncompressed), the segments
+are simply concatenated: gzip members and zstd frames can follow one another in one file. Other
+combinations stream the lines through, without parsing them. read_records() iterates the records
+of any of these files (or of the segments) lazily:
+
+    handler = JsonlFileHandler("/tmp/vba_python_log_x/log.jsonl", compression="gzip")
+    handler.setFormatter(JsonFormatter(datefmt="%Y-%m-%dT%H:%M:%S%z"))
+    handler.export("session.json")
+    for record in read_records("session.json"): ...
+"""
+import io
+import os
+import gzip
+import json
+import shutil
+import logging
+
+# Nén các đoạn file log khi ghi: "none", "gzip" hoặc "zstd"; đổi bằng VBA_PYTHON_LOG_COMPRESSION.
+LOG_FILE_COMPRESSION = os.environ.get("VBA_PYTHON_LOG_COMPRESSION", "none")
+# Dung lượng (chưa nén) tối đa của một đoạn file log trước khi sang đoạn mới; đổi bằng VBA_PYTHON_LOG_FILE_MB.
+LOG_FILE_MAX_BYTES = int(float(os.environ.get("VBA_PYTHON_LOG_FILE_MB", "64")) * 1024 * 1024)
+# Số đoạn file log giữ lại (đoạn cũ nhất bị xoá); 0 = giữ tất cả. Đổi bằng VBA_PYTHON_LOG_FILE_SEGMENTS.
+LOG_FILE_MAX_SEGMENTS = int(os.environ.get("VBA_PYTHON_LOG_FILE_SEGMENTS", "0"))
+# Phần mở rộng của mỗi kiểu nén.
+COMPRESSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+# Mức nén: thấp để listener ghi log không bị chậm.
+GZIP_LEVEL = 3
+ZSTD_LEVEL = 3
+# Kích thước khối khi nối các đoạn.
+COPY_CHUNK = 1024 * 1024
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def compression_of(path):
+    """
+    The compression of a file, from its extension: "gzip", "zstd" or "none".
+    """
+    lower = path.lower()
+    for name, suffix in COMPRESSIONS.items():
+        if suffix and lower.endswith(suffix):
+            return name
+    return "none"
+
+
+def is_json_export(path):
+    """
+    True when path names a file export() writes (.json or .jsonl, compressed or not).
+    """
+    inner = path[:len(path) - len(COMPRESSIONS[compression_of(path)])].lower()
+    return inner.endswith(".json") or inner.endswith(".jsonl")
+
+
+def open_writer(path, compression):
+    """
+    A binary file open for writing path, compressing with compression.
+    """
+    if compression == "gzip":
+        return gzip.open(path, "wb", compresslevel=GZIP_LEVEL)
+    if compression == "zstd":
+        zstandard = _zstandard()
+        if zstandard is None:
+            raise RuntimeError("Nén zstd cần thư viện zstandard (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, "wb"))
+    return open(path, "wb")
+
+
+class _LimitedReader(io.RawIOBase):
+    # Chỉ đọc limit byte đầu của một tệp: phần đã hoàn chỉnh của đoạn đang ghi.
+    def __init__(self, f, limit):
+        self._f = f
+        self._left = limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._left <= 0:
+            return 0
+        view = memoryview(buffer)[:min(len(buffer), self._left)]
+        count = self._f.readinto(view)
+        self._left -= count
+        return count
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+
+def open_reader(path, size=None):
+    """
+    A binary file open for reading path, decompressed according to its extension; with size, only
+    its first size bytes (on disk) are read.
+    """
+    raw = open(path, "rb")
+    if size is not None:
+        raw = _LimitedReader(raw, size)
+    compression = compression_of(path)
+    if compression == "gzip":
+        reader = gzip.GzipFile(fileobj=raw, mode="rb")
+        reader.myfileobj = raw  # GzipFile đóng tệp này khi được đóng, như tệp nó tự mở
+        return reader
+    if compression == "zstd":
+        zstandard = _zstandard()
+        if zstandard is None:
+            raw.close()
+            raise RuntimeError("Đọc tệp .zst cần thư viện zstandard (pip install zstandard)")
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+        return io.BufferedReader(reader)
+    return raw if size is None else io.BufferedReader(raw)
+
+
+def read_records(paths):
+    """
+    Yields the records (dicts) of a log file, or of a list of them in order, one line at a time:
+    segments and .jsonl exports (JSON lines) and .json exports (a JSON array with one record
+    per line), compressed or not. An item of the list may also be (path, number of bytes to read
+    or None for all), as returned for the segments of a JsonlFileHandler.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    for path in paths:
+        path, size = path if isinstance(path, tuple) else (path, None)
+        with io.TextIOWrapper(open_reader(path, size), encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line in ("", "[", "]"):
+                    continue
+                yield json.loads(line[:-1] if line.endswith(",") else line)
+
+
+class JsonlFileHandler(logging.Handler):
+    """
+    Logging handler writing one formatted record per line to rotated, optionally compressed segments.
+    Uncompressed segments are flushed after each record, like logging.FileHandler; compressed
+    ones when a segment ends, on a snapshot (export(), records()) and on close().
+    """
+    def __init__(self, base_path, compression=LOG_FILE_COMPRESSION, max_bytes=LOG_FILE_MAX_BYTES,
+                 max_segments=LOG_FILE_MAX_SEGMENTS):
+        super().__init__()
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Kiểu nén không hợp lệ: {compression} (chọn {', '.join(COMPRESSIONS)})")
+        if compression == "zstd" and _zstandard() is None:
+            print("Cảnh báo: không có thư viện zstandard, file log được nén bằng gzip.")
+            compression = "gzip"
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.max_segments = max_segments
+        self.stem = os.path.splitext(base_path)[0]
+        self.segments = []      # đường dẫn các đoạn còn giữ, đoạn cuối là đoạn đang ghi
+        self._number = 0
+        self._file = None       # tệp của đoạn đang ghi
+        self._stream = None     # luồng ghi (nén) trên _file, hoặc chính _file khi không nén
+        self._size = 0          # số byte (chưa nén) đã ghi vào đoạn đang ghi
+        self._synced = 0        # số byte trên đĩa của đoạn đang ghi đọc được trọn vẹn (lần snapshot trước)
+        self._unsynced = False  # có bản ghi nén chưa kết thúc từ lần snapshot trước
+        self._readers = 0       # số lần xuất / đọc đang chạy: chưa xoá đoạn cũ
+        self._open_segment()
+
+    def _open_segment(self):
+        path = f"{self.stem}.{self._number:03d}.jsonl{COMPRESSIONS[self.compression]}"
+        self._file = open(path, "wb")
+        self._stream = self._open_stream()
+        self._number += 1
+        self._size = 0
+        self._synced = 0
+        self._unsynced = False
+        self.segments.append(path)
+        self._trim()
+
+    def _open_stream(self):
+        # Một gzip member / zstd frame mới trên tệp đang ghi (chính tệp đó khi không nén).
+        if self.compression == "gzip":
+            return gzip.GzipFile(fileobj=self._file, mode="wb", compresslevel=GZIP_LEVEL)
+        if self.compression == "zstd":
+            return _zstandard().ZstdCompressor(level=ZSTD_LEVEL).stream_writer(self._file, closefd=False)
+        return self._file
+
+    def _close_stream(self):
+        # Kết thúc luồng nén (member / frame trọn vẹn) mà không đóng tệp.
+        if self._stream is not self._file:
+            self._stream.close()
+        self._file.flush()
+
+    def _trim(self):
+        while self.max_segments and len(self.segments) > self.max_segments and not self._readers:
+            try:
+                os.remove(self.segments.pop(0))
+            except OSError:
+                pass
+
+    def _rotate(self):
+        self._close_stream()
+        self._file.close()
+        self._open_segment()
+
+    def emit(self, record):
+        try:
+            data = (self.format(record) + "\n").encode("utf-8")
+            if self._stream is None:
+                return
+            if self._size and self._size + len(data) > self.max_bytes:
+                self._rotate()
+            self._stream.write(data)
+            self._size += len(data)
+            self._unsynced = True
+            if self.compression == "none":
+                self._stream.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        with self.lock:
+            if self._stream is not None:
+                self._stream.flush()
+
+    def close(self):
+        with self.lock:
+            if self._stream is not None:
+                self._close_stream()
+                self._file.close()
+                self._stream = self._file = None
+        super().close()
+
+    def _snapshot(self):
+        """
+        [(segment, number of bytes to read or None for all)] of the session so far, and holds the
+        removal of old segments until _release(). The compressed member / frame being written is
+        ended first when records were written since the previous snapshot, so that every byte
+        returned is complete on disk.
+        """
+        with self.lock:
+            self._readers += 1
+            if self._stream is None:
+                return [(path, None) for path in self.segments]
+            if self._unsynced:
+                self._close_stream()
+                self._synced = self._file.tell()
+                self._unsynced = False
+                if self._stream is not self._file:
+                    self._stream = self._open_stream()
+            return [(path, None) for path in self.segments[:-1]] + [(self.segments[-1], self._synced)]
+
+    def _release(self):
+        with self.lock:
+            self._readers -= 1
+            self._trim()
+
+    def records(self):
+        """
+        Yields the records of the session so far, lazily (see read_records).
+        """
+        segments = self._snapshot()
+        try:
+            yield from read_records(segments)
+        finally:
+            self._release()
+
+    def export(self, path):
+        """
+        Writes the records of the session so far to path, in the format of its extension (see the
+        module docstring): segments are concatenated when the format allows it, otherwise their
+        lines are streamed. Records keep being logged meanwhile; they are not part of the export.
+        """
+        segments = self._snapshot()
+        try:
+            self._export(segments, path)
+        finally:
+            self._release()
+
+    def _export(self, segments, path):
+        compression = compression_of(path)
+        inner = path[:len(path) - len(COMPRESSIONS[compression])]
+        as_array = inner.lower().endswith(".json")
+        if not as_array and compression == self.compression:
+            with open(path, "wb") as out:
+                for segment, size in segments:
+                    with open(segment, "rb") as f:
+                        if size is None:
+                            shutil.copyfileobj(f, out, COPY_CHUNK)
+                        else:
+                            while size > 0:
+                                chunk = f.read(min(COPY_CHUNK, size))
+                                if not chunk:
+                                    break
+                                out.write(chunk)
+                                size -= len(chunk)
+            return
+        with open_writer(path, compression) as out:
+            if as_array:
+                out.write(b"[\n")
+            separator = b""
+            for segment, size in segments:
+                with open_reader(segment, size) as f:
+                    for line in f:
+                        line = line.rstrip(b"\n")
+                        if not line:
+                            continue
+                        if as_array:
+                            out.write(separator)
+                            separator = b",\n"
+                        out.write(line if as_array else line + b"\n")
+            if as_array:
+                out.write(b"\n]\n")
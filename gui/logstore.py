@@ -0,0 +1,328 @@
+# logstore.py
+"""
+Compact, bounded store of the log records kept for the GUI (LoggingMultiProcess.log_store).
+
+Instead of LogRecord objects (each with its __dict__, args, exc_info and its own copy of the
+path, process and function names), the store keeps parallel arrays: time, level, line number,
+indexes into one table of interned strings (process name, file path, function name) and the
+message. Iterating the store yields StoredRecord objects built on demand, which the formatters
+and level filters of mpp_logger accept like LogRecords.
+
+Each record is also formatted once, when it is added (with the formatter of the GUI), and its
+text is kept with it; a per-level index holds the sequence numbers of the records of each level.
+texts(level, is_exact) therefore only looks up and collects text already built, whatever the
+filter, which is what save_log needs.
+
+The memory use is estimated as records are added. Past max_bytes, the oldest spill_fraction of
+the records is appended to on-disk segments and removed from memory: the fields as JSON lines
+(segment_path) and the formatted text (<segment>.txt, located by a byte offset per record).
+Reading the store reads them back from the segments first, so the log view and save_log still
+see the whole session. The level indexes and offsets stay in memory (8 bytes per record each), as
+do the level and process of every record (6 bytes).
+
+The virtualized log view (logview.LogView) reads the store by position within a level filter:
+count() gives the number of records the filter keeps, window() the texts of a range of them and
+locate() the position of a record. The sequence numbers kept by each filter are built once from
+the level indexes and then only extended with the new records.
+
+    store = LogStore("/tmp/session.spill.jsonl", max_bytes=64 * 1024 * 1024, formatter=PrettyFormatter())
+    store.append(record)
+    for rec in store.records(): ...
+    "\n".join(store.texts(logging.WARNING, is_exact=False))
+    store.window(logging.WARNING, False, 100, 20)   # [(seq, text, levelno, processName), ...]
+    store.stats()   # {"records", "in_memory", "spilled", "bytes", "max_bytes"}
+"""
+import os
+import sys
+import json
+import logging
+import heapq
+import bisect
+import threading
+from array import array
+
+# Bộ nhớ tối đa (ước tính) của kho log trước khi chuyển bản ghi cũ ra đĩa; đổi bằng VBA_PYTHON_LOG_STORE_MB.
+LOG_STORE_MAX_BYTES = int(float(os.environ.get("VBA_PYTHON_LOG_STORE_MB", "64")) * 1024 * 1024)
+# Tỉ lệ bản ghi cũ nhất được chuyển ra đĩa mỗi lần vượt giới hạn.
+SPILL_FRACTION = 0.25
+# Số byte của một bản ghi trong các mảng song song được chuyển ra đĩa: created, lineno, 2 chỉ số chuỗi
+# (đường dẫn, hàm), con trỏ message và con trỏ văn bản đã định dạng.
+_FIXED_BYTES = 8 + 4 + 2 * 4 + 8 + 8
+# Số byte của một bản ghi luôn ở trong bộ nhớ: levelno, chỉ số tên tiến trình, chỉ mục cấp độ, vị trí trên đĩa.
+_KEPT_BYTES = 2 + 4 + 8 + 8
+
+
+class StoredRecord:
+    """
+    A record read back from the store, with the LogRecord attributes used by the formatters and filters.
+    """
+    __slots__ = ("created", "levelno", "lineno", "processName", "pathname", "funcName", "msg",
+                 "message", "asctime")
+
+    def __init__(self, created, levelno, lineno, processName, pathname, funcName, msg):
+        self.created = created
+        self.levelno = levelno
+        self.lineno = lineno
+        self.processName = processName
+        self.pathname = pathname
+        self.funcName = funcName
+        self.msg = msg
+        self.message = msg
+        self.asctime = None
+
+    @property
+    def levelname(self):
+        return logging.getLevelName(self.levelno)
+
+    @property
+    def msecs(self):
+        return (self.created - int(self.created)) * 1000
+
+    def getMessage(self):
+        return self.msg
+
+
+class LogStore:
+    """
+    Bounded store of log records, thread safe (records arrive from every channel listener).
+    """
+    def __init__(self, segment_path, max_bytes=LOG_STORE_MAX_BYTES, spill_fraction=SPILL_FRACTION, formatter=None):
+        self.segment_path = segment_path
+        self.text_path = os.path.splitext(segment_path)[0] + ".txt"
+        self.max_bytes = max_bytes
+        self.spill_fraction = spill_fraction
+        self.formatter = formatter or logging.Formatter()
+        self._lock = threading.Lock()
+        self._created = array("d")
+        self._levelno = array("H")      # cấp độ của mọi bản ghi trong phiên (kể cả đã ra đĩa), theo số thứ tự
+        self._lineno = array("i")
+        self._process = array("I")      # chỉ số tên tiến trình của mọi bản ghi trong phiên, theo số thứ tự
+        self._path = array("I")
+        self._func = array("I")
+        self._msg = []
+        self._text = []         # văn bản đã định dạng của mỗi bản ghi trong bộ nhớ
+        self._index = {}        # levelno -> array số thứ tự (tuyệt đối) các bản ghi của mức đó
+        self._selections = {}   # (level, is_exact) -> [array số thứ tự bản ghi bộ lọc giữ lại, số bản ghi đã xét]
+        self._offsets = array("Q", [0])  # vị trí (byte) văn bản của các bản ghi đã ra đĩa trong text_path
+        self._strings = []      # chuỗi đã intern, theo chỉ số
+        self._string_ids = {}   # chuỗi -> chỉ số trong _strings
+        self._bytes = 0         # bộ nhớ ước tính của các bản ghi và bảng chuỗi
+        self.spilled = 0        # số bản ghi đã chuyển ra đĩa (luôn là các bản ghi cũ nhất)
+
+    def _string_id(self, value):
+        value = sys.intern(str(value))
+        index = self._string_ids.get(value)
+        if index is None:
+            index = self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+            self._bytes += sys.getsizeof(value)
+        return index
+
+    def append(self, record):
+        """
+        Stores the fixed fields of a LogRecord (message already merged with its args).
+        """
+        msg = record.getMessage()
+        text = self.formatter.format(record)
+        with self._lock:
+            index = self._index.get(record.levelno)
+            if index is None:
+                index = self._index[record.levelno] = array("Q")
+            index.append(self.spilled + len(self._msg))
+            self._created.append(record.created)
+            self._levelno.append(record.levelno)
+            self._lineno.append(record.lineno or 0)
+            self._process.append(self._string_id(record.processName))
+            self._path.append(self._string_id(record.pathname))
+            self._func.append(self._string_id(record.funcName))
+            self._msg.append(msg)
+            self._text.append(text)
+            self._bytes += _FIXED_BYTES + sys.getsizeof(msg) + sys.getsizeof(text)
+            if self._bytes > self.max_bytes and len(self._msg) > 1:
+                self._spill()
+
+    def _spill(self):
+        count = max(1, int(len(self._msg) * self.spill_fraction))
+        strings = self._strings
+        with open(self.segment_path, "a", encoding="utf-8") as f:
+            for i in range(count):
+                seq = self.spilled + i
+                f.write(json.dumps([self._created[i], self._levelno[seq], self._lineno[i], strings[self._process[seq]],
+                                    strings[self._path[i]], strings[self._func[i]], self._msg[i]],
+                                   ensure_ascii=False) + "\n")
+        offset = self._offsets[-1]
+        with open(self.text_path, "ab") as f:
+            for i in range(count):
+                data = self._text[i].encode("utf-8")
+                f.write(data)
+                offset += len(data)
+                self._offsets.append(offset)
+        for i in range(count):
+            self._bytes -= _FIXED_BYTES + sys.getsizeof(self._msg[i]) + sys.getsizeof(self._text[i])
+        for column in (self._created, self._lineno, self._path, self._func, self._msg, self._text):
+            del column[:count]
+        self.spilled += count
+
+    def _read_segment(self, start, stop):
+        with open(self.segment_path, "r", encoding="utf-8") as f:
+            for number, line in enumerate(f):
+                if number >= stop:
+                    break
+                if number >= start:
+                    yield StoredRecord(*json.loads(line))
+
+    def records(self, start=0):
+        """
+        Yields the records from position start (0 = first of the session), the spilled ones first.
+        The records in memory are taken as of the call; those added meanwhile are not yielded.
+        """
+        with self._lock:
+            spilled = self.spilled
+            columns = (self._created[:], self._levelno[spilled:], self._lineno[:], self._process[spilled:],
+                       self._path[:], self._func[:], self._msg[:])
+            strings = list(self._strings)
+        if start < spilled:
+            yield from self._read_segment(start, spilled)
+        created, levelno, lineno, process, path, func, msg = columns
+        for i in range(max(start - spilled, 0), len(msg)):
+            yield StoredRecord(created[i], levelno[i], lineno[i], strings[process[i]],
+                               strings[path[i]], strings[func[i]], msg[i])
+
+    def __iter__(self):
+        return self.records()
+
+    def _selected(self, level, is_exact):
+        """
+        Sequence numbers of the records at level (exactly, or at and above), in order; None when the
+        filter keeps every record. The array is cached per filter and extended with the records added
+        since the last call, merged from the level indexes. Called with the lock held.
+        """
+        levels = [lv for lv in self._index if (lv == level if is_exact else lv >= level)]
+        selection = self._selections.get((level, is_exact))
+        if selection is None:
+            if len(levels) == len(self._index):
+                return None
+            selection = self._selections[(level, is_exact)] = [array("Q"), 0]
+        seqs, seen = selection
+        total = self.spilled + len(self._msg)
+        if seen < total:
+            tails = [self._index[lv][bisect.bisect_left(self._index[lv], seen):] for lv in levels]
+            seqs.extend(tails[0] if len(tails) == 1 else heapq.merge(*tails))
+            selection[1] = total
+        return seqs
+
+    def _read_texts(self, seqs):
+        """
+        Yields the spilled texts of seqs (ascending), reading each run of consecutive records at once.
+        """
+        offsets = self._offsets     # chỉ được nối thêm: các vị trí đã có không đổi
+        with open(self.text_path, "rb") as f:
+            run_start = 0
+            for i in range(1, len(seqs) + 1):
+                if i < len(seqs) and seqs[i] == seqs[i - 1] + 1:
+                    continue
+                first, last = seqs[run_start], seqs[i - 1]
+                f.seek(offsets[first])
+                data = f.read(offsets[last + 1] - offsets[first])
+                start = offsets[first]
+                for j in range(first, last + 1):
+                    yield data[offsets[j] - start:offsets[j + 1] - start].decode("utf-8")
+                run_start = i
+
+    def _collect(self, seqs):
+        """
+        The texts of seqs (ascending): (spilled sequence numbers, texts in memory). Called with the lock held.
+        """
+        cut = bisect.bisect_left(seqs, self.spilled)
+        if isinstance(seqs, range) and cut == 0:
+            return seqs[:0], self._text[seqs.start - self.spilled:seqs.stop - self.spilled]
+        memory, spilled = self._text, self.spilled
+        return seqs[:cut], [memory[seq - spilled] for seq in seqs[cut:]]
+
+    def texts(self, level=logging.NOTSET, is_exact=False):
+        """
+        The formatted texts of the records at level (exactly with is_exact, otherwise at and above),
+        oldest first, those spilled to disk included. Nothing is formatted again: the texts are
+        looked up with the level indexes.
+        """
+        with self._lock:
+            seqs = self._selected(level, is_exact)
+            if seqs is None:
+                seqs = range(self.spilled + len(self._text))
+            on_disk, in_memory = self._collect(seqs)
+        result = list(self._read_texts(on_disk)) if len(on_disk) else []
+        result.extend(in_memory)
+        return result
+
+    def count(self, level=logging.NOTSET, is_exact=False):
+        """
+        The number of records the filter keeps.
+        """
+        with self._lock:
+            seqs = self._selected(level, is_exact)
+            return self.spilled + len(self._msg) if seqs is None else len(seqs)
+
+    def locate(self, level, is_exact, seq):
+        """
+        The position, among the records the filter keeps, of the first one with a sequence number
+        of at least seq (count() when there is none).
+        """
+        with self._lock:
+            seqs = self._selected(level, is_exact)
+            if seqs is None:
+                return min(seq, self.spilled + len(self._msg))
+            return bisect.bisect_left(seqs, seq)
+
+    def window(self, level, is_exact, start, count):
+        """
+        (seq, text, levelno, processName) of the records at positions start .. start + count - 1
+        among those the filter keeps, read from memory or from the text segment: the cost depends
+        on count only, not on the size of the store.
+        """
+        with self._lock:
+            seqs = self._selected(level, is_exact)
+            if seqs is None:
+                seqs = range(self.spilled + len(self._msg))
+            seqs = seqs[max(start, 0):max(start, 0) + count]
+            strings = self._strings
+            levels = [self._levelno[seq] for seq in seqs]
+            processes = [strings[self._process[seq]] for seq in seqs]
+            on_disk, in_memory = self._collect(seqs)
+        texts = list(self._read_texts(on_disk)) if len(on_disk) else []
+        texts.extend(in_memory)
+        return list(zip(seqs, texts, levels, processes))
+
+    def __len__(self):
+        return self.spilled + len(self._msg)
+
+    def stats(self):
+        """
+        {"records": total, "in_memory", "spilled", "bytes": estimated memory use of the records (what
+        max_bytes caps), "index_bytes": level indexes, spill offsets, levels, processes and the
+        cached filter selections, "max_bytes"}.
+        """
+        with self._lock:
+            in_memory = len(self._msg)
+            index_bytes = ((self.spilled + in_memory) * _KEPT_BYTES
+                           + sum(len(seqs) for seqs, _ in self._selections.values()) * 8)
+            return {"records": self.spilled + in_memory, "in_memory": in_memory, "spilled": self.spilled,
+                    "bytes": self._bytes, "index_bytes": index_bytes, "max_bytes": self.max_bytes}
+
+    def format_stats(self):
+        """
+        The status line of the store, e.g. "Log: 120000 bản ghi (40000 trên đĩa), bộ nhớ 12.3/64.0 MB".
+        """
+        stats = self.stats()
+        on_disk = f" ({stats['spilled']} trên đĩa)" if stats["spilled"] else ""
+        return (f"Log: {stats['records']} bản ghi{on_disk}, bộ nhớ "
+                f"{(stats['bytes'] + stats['index_bytes']) / 1048576:.1f}/{stats['max_bytes'] / 1048576:.1f} MB")
+
+    def close(self):
+        """
+        Removes the on-disk segments (the complete log stays in the JSON log file).
+        """
+        for path in (self.segment_path, self.text_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
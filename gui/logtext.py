@@ -2,10 +2,13 @@ import tkinter as tk
 import tkinter.font as tkFont
 from tkinter import ttk, filedialog, messagebox
 import tkinter.font as tkFont
+import logging
 from enum import Enum
 from gv import Gvar as gv, COMMON_WIDGET_STYLE, FONT_BASIC, font_options
 from mpp_logger import LOG_LEVELS
 from gui_actions import action_list
+from logview import LogView
+from logfile import is_json_export
 
 logger = None
 option_style = None
@@ -131,13 +134,17 @@ class LogText(tk.Frame):
         self.toolbar = tk.Frame(self)
         self.toolbar.pack(side="top", fill="x")
         
-        # Tạo vùng Text để hiển thị log. Chế độ wrap mặc định là "word", undo=True cho phép hoàn tác
-        self.log_text = tk.Text(self, wrap="word", undo=True)
+        # Dòng trạng thái dưới vùng log: số bản ghi và bộ nhớ của kho log (mpp_logger.LoggingMultiProcess.log_store)
+        self.status_label = tk.Label(self, text="", font=("Arial", 11), anchor="w")
+        self.status_label.pack(side="bottom", fill="x")
+
+        # Tạo vùng Text để hiển thị log. Chế độ wrap mặc định là "word"; vùng Text chỉ chứa các bản ghi
+        # đang hiện trên màn hình (xem logview.LogView)
+        self.log_text = tk.Text(self, wrap="word", state="disabled")
         self.log_text.pack(side="bottom", fill="both", expand=True)
         
-        # Tạo thanh cuộn (scrollbar) cho vùng Text
-        self.scrollbar = tk.Scrollbar(self.log_text, orient="vertical", command=self.log_text.yview)
-        self.log_text.configure(yscrollcommand=self.scrollbar.set)
+        # Tạo thanh cuộn (scrollbar) cho vùng Text: cuộn theo vị trí bản ghi trong kho log, do LogView điều khiển
+        self.scrollbar = tk.Scrollbar(self.log_text, orient="vertical")
         self.scrollbar.pack(side="right", fill="y")
         
         # Thiết lập font mặc định cho vùng Text: ví dụ, Arial kích thước 12
@@ -147,6 +154,11 @@ class LogText(tk.Frame):
         # Gọi hàm tạo các nút trên thanh công cụ
         self.create_toolbar()
 
+        # Cửa sổ ảo trên kho log: chỉ vẽ các bản ghi nhìn thấy, theo mức log đang chọn
+        self.view = LogView(self.log_text, self.scrollbar, self.mp_logging.log_store, self.font)
+        self.view.on_backlog = self.show_pending
+        self.show_levels(LOG_LEVELS.get(gv.log_level_var.get(), logging.INFO), gv.is_exact_var.get())
+
     def create_toolbar(self):
         """
         Tạo các nút trên thanh công cụ sử dụng emoji được định nghĩa trong lớp Emoji.
@@ -215,51 +227,85 @@ class LogText(tk.Frame):
             btn.pack(side="left", padx=5, pady=5)
             # Thêm tooltip cho mỗi nút với tiêu đề tiếng Việt
             ToolTip(btn, text=config["tooltip"])
+
+        # Số bản ghi log bị bỏ khi kênh log đầy (xem mpp_logger.LogChannel), cập nhật mỗi giây
+        self.dropped_label = tk.Label(self.toolbar, text="", font=FONT_BASIC, fg="#b00020")
+        self.dropped_label.pack(side="right", padx=5)
+        ToolTip(self.dropped_label, text="Số bản ghi log bị bỏ theo cấp độ vì kênh log đầy")
+        # Số bản ghi nằm dưới cửa sổ log khi người dùng đã cuộn lên (logview.LogView.on_backlog)
+        self.pending_label = tk.Label(self.toolbar, text="", font=FONT_BASIC, fg="#8a5a00")
+        self.pending_label.pack(side="right", padx=5)
+        ToolTip(self.pending_label, text="Số bản ghi log mới hơn phần đang xem (Ctrl+End để xuống cuối)")
+        self.update_status()
+
+    def show_pending(self, count):
+        """
+        Hiển thị số bản ghi log nằm dưới phần đang xem (trống khi vùng log bám theo cuối log).
+        """
+        self.pending_label.config(text=f"{count} bản ghi bên dưới" if count else "")
+
+    def show_levels(self, level, is_exact):
+        """
+        Chỉ hiển thị các bản ghi đúng cấp độ level (is_exact) hoặc từ level trở lên.
+        """
+        self.view.show_levels(level, is_exact)
+
+    def refresh(self):
+        """
+        Vẽ lại phần log đang xem từ kho log.
+        """
+        self.view.refresh()
+
+    def update_status(self):
+        """
+        Hiển thị số bản ghi log bị bỏ theo cấp độ (trống khi chưa bỏ bản ghi nào) và dòng trạng thái
+        của kho log (số bản ghi, số bản ghi trên đĩa, bộ nhớ); tự lặp lại mỗi giây.
+        """
+        dropped = self.mp_logging.format_dropped()
+        self.dropped_label.config(text=f"Log bị bỏ: {dropped}" if dropped else "")
+        self.status_label.config(text=self.mp_logging.log_store.format_stats())
+        self.after(1000, self.update_status)
     
     def clear_log(self):
         """
-        Xóa toàn bộ nội dung của vùng Text log.
+        Xóa nội dung vùng log: chỉ hiển thị các bản ghi ghi từ lúc này (kho log vẫn giữ toàn bộ để lưu).
         """
-        self.log_text.configure(state="normal")
-        self.log_text.delete("1.0", tk.END)
-        self.log_text.configure(state="disabled")
+        self.view.clear()
 
     def insert_log(self, text):
         """
-        Chèn nội dung log vào vùng Text.
-        Nội dung được thêm vào cuối cùng và cuộn xuống.
+        Ghi nội dung vào log: vùng Text chỉ hiển thị kho log, nên nội dung đi qua logger
+        và hiện ở cuối vùng log.
         """
-        self.log_text.configure(state="normal")
-        self.log_text.insert(tk.END, text + "\n")
-        self.log_text.configure(state="normal")
-        self.log_text.see(tk.END)
+        logger.info(text)
     
     def save_log(self):
         """
         Khi người dùng chọn lưu nhật ký, hãy mở hộp thoại lưu với các tùy chọn loại tệp cho cả
         tệp văn bản (*.txt) và tệp JSON (*.json). Nếu chọn tệp văn bản, thì ghi nội dung
-        của tiện ích văn bản nhật ký. Nếu chọn tệp JSON, hãy sao chép tệp nhật ký tạm thời (chứa
-        các nhật ký được định dạng JSON) vào tên tệp đã chọn.
+        của tiện ích văn bản nhật ký. Nếu chọn tệp JSON (*.json: một mảng JSON, *.jsonl: mỗi dòng
+        một bản ghi, có thể thêm .gz), hãy xuất các đoạn file log JSONL của phiên vào tên tệp đã chọn.
         """
-        import shutil
-        # Open the save dialog with two format choices.
+        # Open the save dialog with the text and JSON format choices.
         path = filedialog.asksaveasfilename(
             title="Lưu Log vào tập tin",
             defaultextension=".log",
-            filetypes=[("Tệp văn bản (*.log) lưu những gì trong hộp văn bản", "*.log"), ("Tệp JSON (*.json) lưu toàn bộ", "*.json")]
+            filetypes=[("Tệp văn bản (*.log) lưu những gì trong hộp văn bản", "*.log"),
+                       ("Tệp JSON (*.json) lưu toàn bộ", "*.json"),
+                       ("Tệp JSON Lines (*.jsonl) lưu toàn bộ", "*.jsonl"),
+                       ("Tệp JSON Lines nén gzip (*.jsonl.gz) lưu toàn bộ", "*.jsonl.gz")]
         )
         if path:
             expl = ""
             try:
-                if path.lower().endswith(".json"):
-                    # For JSON, simply copy the temporary log file,
-                    # which is written in JSON-line format.
-                    shutil.copyfile(self.mp_logging.log_temp_file_path, path)
+                if is_json_export(path):
+                    # For JSON, stream (or simply concatenate) the segments of the JSONL log file.
+                    self.mp_logging.export_log(path)
                     expl = "toàn bộ nội dung trong định dạng JSON"
                 else:
-                    # For .txt, write out the human-readable log text (from the LogText widget).
-                    with open(path, "w", encoding="utf-8") as f:
-                        f.write(self.log_text.get("1.0", tk.END))
+                    # For .txt, write out the human-readable text of the records the filter shows,
+                    # read from the log store (including those spilled to disk).
+                    action_list["write_log_text"](path)
                     expl = "duy nội dung trong hộp văn bản ở định dạng văn bản thường"
                 messagebox.showinfo("Thông báo", f"Log đã được lưu thành công với {expl}")
                 logger.info(f"Log đã được lưu thành công với {expl}")
@@ -304,6 +350,7 @@ class LogText(tk.Frame):
         
         def update_font():
             self.font.configure(family=var.get())
+            self.view.refresh()
             top.destroy()
         tk.Button(top, text="OK", command=update_font).pack(side="left", padx=5, pady=5)
     
@@ -313,6 +360,7 @@ class LogText(tk.Frame):
         """
         current_size = self.font.actual("size")
         self.font.configure(size=current_size + 2)
+        self.view.refresh()
     
     def font_size_down(self):
         """
@@ -321,6 +369,7 @@ class LogText(tk.Frame):
         current_size = self.font.actual("size")
         new_size = current_size - 2 if current_size > 2 else 1
         self.font.configure(size=new_size)
+        self.view.refresh()
     
     def toggle_wrap(self):
         """
@@ -330,3 +379,4 @@ class LogText(tk.Frame):
         current_wrap = self.log_text.cget("wrap")
         new_wrap = "none" if current_wrap == "word" else "word"
         self.log_text.configure(wrap=new_wrap)
+        self.view.refresh()
@@ -0,0 +1,192 @@
+# logview.py
+"""
+Virtualized log view: a Tk Text widget showing a window of the records of the log store
+(mpp_logger.LoggingMultiProcess.log_store, see logstore.LogStore).
+
+The Text widget only ever holds the records that fit on screen (plus one), read by position with
+LogStore.window() for the current level filter; the scrollbar maps to the record position in the
+filter, not to lines of text. Scrolling, a filter change or new records only replace that window,
+so the memory of the widget and the cost of a redraw stay the same whatever the size of the log.
+The records never go through the GUI thread one by one: every interval_ms a tick checks the
+store and, when the view follows the end of the log, shows the newest records.
+
+The text in the widget is ordinary Text content: selecting and copying it, the font, its size and
+the wrap mode work as before; a change of font or wrap only changes how many records fit.
+
+    view = LogView(text_widget, scrollbar, mp_logging.log_store, font)
+    view.show_levels(logging.WARNING, False)    # WARNING and above
+    view.yview("moveto", 0.5)                   # the scrollbar command
+    view.clear()                                # only the records logged from now on
+"""
+import math
+import logging
+
+# Chu kỳ (ms) của nhịp cập nhật: hiển thị các bản ghi mới của kho log.
+LOG_FLUSH_INTERVAL_MS = 75
+# Chỉ số "cuối văn bản" của widget Text (giá trị của tk.END).
+TEXT_END = "end"
+# Số dòng hiển thị ước tính của một bản ghi trước lần vẽ đầu tiên (PrettyFormatter: 7 dòng và 2 dòng trống).
+LINES_PER_RECORD = 9.0
+
+
+def record_tags(levelno, process_name):
+    """
+    The tags of a log block: its level and its process.
+    """
+    return (f"level_{logging.getLevelName(levelno)}", f"process_{process_name}")
+
+
+class LogView:
+    """
+    Shows the window of the log store that fits in text_widget and drives its scrollbar.
+    Created and used in the GUI thread.
+    """
+    def __init__(self, text_widget, scrollbar, store, font, interval_ms=LOG_FLUSH_INTERVAL_MS):
+        self.text_widget = text_widget
+        self.scrollbar = scrollbar
+        self.store = store
+        self.font = font
+        self.interval_ms = interval_ms
+        self.level_filter = (logging.NOTSET, False)  # (cấp độ, chỉ đúng cấp độ) đang hiển thị
+        self.first = 0          # vị trí (trong bộ lọc) của bản ghi đầu cửa sổ
+        self.follow = True      # cửa sổ bám theo bản ghi mới nhất
+        self.floor = 0          # số thứ tự của bản ghi đầu tiên được hiển thị (clear() dời lên cuối kho)
+        self.lines_per_record = LINES_PER_RECORD  # cập nhật sau mỗi lần vẽ
+        # Gọi với số bản ghi nằm dưới cửa sổ khi số này thay đổi (0 khi cửa sổ bám cuối log)
+        self.on_backlog = None
+        self._below = 0
+        self._shown = None      # (số thứ tự đầu, số thứ tự cuối, số bản ghi) của cửa sổ đang vẽ
+        self._first_seq = 0     # số thứ tự bản ghi đầu cửa sổ, giữ vị trí khi đổi bộ lọc
+        self.scrollbar.configure(command=self.yview)
+        # Bánh xe chuột và phím cuộn theo bản ghi thay vì theo dòng của widget
+        self.text_widget.bind("<MouseWheel>", self._on_wheel)
+        self.text_widget.bind("<Button-4>", self._on_wheel)
+        self.text_widget.bind("<Button-5>", self._on_wheel)
+        self.text_widget.bind("<Prior>", lambda event: self._scroll(-1, "pages"))
+        self.text_widget.bind("<Next>", lambda event: self._scroll(1, "pages"))
+        self.text_widget.bind("<Control-Home>", lambda event: self._jump(0))
+        self.text_widget.bind("<Control-End>", lambda event: self._jump(None))
+        self.text_widget.bind("<Configure>", lambda event: self.render())
+        # Nhịp cập nhật chạy trong luồng giao diện (view được tạo trong luồng đó)
+        self.text_widget.after(self.interval_ms, self.tick)
+
+    def page_size(self):
+        """
+        The number of records rendered: those that fit in the height of the widget, plus one.
+        """
+        lines = self.text_widget.winfo_height() // max(1, self.font.metrics("linespace"))
+        return max(1, math.ceil(max(lines, 1) / self.lines_per_record)) + 1
+
+    def _bounds(self):
+        level, is_exact = self.level_filter
+        return self.store.locate(level, is_exact, self.floor), self.store.count(level, is_exact)
+
+    def render(self, force=False):
+        """
+        Shows the window of records at self.first (the last ones when following the end), redrawing
+        the widget only when the window changed, and updates the scrollbar and the backlog.
+        """
+        level, is_exact = self.level_filter
+        base, total = self._bounds()
+        page = self.page_size()
+        limit = max(base, total - page)
+        if self.follow or self.first >= limit:
+            self.first, self.follow = limit, True
+        self.first = max(self.first, base)
+        entries = self.store.window(level, is_exact, self.first, page)
+        shown = (entries[0][0], entries[-1][0], len(entries)) if entries else None
+        if force or shown != self._shown:
+            self._shown = shown
+            self._draw(entries)
+        if entries:
+            self._first_seq = entries[0][0]
+        count = total - base
+        if count:
+            self.scrollbar.set((self.first - base) / count, (self.first - base + len(entries)) / count)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        below = 0 if self.follow else total - self.first - len(entries)
+        if below != self._below:
+            self._below = below
+            if self.on_backlog is not None:
+                self.on_backlog(below)
+
+    def _draw(self, entries):
+        chunks = []
+        for seq, text, levelno, process_name in entries:
+            chunks += (text + "\n", record_tags(levelno, process_name))
+        self.text_widget.configure(state="normal")
+        self.text_widget.delete("1.0", TEXT_END)
+        if chunks:
+            self.text_widget.insert(TEXT_END, *chunks)
+        self.text_widget.configure(state="disabled")
+        self.text_widget.yview(TEXT_END if self.follow else "1.0")
+        lines = self.text_widget.count("1.0", TEXT_END, "displaylines")
+        if isinstance(lines, tuple):
+            lines = lines[0]
+        if lines and entries:
+            self.lines_per_record = max(1.0, lines / len(entries))
+
+    def tick(self):
+        """
+        Shows the records added since the last tick, then schedules itself again after interval_ms.
+        """
+        try:
+            self.render()
+        finally:
+            self.text_widget.after(self.interval_ms, self.tick)
+
+    def refresh(self):
+        """
+        Draws the window again, e.g. after a change of font or wrap mode.
+        """
+        self.render(force=True)
+
+    def yview(self, *args):
+        """
+        The scrollbar command: ("moveto", fraction) or ("scroll", n, "units" | "pages"), a unit
+        being one record.
+        """
+        if args[0] == "moveto":
+            base, total = self._bounds()
+            self._jump(base + int(float(args[1]) * (total - base)))
+        elif args[0] == "scroll":
+            self._scroll(int(args[1]), args[2])
+
+    def _scroll(self, count, what="units"):
+        step = max(1, self.page_size() - 1) if what == "pages" else 1
+        self._jump(self.first + count * step)
+        return "break"
+
+    def _jump(self, first):
+        """
+        Moves the window to position first in the filter (None for the end of the log).
+        """
+        if first is None:
+            self.follow = True
+        else:
+            self.first, self.follow = max(first, 0), False
+        self.render()
+        return "break"
+
+    def _on_wheel(self, event):
+        up = event.num == 4 or getattr(event, "delta", 0) > 0
+        return self._scroll(-1 if up else 1)
+
+    def show_levels(self, level, is_exact):
+        """
+        Shows the records at level (exactly with is_exact, otherwise at and above), keeping the
+        window on the record that was at its top (or on the end of the log when following it).
+        """
+        self.level_filter = (level, is_exact)
+        if not self.follow:
+            self.first = self.store.locate(level, is_exact, self._first_seq)
+        self.render()
+
+    def clear(self):
+        """
+        Empties the view: only the records added from now on are shown (the store keeps the others).
+        """
+        self.floor = len(self.store)
+        self.first, self.follow = 0, True
+        self.render()
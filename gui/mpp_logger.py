@@ -9,8 +9,8 @@ Các thành phần chính:
 1. LOG_LEVELS: 
    Dictionary định nghĩa mức độ log tiêu chuẩn theo module logging của Python.
 
-2. TextHandler:
-   Logging handler tùy chỉnh để hiển thị thông điệp log trực tiếp lên widget Text trong giao diện Tkinter.
+2. Hiển thị log trên giao diện Tkinter:
+   Không qua handler nào: logview.LogView đọc thẳng cửa sổ đang xem từ kho log (log_store).
 
 3. DynamicLevelFilter:
    Lọc thông điệp log dựa trên mức độ log đã thiết lập (cho phép hiển thị từ mức log đó trở lên hoặc chính xác mức log đó).
@@ -19,20 +19,25 @@ Các thành phần chính:
    Lọc thông điệp log chính xác bằng mức độ log được chỉ định.
 
 5. JsonFormatter:
-   Định dạng thông điệp log thành dạng JSON, hữu ích khi lưu log ra file.
+   Định dạng thông điệp log thành một dòng JSON gọn, ghi ra file log JSONL (logfile.JsonlFileHandler:
+   xoay vòng theo dung lượng, có thể nén gzip/zstd, xuất nhanh bằng export_log).
 
 6. PrettyFormatter:
    Định dạng thông điệp log thân thiện với người dùng, dễ đọc trên terminal hoặc giao diện GUI.
 
 7. MemoryLogHandler:
-   Lưu trữ các bản ghi log trong bộ nhớ (danh sách nội bộ), có thể được truy xuất hoặc xuất ra file khi cần thiết.
+   Lưu trữ các bản ghi log vào kho log gọn, có giới hạn bộ nhớ (logstore.LogStore), chuyển bản ghi cũ ra đĩa khi đầy.
 
-8. LoggingMultiProcess:
-   - Điều khiển hệ thống logging đa tiến trình, sử dụng Queue để quản lý việc ghi log.
+8. LogChannel, BoundedQueueHandler, ChannelListener:
+   Kênh log có giới hạn (multiprocessing.Queue, không qua Manager) cho mỗi tiến trình ghi log,
+   với chính sách khi đầy (block, drop_debug, sample) và bộ đếm bản ghi bị bỏ theo mức.
+
+9. LoggingMultiProcess:
+   - Điều khiển hệ thống logging đa tiến trình, mỗi tiến trình một LogChannel tới các handler chung.
    - Tự động quản lý file log tạm thời.
    - Hỗ trợ cập nhật mức độ log động theo nhu cầu người dùng.
 
-9. get_mp_logger():
+10. get_mp_logger():
    Hàm singleton toàn cục, trả về một instance duy nhất của LoggingMultiProcess để sử dụng trên toàn ứng dụng.
 
 Hướng dẫn sử dụng:
@@ -48,23 +53,25 @@ Hướng dẫn sử dụng:
 
 - Tích hợp với giao diện Tkinter:
 
-    text_widget = tk.Text(root)
-    text_handler = TextHandler(text_widget)
-    text_handler.setFormatter(PrettyFormatter())
-    get_mp_logger().logger.addHandler(text_handler)
+    mp_logging = get_mp_logger()
+    view = LogView(text_widget, scrollbar, mp_logging.log_store, font)   # logview.py
 
 - Khi kết thúc ứng dụng:
 
     get_mp_logger().shutdown()
 """
 
-import tkinter as tk
+import os
+import queue
 import logging
 import sys
 import tempfile
+import multiprocessing
 from multiprocessing import Manager
 from logging.handlers import QueueHandler, QueueListener
 from gv import create_log_record
+from logstore import LogStore, LOG_STORE_MAX_BYTES
+from logfile import JsonlFileHandler, LOG_FILE_COMPRESSION
 import json
 
 
@@ -85,30 +92,19 @@ def get_log_level_name(log_value: int):
             return name    
     raise RuntimeError(f'Unable to obtain the log level from value:{log_value}')
 
-# Lớp TextHandler để xử lý ghi log vào widget Text của Tkinter.
-class TextHandler(logging.Handler):
-    def __init__(self, text_widget):
-        super().__init__()
-        self.text_widget = text_widget
-        self.is_gui_handler = True  # Đánh dấu đây là handler dùng cho giao diện
-
-    def emit(self, record):
-        try:
-            # Gọi hàm format để định dạng bản ghi log theo định dạng của PrettyFormatter hay tương tự,
-            # sau đó thêm dấu xuống dòng.
-            msg = self.format(record) + "\n"
-            # Dùng phương thức after của widget để chèn log vào Text một cách bất đồng bộ.
-            self.text_widget.after(0, self.append, msg)
-        except Exception:
-            self.handleError(record)
-
-    def append(self, msg):
-        # Cho phép chỉnh sửa widget, chèn thông điệp log, sau đó khóa lại widget và cuộn xuống cuối.
-        self.text_widget.configure(state="normal")
-        self.text_widget.insert(tk.END, msg)
-        self.text_widget.configure(state="disabled")
-        self.text_widget.yview(tk.END)
-
+# Số bản ghi tối đa đang trên đường đi của mỗi kênh log (chưa được listener lấy ra).
+LOG_QUEUE_SIZE = int(os.environ.get("VBA_PYTHON_LOG_QUEUE_SIZE", "10000"))
+# Chính sách khi kênh log đầy (xem LogChannel); đổi bằng biến môi trường VBA_PYTHON_LOG_OVERFLOW.
+OVERFLOW_POLICIES = ("block", "drop_debug", "sample")
+LOG_OVERFLOW = os.environ.get("VBA_PYTHON_LOG_OVERFLOW", "drop_debug")
+# Thời gian chờ tối đa (giây) của một lệnh log khi kênh đầy, trước khi bỏ bản ghi.
+LOG_BLOCK_TIMEOUT = 5.0
+# Mức lấp đầy (tỉ lệ dung lượng) từ đó bản ghi dưới WARNING bị bỏ hoặc lấy mẫu.
+LOG_HIGH_WATER = 0.8
+# Chế độ "sample": giữ 1 trên LOG_SAMPLE_RATE bản ghi dưới WARNING khi kênh vượt mức trên.
+LOG_SAMPLE_RATE = 10
+# Các mức của bộ đếm bản ghi bị bỏ (LoggingMultiProcess.dropped_counts).
+DROP_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
 
 # -------------------------------------------------------------------------------
 # Định nghĩa lớp DynamicLevelFilter: lọc bản ghi log dựa trên mức log và cờ is_exact.
@@ -142,18 +138,18 @@ class ExactLevelFilter(logging.Filter):
         return record.levelno == self.level
 
 # -------------------------------------------------------------------------------
-# JsonFormatter: Định dạng bản ghi log thành chuỗi JSON (dành cho việc ghi vào file).
+# JsonFormatter: Định dạng bản ghi log thành chuỗi JSON một dòng (dành cho việc ghi vào file JSONL).
 # Các khóa trong JSON sẽ được xuất dưới dạng ASCII (không dấu), bật/tắt with_diacritics, 
 # nhằm tránh các vấn đề mã hóa.
 # -------------------------------------------------------------------------------
 class JsonFormatter(logging.Formatter):
     def format(self, record):
-        record.message = record.msg  
+        record.message = record.getMessage()
         record.asctime = self.formatTime(record, self.datefmt)
         # Create the log dictionary with non-diacritic keys.
         log_record = create_log_record(record, with_diacritics=True)
-        # Use json.dumps to convert the dictionary to a JSON-formatted string.
-        return json.dumps(log_record, indent=4, ensure_ascii=False)
+        # Use json.dumps to convert the dictionary to a compact, single-line JSON string.
+        return json.dumps(log_record, ensure_ascii=False, separators=(",", ":"), default=str)
 
 # -------------------------------------------------------------------------------
 # PrettyFormatter: Định dạng bản ghi log theo kiểu “dễ đọc” (human-friendly)
@@ -162,7 +158,7 @@ class JsonFormatter(logging.Formatter):
 # -------------------------------------------------------------------------------
 class PrettyFormatter(logging.Formatter):
     def format(self, record):
-        record.message = record.msg  
+        record.message = record.getMessage()
         record.asctime = self.formatTime(record, self.datefmt)
         # Create the log dictionary with diacritics.
         log_record = create_log_record(record, with_diacritics=True)
@@ -173,12 +169,12 @@ class PrettyFormatter(logging.Formatter):
 
 # -------------------------------------------------------------------------------
 # MemoryLogHandler: Handler tùy chỉnh lưu trữ mỗi bản ghi log
-# vào danh sách nội bộ (log_store) để sau này có thể xuất ra file nếu cần.
+# vào kho log (log_store, một logstore.LogStore) để sau này có thể hiển thị lại hoặc xuất ra file.
 # -------------------------------------------------------------------------------
 class MemoryLogHandler(logging.Handler):
     def __init__(self, log_store):
         super().__init__()
-        self.log_store = log_store  # log_store là một danh sách lưu trữ các bản ghi log dạng dict
+        self.log_store = log_store  # log_store là logstore.LogStore (hoặc danh sách) lưu các bản ghi log
 
     def emit(self, record):
         try:
@@ -196,38 +192,141 @@ class MemoryLogHandler(logging.Handler):
     #     except Exception:
     #         self.handleError(record)
 
+# -------------------------------------------------------------------------------
+# LogChannel: kênh log có giới hạn từ một tiến trình ghi log tới tiến trình chính.
+# -------------------------------------------------------------------------------
+class LogChannel:
+    """
+    Bounded log transport from one writing process to the listener of the main process: a plain
+    multiprocessing.Queue (records are pickled into a pipe by a feeder thread, without the round
+    trip through the Manager server) holding at most maxsize records in flight.
+
+    Each process gets its own channel (LoggingMultiProcess.open_channel), so a worker killed in
+    the middle of a write can only break its own pipe, never the log of the other processes.
+
+    When the channel is full, or past the high-water mark, the overflow policy decides:
+        block       wait up to block_timeout seconds for room, then drop the record
+        drop_debug  drop DEBUG past the high-water mark and DEBUG/INFO when full;
+                    WARNING and above wait like "block"
+        sample      like drop_debug, but past the high-water mark keep one DEBUG/INFO
+                    record in sample_rate instead of dropping them all
+
+    Dropped records are counted per level (DROP_LEVELS) in dropped, an array shared by every channel.
+    """
+    def __init__(self, dropped, maxsize=LOG_QUEUE_SIZE, policy=LOG_OVERFLOW,
+                 block_timeout=LOG_BLOCK_TIMEOUT, high_water=LOG_HIGH_WATER, sample_rate=LOG_SAMPLE_RATE):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Chính sách khi kênh log đầy không hợp lệ: {policy} "
+                             f"(chọn một trong {', '.join(OVERFLOW_POLICIES)})")
+        self.queue = multiprocessing.Queue(maxsize)
+        self.dropped = dropped
+        self.maxsize = maxsize
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.high_water = max(1, int(maxsize * high_water))
+        self.sample_rate = max(1, sample_rate)
+        self._sampled = 0   # bộ đếm lấy mẫu, riêng cho tiến trình ghi log
+
+    def _backlog(self):
+        try:
+            return self.queue.qsize()
+        except NotImplementedError:
+            # macOS không có sem_getvalue: chỉ còn giới hạn cứng của hàng đợi.
+            return 0
+
+    def _drop(self, record):
+        index = min(max(record.levelno // 10 - 1, 0), len(DROP_LEVELS) - 1)
+        with self.dropped.get_lock():
+            self.dropped[index] += 1
+        return False
+
+    def put(self, record):
+        """
+        Queues record according to the overflow policy. Returns False if it was dropped.
+        """
+        if self.policy != "block" and record.levelno < logging.WARNING:
+            if self._backlog() >= self.high_water:
+                if self.policy == "drop_debug" and record.levelno < logging.INFO:
+                    return self._drop(record)
+                if self.policy == "sample":
+                    self._sampled += 1
+                    if self._sampled % self.sample_rate:
+                        return self._drop(record)
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                return self._drop(record)
+            return True
+        try:
+            self.queue.put(record, timeout=self.block_timeout)
+        except queue.Full:
+            return self._drop(record)
+        return True
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    QueueHandler writing to a LogChannel, so a full channel applies its overflow policy.
+    """
+    def __init__(self, channel):
+        super().__init__(channel.queue)
+        self.channel = channel
+
+    def enqueue(self, record):
+        self.channel.put(record)
+
+
+class ChannelListener(QueueListener):
+    """
+    QueueListener of one LogChannel. Every listener of a LoggingMultiProcess shares the same
+    handlers list, so a handler added later (GUI) receives the records of every process.
+    A channel broken by a killed writer ends its listener instead of raising.
+    """
+    def dequeue(self, block):
+        try:
+            return self.queue.get(block)
+        except Exception:
+            return self._sentinel
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel, timeout=LOG_BLOCK_TIMEOUT)
+
 # -------------------------------------------------------------------------------
 # LoggingMultiProcess: Lớp bao bọc cấu hình logging đa tiến trình
 #
 # Chức năng:
-#   - Tạo Manager và hàng đợi (queue) chia sẻ giữa các tiến trình.
+#   - Tạo Manager (mức log chia sẻ, hàng đợi công việc của scheduler) và các kênh log
+#     có giới hạn (LogChannel) cho từng tiến trình.
 #   - Thiết lập mức log chia sẻ (log_level) dùng cho giao diện.
-#   - Tạo file log tạm (temporary file) để ghi log bằng định dạng JSON.
+#   - Tạo thư mục log tạm: các đoạn file log JSONL (logfile.JsonlFileHandler) và tệp tràn của kho log.
 #   - Cài đặt các formatter:
 #         + PrettyFormatter để hiển thị cho terminal và giao diện.
-#         + JsonFormatter để ghi log ra file (dạng JSON).
+#         + JsonFormatter để ghi log ra file (mỗi dòng một bản ghi JSON).
 #   - Tạo các handler:
 #         + Terminal handler (StreamHandler) sử dụng PrettyFormatter.
-#         + File handler (FileHandler) sử dụng JsonFormatter.
-#         + QueueHandler để gửi log vào hàng đợi.
+#         + File handler (JsonlFileHandler) sử dụng JsonFormatter.
+#         + BoundedQueueHandler để gửi log vào kênh của tiến trình chính.
 #         + MemoryLogHandler để lưu các bản ghi log vào log_store.
-#   - Thiết lập QueueListener để lắng nghe hàng đợi và chuyển log đến terminal và file.
+#   - Mỗi kênh có một ChannelListener chuyển log đến các handler chung (terminal, file, bộ nhớ, GUI).
 #   - Cung cấp phương thức select_log_level để cập nhật mức log và bộ lọc của các handler.
 # -------------------------------------------------------------------------------
 class LoggingMultiProcess:
     MAIN_LOGGER = "main_logger"
 
-    def __init__(self):
-        # Tạo Manager và hàng đợi chia sẻ cho log
+    def __init__(self, queue_size=LOG_QUEUE_SIZE, overflow=LOG_OVERFLOW, store_max_bytes=LOG_STORE_MAX_BYTES,
+                 file_compression=LOG_FILE_COMPRESSION):
+        # Manager dùng cho mức log chia sẻ và các hàng đợi công việc; bản ghi log đi qua các LogChannel.
         self.manager = Manager()
-        self.queue = self.manager.Queue()
+        self.queue_size = queue_size
+        self.overflow = overflow
+        # Bộ đếm bản ghi bị bỏ theo mức (DROP_LEVELS), chung cho mọi kênh
+        self.dropped = multiprocessing.Array('q', len(DROP_LEVELS))
+        self._listeners = {}    # LogChannel -> ChannelListener
         # Mức log chia sẻ dùng cho giao diện (mặc định là DEBUG)
         self.log_level = self.manager.Value('i', logging.DEBUG)
 
-        # Tạo file tạm để ghi log ra file (dạng JSON)
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".log")
-        self.log_temp_file_path = temp_file.name
-        temp_file.close()
+        # Thư mục tạm của phiên: các đoạn file log JSONL và các tệp tràn của kho log
+        self.log_dir = tempfile.mkdtemp(prefix="vba_python_log_")
 
         # Tạo các formatter:
         self.pretty_formatter = PrettyFormatter(datefmt="%Y-%m-%dT%H:%M:%S%z")
@@ -237,30 +336,100 @@ class LoggingMultiProcess:
         terminal_handler = logging.StreamHandler(sys.stdout)
         terminal_handler.setFormatter(self.pretty_formatter)
 
-        # Tạo file handler ghi log ra file sử dụng JsonFormatter (mỗi dòng là JSON dictionary)
-        file_handler = logging.FileHandler(self.log_temp_file_path, mode="w", encoding="utf-8")
+        # Tạo file handler ghi log ra file sử dụng JsonFormatter (mỗi dòng là JSON dictionary),
+        # chia thành các đoạn theo dung lượng và có thể nén
+        file_handler = JsonlFileHandler(os.path.join(self.log_dir, "log.jsonl"), file_compression)
         file_handler.setFormatter(self.json_formatter)
+        self.file_handler = file_handler
 
-        # Danh sách nội bộ để lưu trữ các bản ghi log dưới dạng dict (sau khi định dạng JSON)
-        self.log_store = []
+        # Kho log gọn, có giới hạn bộ nhớ; bản ghi cũ được chuyển ra tệp .spill.jsonl trong thư mục log tạm
+        # (văn bản của mỗi bản ghi được định dạng sẵn bằng pretty_formatter để tải lại vùng log tức thì)
+        self.log_store = LogStore(os.path.join(self.log_dir, "store.spill.jsonl"), store_max_bytes,
+                                  formatter=self.pretty_formatter)
 
         # Tạo logger toàn cục với tên cố định MAIN_LOGGER
         self.logger = logging.getLogger(LoggingMultiProcess.MAIN_LOGGER)
         # Đặt mức logger là DEBUG để ghi nhận tất cả các bản ghi; bộ lọc sẽ kiểm soát hiển thị cho giao diện.
         self.logger.setLevel(logging.DEBUG)
-        # Gắn QueueHandler để gửi các bản ghi log vào hàng đợi chia sẻ
-        safe_handler = self.get_worker_handler(self.queue)
-        self.logger.addHandler(safe_handler)
-        # Gắn MemoryLogHandler để lưu các bản ghi log (theo định dạng JSON) vào log_store
+        # MemoryLogHandler lưu các bản ghi log vào log_store (chỉ qua listener: mỗi bản ghi được lưu một lần)
         memory_handler = MemoryLogHandler(self.log_store)
-        self.logger.addHandler(memory_handler)
-        # (Lưu ý: Việc xuất log ra terminal và file được xử lý thông qua QueueListener.
-        #  Handler dành cho GUI sẽ được thêm sau trong module GUI.)
+        # Các handler nhận bản ghi từ mọi kênh (danh sách dùng chung của các ChannelListener)
+        self.handlers = [terminal_handler, file_handler, memory_handler]
+
+        # Kênh log của tiến trình chính; các worker nhận kênh riêng qua open_channel()
+        self.transport = self.open_channel()
+        self.queue = self.transport.queue
+        self.listener = self._listeners[self.transport]
+        # Gắn handler gửi các bản ghi log vào kênh
+        safe_handler = self.get_worker_handler(self.transport)
+        self.logger.addHandler(safe_handler)
+        # (Lưu ý: Việc xuất log ra terminal và file được xử lý thông qua các ChannelListener.
+        #  Giao diện không cần handler: logview.LogView đọc thẳng từ log_store.)
+        print("Temporary log directory:", self.log_dir)
 
-        # Thiết lập QueueListener để lắng nghe hàng đợi và gửi log đến terminal và file
-        self.listener = QueueListener(self.queue, terminal_handler, file_handler, memory_handler)
-        self.listener.start()
-        print("Temporary log file:", self.log_temp_file_path)
+    def open_channel(self):
+        """
+        Creates a LogChannel for one writing process and starts its listener.
+        The channel is passed to the process as a Process argument (see workerpool.WorkerPool.spawn).
+        """
+        channel = LogChannel(self.dropped, self.queue_size, self.overflow)
+        listener = ChannelListener(channel.queue)
+        listener.handlers = self.handlers
+        listener.start()
+        self._listeners[channel] = listener
+        return channel
+
+    def close_channel(self, channel, abandon=False):
+        """
+        Stops the listener of channel once the records already sent are handled. With abandon
+        (writer killed, its pipe possibly cut in the middle of a record) the listener is told to
+        stop but not waited for; its daemon thread ends with the process if the pipe is broken.
+        """
+        listener = self._listeners.pop(channel, None)
+        if listener is None:
+            return
+        try:
+            listener.enqueue_sentinel()
+        except (queue.Full, OSError, ValueError):
+            abandon = True
+        if abandon:
+            return
+        listener._thread.join(timeout=LOG_BLOCK_TIMEOUT)
+        listener._thread = None
+        channel.queue.close()
+
+    @property
+    def log_temp_file_path(self):
+        """
+        The segment of the file log being written (all of them: file_handler.segments).
+        """
+        return self.file_handler.segments[-1]
+
+    def export_log(self, path):
+        """
+        Writes the JSON log of the session to path: .json (one array), .jsonl, optionally with
+        .gz / .zst (see logfile.JsonlFileHandler.export).
+        """
+        self.file_handler.export(path)
+
+    def add_handler(self, handler):
+        """
+        Adds a handler that receives the records of every channel.
+        """
+        self.handlers.append(handler)
+
+    def dropped_counts(self):
+        """
+        Records dropped by the overflow policy so far, per level: {"DEBUG": n, ...}.
+        """
+        with self.dropped.get_lock():
+            return dict(zip(DROP_LEVELS, self.dropped[:]))
+
+    def format_dropped(self):
+        """
+        The non-zero dropped counts as text ("DEBUG 120, INFO 3"), or "" if nothing was dropped.
+        """
+        return ", ".join(f"{name} {count}" for name, count in self.dropped_counts().items() if count)
 
 
     def select_log_level(self, new_level):
@@ -277,33 +446,37 @@ class LoggingMultiProcess:
             filt = DynamicLevelFilter(new_level, False)
             filt.is_dynamic = True  # mark it so we can detect it later
             handler.addFilter(filt)
-        # Update filters for the handlers in the QueueListener (terminal and file output)
-        for handler in self.listener.handlers:
+        # Update filters for the handlers of the channel listeners (terminal and file output)
+        for handler in self.handlers:
             handler.filters = [f for f in handler.filters if not hasattr(f, "is_dynamic")]
             filt = DynamicLevelFilter(new_level, False)
             filt.is_dynamic = True
             handler.addFilter(filt)
 
     @classmethod
-    def get_worker_handler(cls, queue):
+    def get_worker_handler(cls, channel):
         """
-        Trả về một instance mới của QueueHandler sử dụng hàng đợi được cung cấp.
-        Ở đây sử dụng PrettyFormatter để định dạng bản ghi cho các output (terminal, GUI).
+        Trả về một handler mới gửi bản ghi vào kênh được cung cấp (LogChannel, theo chính sách khi đầy).
+        Một hàng đợi thông thường vẫn được chấp nhận (QueueHandler, không giới hạn).
         """
-        handler = QueueHandler(queue)
-        return handler
+        if isinstance(channel, LogChannel):
+            return BoundedQueueHandler(channel)
+        return QueueHandler(channel)
 
     def shutdown(self):
         """
-        Tắt QueueListener và shutdown Manager để giải phóng các tài nguyên.
+        Tắt các ChannelListener và shutdown Manager để giải phóng các tài nguyên.
         """
-        if self.listener:
+        for channel in list(self._listeners):
             try:
-                self.listener.stop()
+                self.close_channel(channel)
             except BrokenPipeError:
                 pass
             except Exception as e:
                 print("Error stopping QueueListener:", e)
+        # Kết thúc đoạn file log đang ghi (luồng nén được đóng đầy đủ); các đoạn ở lại trong log_dir
+        self.file_handler.close()
+        self.log_store.close()
         if self.manager:
             self.manager.shutdown()
 
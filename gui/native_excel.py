@@ -0,0 +1,1020 @@
+# native_excel.py
+"""
+In-process Excel backend ("native") for worker.process_excel_file: workbooks are loaded with
+openpyxl and .bas macros are run by the VBA subset interpreter of vba_interp.py, so no Excel, COM
+or Windows is needed.
+
+NativeExcel mimics the part of the Excel COM object used by worker.process_excel_file
+(Workbooks.Open, VBProject.VBComponents.Import, Application.Run, Save, Close, Quit), and is at the
+same time the VBA "Application" object seen by the macros. The object model available to macros:
+
+    Application  WorksheetFunction, ThisWorkbook / ActiveWorkbook, ActiveSheet, Worksheets / Sheets,
+                 Cells, Range, Rows, Columns, ScreenUpdating, DisplayAlerts, Calculation, EnableEvents
+    Workbook     Worksheets / Sheets (by name or 1-based index, Count, For Each), ActiveSheet, Name,
+                 FullName, Path
+    Worksheet    Name, Index, Cells, Range("A1"), Range("A1:B2"), Range(cell1, cell2), Rows, Columns
+                 (.Count, (n)), UsedRange, ChartObjects, Activate, Select
+    Range        Value / Value2, Formula, Text, NumberFormat, Row, Column, Count, Address, Rows / Columns,
+                 Cells(r, c), Offset, Resize, End(xlUp / xlDown / xlToLeft / xlToRight),
+                 Left / Top / Width / Height, Font.Bold / Italic / Size, ClearContents, For Each
+    WorksheetFunction  Sum, Max, Min, Average, Count, CountA (numbers and ranges)
+    ChartObjects.Add(Left, Top, Width, Height).Chart: ChartType (column, bar, line, pie), SetSourceData,
+                 SeriesCollection(n).XValues / Values / Name, HasTitle, ChartTitle.Text, HasLegend
+
+Limitations: formulas are not evaluated (reading a formula cell gives the value cached in the file
+by Excel when it was last saved), and openpyxl does not keep the existing charts and images of a
+workbook, so files with charts should stay on the COM backend. .xls files cannot be opened.
+"""
+import os
+import copy
+import logging
+
+try:
+    import openpyxl
+    from openpyxl.utils.cell import range_boundaries, column_index_from_string, get_column_letter
+except ImportError:
+    openpyxl = None
+
+import vba_interp
+from vba_interp import VBARuntimeError, VBAArray, to_value, to_number
+from mpp_logger import LoggingMultiProcess
+
+logger = logging.getLogger(LoggingMultiProcess.MAIN_LOGGER)
+
+# Kích thước trang tính của Excel.
+MAX_ROWS = 1048576
+MAX_COLUMNS = 16384
+# Kích thước mặc định của ô (điểm): cột rộng 8.43 ký tự, dòng cao 15 điểm.
+DEFAULT_COLUMN_WIDTH = 8.43
+DEFAULT_ROW_HEIGHT = 15.0
+
+XL_UP, XL_DOWN, XL_TO_LEFT, XL_TO_RIGHT = -4162, -4121, -4159, -4161
+XL_COLUMN_CLUSTERED, XL_COLUMN_STACKED, XL_BAR_CLUSTERED, XL_LINE, XL_PIE = 51, 52, 57, 4, 5
+
+# Hằng số Excel dùng trong macro.
+XL_CONSTANTS = {
+    "xlup": XL_UP, "xldown": XL_DOWN, "xltoleft": XL_TO_LEFT, "xltoright": XL_TO_RIGHT,
+    "xlcolumnclustered": XL_COLUMN_CLUSTERED, "xlcolumnstacked": XL_COLUMN_STACKED,
+    "xlbarclustered": XL_BAR_CLUSTERED, "xlline": XL_LINE, "xlpie": XL_PIE,
+    "xlrows": 1, "xlcolumns": 2,
+    "xlcalculationautomatic": -4105, "xlcalculationmanual": -4135,
+    "xlvalues": -4163, "xlformulas": -4123, "xlpart": 2, "xlwhole": 1,
+}
+
+# Hướng di chuyển của Range.End: (dòng, cột).
+END_DIRECTIONS = {XL_UP: (-1, 0), XL_DOWN: (1, 0), XL_TO_LEFT: (0, -1), XL_TO_RIGHT: (0, 1)}
+
+
+def _is_empty(value):
+    return value is None or value == ""
+
+
+def _column_width_points(width):
+    # Độ rộng cột (ký tự) -> điểm, như Excel với phông mặc định (7 pixel mỗi ký tự, 0.75 điểm mỗi pixel).
+    return (int(width * 7 + 0.5) + 5) * 0.75
+
+
+class WorksheetFunction:
+    """
+    Application.WorksheetFunction: aggregates over numbers and ranges.
+    """
+    vba_type_name = "WorksheetFunction"
+
+    @staticmethod
+    def _values(args):
+        for arg in args:
+            if isinstance(arg, Range):
+                for value in arg.iter_values():
+                    yield value, True
+            elif isinstance(arg, VBAArray):
+                for value in arg.vba_iter():
+                    yield value, True
+            else:
+                yield to_value(arg), False
+
+    def _numbers(self, args):
+        # Như Excel: trong vùng ô chỉ tính các số; tham số trực tiếp được chuyển sang số.
+        numbers = []
+        for value, from_range in self._values(args):
+            if from_range:
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    numbers.append(value)
+            elif value is not None:
+                numbers.append(to_number(value))
+        return numbers
+
+    def call_sum(self, *args):
+        return sum(self._numbers(args))
+
+    def call_max(self, *args):
+        numbers = self._numbers(args)
+        return max(numbers) if numbers else 0
+
+    def call_min(self, *args):
+        numbers = self._numbers(args)
+        return min(numbers) if numbers else 0
+
+    def call_average(self, *args):
+        numbers = self._numbers(args)
+        if not numbers:
+            raise VBARuntimeError("WorksheetFunction.Average: không có số nào (#DIV/0!)")
+        return sum(numbers) / len(numbers)
+
+    def call_count(self, *args):
+        return len(self._numbers(args))
+
+    def call_counta(self, *args):
+        return sum(1 for value, _ in self._values(args) if not _is_empty(value))
+
+
+class Font:
+    vba_type_name = "Font"
+
+    def __init__(self, rng):
+        self.range = rng
+
+    def _get(self, attr):
+        return getattr(self.range.sheet.cell(self.range.row1, self.range.col1).font, attr)
+
+    def _set(self, attr, value):
+        self.range.sheet.book.dirty = True
+        for cell in self.range.iter_cells():
+            font = copy.copy(cell.font)
+            setattr(font, attr, value)
+            cell.font = font
+
+    def get_bold(self):
+        return bool(self._get("b"))
+
+    def set_bold(self, value):
+        self._set("b", vba_interp.to_bool(value))
+
+    def get_italic(self):
+        return bool(self._get("i"))
+
+    def set_italic(self, value):
+        self._set("i", vba_interp.to_bool(value))
+
+    def get_size(self):
+        return self._get("sz")
+
+    def set_size(self, value):
+        self._set("sz", to_number(value))
+
+
+class Range:
+    """
+    Rectangular block of cells of a Sheet (1-based, inclusive bounds).
+    """
+    vba_type_name = "Range"
+
+    def __init__(self, sheet, row1, col1, row2=None, col2=None):
+        row2 = row1 if row2 is None else row2
+        col2 = col1 if col2 is None else col2
+        self.sheet = sheet
+        self.row1, self.row2 = min(row1, row2), max(row1, row2)
+        self.col1, self.col2 = min(col1, col2), max(col1, col2)
+        if self.row1 < 1 or self.col1 < 1 or self.row2 > MAX_ROWS or self.col2 > MAX_COLUMNS:
+            raise VBARuntimeError("Vùng ô nằm ngoài trang tính")
+
+    @property
+    def rows(self):
+        return self.row2 - self.row1 + 1
+
+    @property
+    def columns(self):
+        return self.col2 - self.col1 + 1
+
+    def iter_cells(self):
+        for r in range(self.row1, self.row2 + 1):
+            for c in range(self.col1, self.col2 + 1):
+                yield self.sheet.cell(r, c)
+
+    def iter_values(self):
+        # Chỉ duyệt phần vùng nằm trong dữ liệu của trang tính (phần ngoài là ô trống).
+        for r in range(self.row1, min(self.row2, self.sheet.max_row) + 1):
+            for c in range(self.col1, min(self.col2, self.sheet.max_column) + 1):
+                yield self.sheet.read(r, c)
+
+    def vba_iter(self):
+        for r in range(self.row1, self.row2 + 1):
+            for c in range(self.col1, self.col2 + 1):
+                yield Range(self.sheet, r, c)
+
+    def call_default(self, row, column=None):
+        return self.call_cells(row, column)
+
+    # -- Giá trị ----------------------------------------------------------------
+
+    def get_value(self):
+        if self.rows == 1 and self.columns == 1:
+            return self.sheet.read(self.row1, self.col1)
+        return VBAArray([[self.sheet.read(r, c) for c in range(self.col1, self.col2 + 1)]
+                         for r in range(self.row1, self.row2 + 1)])
+
+    def set_value(self, value):
+        value = to_value(value)
+        if isinstance(value, VBAArray):
+            value = value.rows
+        if isinstance(value, (list, tuple)):
+            for i, row in enumerate(value[:self.rows]):
+                for j, item in enumerate(row[:self.columns]):
+                    self.sheet.write(self.row1 + i, self.col1 + j, item)
+            return
+        for r in range(self.row1, self.row2 + 1):
+            for c in range(self.col1, self.col2 + 1):
+                self.sheet.write(r, c, value)
+
+    get_value2 = get_value
+    set_value2 = set_value
+
+    @property
+    def Value(self):
+        # Range.Value kiểu COM (bulk_range): một giá trị, hoặc tuple các dòng.
+        value = self.get_value()
+        return tuple(tuple(row) for row in value.rows) if isinstance(value, VBAArray) else value
+
+    @Value.setter
+    def Value(self, value):
+        self.set_value(value)
+
+    def get_formula(self):
+        value = self.sheet.cell(self.row1, self.col1).value
+        return "" if value is None else vba_interp.to_str(value)
+
+    def set_formula(self, value):
+        self.set_value(vba_interp.to_str(value))
+
+    def get_text(self):
+        return vba_interp.to_str(self.sheet.read(self.row1, self.col1))
+
+    def get_numberformat(self):
+        return self.sheet.cell(self.row1, self.col1).number_format
+
+    def set_numberformat(self, value):
+        value = vba_interp.to_str(value)
+        self.sheet.book.dirty = True
+        for cell in self.iter_cells():
+            cell.number_format = value
+
+    def call_clearcontents(self):
+        for r in range(self.row1, min(self.row2, self.sheet.max_row) + 1):
+            for c in range(self.col1, min(self.col2, self.sheet.max_column) + 1):
+                self.sheet.write(r, c, None)
+
+    def get_font(self):
+        return Font(self)
+
+    # -- Vị trí ----------------------------------------------------------------
+
+    def get_row(self):
+        return self.row1
+
+    def get_column(self):
+        return self.col1
+
+    def get_count(self):
+        return self.rows * self.columns
+
+    def get_address(self):
+        first = f"${get_column_letter(self.col1)}${self.row1}"
+        if self.rows == 1 and self.columns == 1:
+            return first
+        return f"{first}:${get_column_letter(self.col2)}${self.row2}"
+
+    def get_rows(self):
+        return Lines(self, "row")
+
+    def get_columns(self):
+        return Lines(self, "column")
+
+    def get_worksheet(self):
+        return self.sheet
+
+    def call_cells(self, row=None, column=None):
+        if row is None:
+            return self
+        if column is None:
+            # Cells(n): ô thứ n theo thứ tự từng dòng
+            index = int(to_number(row)) - 1
+            row, column = index // self.columns + 1, index % self.columns + 1
+        return Range(self.sheet, self.row1 + int(to_number(row)) - 1,
+                     self.col1 + self.sheet.column_index(column) - 1)
+
+    def call_offset(self, rowoffset=0, columnoffset=0):
+        dr, dc = int(to_number(rowoffset)), int(to_number(columnoffset))
+        return Range(self.sheet, self.row1 + dr, self.col1 + dc, self.row2 + dr, self.col2 + dc)
+
+    def call_resize(self, rowsize=None, columnsize=None):
+        rows = self.rows if rowsize is None else int(to_number(rowsize))
+        columns = self.columns if columnsize is None else int(to_number(columnsize))
+        return Range(self.sheet, self.row1, self.col1, self.row1 + rows - 1, self.col1 + columns - 1)
+
+    def call_end(self, direction):
+        direction = int(to_number(direction))
+        if direction not in END_DIRECTIONS:
+            raise VBARuntimeError(f"Range.End: hướng không hợp lệ {direction}")
+        row, column = self.sheet.end(self.row1, self.col1, *END_DIRECTIONS[direction])
+        return Range(self.sheet, row, column)
+
+    def get_left(self):
+        return self.sheet.column_left(self.col1)
+
+    def get_top(self):
+        return self.sheet.row_top(self.row1)
+
+    def get_width(self):
+        return self.sheet.column_left(self.col2 + 1) - self.sheet.column_left(self.col1)
+
+    def get_height(self):
+        return self.sheet.row_top(self.row2 + 1) - self.sheet.row_top(self.row1)
+
+    def call_select(self):
+        pass
+
+    call_activate = call_select
+
+
+class Lines:
+    """
+    Rows or Columns of a Range: Count and (n).
+    """
+    vba_type_name = "Range"
+
+    def __init__(self, rng, kind):
+        self.range = rng
+        self.kind = kind
+
+    def get_count(self):
+        return self.range.rows if self.kind == "row" else self.range.columns
+
+    def call_default(self, index):
+        index = int(to_number(index)) - 1
+        r = self.range
+        if self.kind == "row":
+            return Range(r.sheet, r.row1 + index, r.col1, r.row1 + index, r.col2)
+        return Range(r.sheet, r.row1, r.col1 + index, r.row2, r.col1 + index)
+
+    call_item = call_default
+
+    def vba_iter(self):
+        for i in range(1, self.get_count() + 1):
+            yield self.call_default(i)
+
+
+class ChartTitle:
+    vba_type_name = "ChartTitle"
+
+    def __init__(self):
+        self.text = ""
+
+    def get_text(self):
+        return self.text
+
+    def set_text(self, value):
+        self.text = vba_interp.to_str(value)
+
+    get_caption = get_text
+    set_caption = set_text
+
+
+class Series:
+    vba_type_name = "Series"
+
+    def __init__(self):
+        self.xvalues = None
+        self.values = None
+        self.name = None
+
+    def set_xvalues(self, value):
+        self.xvalues = value
+
+    def set_values(self, value):
+        self.values = value
+
+    def set_name(self, value):
+        self.name = vba_interp.to_str(value)
+
+    def get_name(self):
+        return self.name or ""
+
+    # XValues và Values là vùng ô (không lấy giá trị) khi gán không dùng Set.
+    set_xvalues.vba_object_arg = True
+    set_values.vba_object_arg = True
+
+
+class Chart:
+    """
+    Chart of a ChartObject, turned into an openpyxl chart when the workbook is saved.
+    """
+    vba_type_name = "Chart"
+
+    def __init__(self):
+        self.chart_type = XL_COLUMN_CLUSTERED
+        self.source = None
+        self.series = {}
+        self.has_title = False
+        self.title = ChartTitle()
+        self.has_legend = True
+
+    def get_charttype(self):
+        return self.chart_type
+
+    def set_charttype(self, value):
+        value = int(to_number(value))
+        if value not in (XL_COLUMN_CLUSTERED, XL_COLUMN_STACKED, XL_BAR_CLUSTERED, XL_LINE, XL_PIE):
+            raise VBARuntimeError(f"Chart.ChartType {value} không được hỗ trợ")
+        self.chart_type = value
+
+    def call_setsourcedata(self, source, plotby=None):
+        if not isinstance(source, Range):
+            raise VBARuntimeError("Chart.SetSourceData cần một Range")
+        self.source = source
+
+    def call_seriescollection(self, index=1):
+        index = int(to_number(index))
+        return self.series.setdefault(index, Series())
+
+    def get_hastitle(self):
+        return self.has_title
+
+    def set_hastitle(self, value):
+        self.has_title = vba_interp.to_bool(value)
+
+    def get_charttitle(self):
+        return self.title
+
+    def get_haslegend(self):
+        return self.has_legend
+
+    def set_haslegend(self, value):
+        self.has_legend = vba_interp.to_bool(value)
+
+    def build(self, ws):
+        """
+        Returns the openpyxl chart for this chart, its data referring to ws.
+        """
+        from openpyxl.chart import BarChart, LineChart, PieChart, Reference, Series as XlSeries
+        from openpyxl.chart.data_source import AxDataSource, StrRef, NumRef
+        from openpyxl.chart.series import SeriesLabel
+
+        if self.chart_type == XL_LINE:
+            chart = LineChart()
+        elif self.chart_type == XL_PIE:
+            chart = PieChart()
+        else:
+            chart = BarChart()
+            chart.type = "bar" if self.chart_type == XL_BAR_CLUSTERED else "col"
+            if self.chart_type == XL_COLUMN_STACKED:
+                chart.grouping, chart.overlap = "stacked", 100
+
+        def reference(rng):
+            return Reference(rng.sheet.ws, min_col=rng.col1, min_row=rng.row1, max_col=rng.col2, max_row=rng.row2)
+
+        if self.source is not None:
+            src = self.source
+            # Dòng đầu là tiêu đề nếu nó chứa chữ (như Excel khi chọn nguồn dữ liệu).
+            titled = src.rows > 1 and any(isinstance(src.sheet.read(src.row1, c), str)
+                                          for c in range(src.col1, src.col2 + 1))
+            chart.add_data(reference(src), titles_from_data=titled)
+        for index in sorted(self.series):
+            spec = self.series[index]
+            while len(chart.series) < index:
+                if not isinstance(spec.values, Range):
+                    raise VBARuntimeError(f"SeriesCollection({index}) không có dữ liệu")
+                chart.series.append(XlSeries(reference(spec.values)))
+            ser = chart.series[index - 1]
+            if isinstance(spec.values, Range):
+                ser.val.numRef.f = str(reference(spec.values))
+            if isinstance(spec.xvalues, Range):
+                ref = str(reference(spec.xvalues))
+                textual = any(isinstance(v, str) for v in spec.xvalues.iter_values())
+                ser.cat = AxDataSource(strRef=StrRef(f=ref)) if textual else AxDataSource(numRef=NumRef(f=ref))
+            if spec.name:
+                ser.tx = SeriesLabel(v=spec.name)
+        if self.has_title and self.title.text:
+            chart.title = self.title.text
+        if not self.has_legend:
+            chart.legend = None
+        return chart
+
+
+class ChartObject:
+    vba_type_name = "ChartObject"
+
+    def __init__(self, left, top, width, height):
+        self.left, self.top, self.width, self.height = left, top, width, height
+        self.chart = Chart()
+
+    def get_chart(self):
+        return self.chart
+
+    def get_left(self):
+        return self.left
+
+    def set_left(self, value):
+        self.left = to_number(value)
+
+    def get_top(self):
+        return self.top
+
+    def set_top(self, value):
+        self.top = to_number(value)
+
+    def get_width(self):
+        return self.width
+
+    def set_width(self, value):
+        self.width = to_number(value)
+
+    def get_height(self):
+        return self.height
+
+    def set_height(self, value):
+        self.height = to_number(value)
+
+
+class ChartObjects:
+    """
+    Charts added by the macro to a sheet (the charts already in the file are not loaded by openpyxl).
+    """
+    vba_type_name = "ChartObjects"
+
+    def __init__(self):
+        self.items = []
+
+    def call_add(self, left, top, width, height):
+        obj = ChartObject(to_number(left), to_number(top), to_number(width), to_number(height))
+        self.items.append(obj)
+        return obj
+
+    def get_count(self):
+        return len(self.items)
+
+    def call_default(self, index):
+        return self.items[int(to_number(index)) - 1]
+
+    call_item = call_default
+
+    def vba_iter(self):
+        return iter(list(self.items))
+
+
+class Sheet:
+    """
+    Worksheet wrapper: cell access with the data bounds cached (openpyxl recomputes them on every call).
+    """
+    vba_type_name = "Worksheet"
+
+    def __init__(self, book, ws):
+        self.book = book
+        self.ws = ws
+        self.max_row = ws.max_row
+        self.max_column = ws.max_column
+        self.charts = ChartObjects()
+
+    def cell(self, row, column):
+        return self.ws.cell(row=row, column=column)
+
+    # Giao diện COM tối thiểu (ws.Cells, ws.Range, Range.Value) để bulk_range đọc / ghi cả khối.
+    def Cells(self, row, column):
+        return Range(self, row, column)
+
+    def Range(self, cell1, cell2):
+        return Range(self, cell1.row1, cell1.col1, cell2.row2, cell2.col2)
+
+    def read(self, row, column):
+        if row > self.max_row or column > self.max_column:
+            return None
+        value = self.ws.cell(row=row, column=column).value
+        if isinstance(value, str) and value.startswith("="):
+            return self.book.cached_value(self.ws.title, row, column, value)
+        return value
+
+    def write(self, row, column, value):
+        if isinstance(value, bool) or value is None or isinstance(value, (int, float, str)):
+            pass
+        else:
+            value = vba_interp.to_str(value)
+        if _is_empty(value) and (row > self.max_row or column > self.max_column):
+            return
+        self.ws.cell(row=row, column=column, value=value)
+        self.book.dirty = True
+        self.max_row = max(self.max_row, row)
+        self.max_column = max(self.max_column, column)
+
+    def column_index(self, column):
+        column = to_value(column)
+        if isinstance(column, str):
+            return column_index_from_string(column.strip().upper())
+        return int(to_number(column))
+
+    def end(self, row, column, dr, dc):
+        """
+        Range.End: the cell reached from (row, column) moving by (dr, dc), with Excel's rules.
+        """
+        def inside(r, c):
+            return 1 <= r <= MAX_ROWS and 1 <= c <= MAX_COLUMNS
+
+        def filled(r, c):
+            return not _is_empty(self.read(r, c))
+
+        r, c = row + dr, column + dc
+        if not inside(r, c):
+            return row, column
+        if filled(row, column) and filled(r, c):
+            # Đi tới ô cuối của khối ô có dữ liệu liền nhau.
+            while inside(r + dr, c + dc) and filled(r + dr, c + dc):
+                r, c = r + dr, c + dc
+            return r, c
+        # Đi tới ô có dữ liệu tiếp theo, hoặc tới mép trang tính.
+        if dr < 0 and r > self.max_row:
+            r = self.max_row
+        if dc < 0 and c > self.max_column:
+            c = self.max_column
+        while True:
+            if (dr > 0 and r > self.max_row) or (dc > 0 and c > self.max_column):
+                return (MAX_ROWS, c) if dr else (r, MAX_COLUMNS)
+            if filled(r, c) or not inside(r + dr, c + dc):
+                return r, c
+            r, c = r + dr, c + dc
+
+    def column_left(self, column):
+        left = 0.0
+        dimensions = self.ws.column_dimensions
+        for c in range(1, column):
+            letter = get_column_letter(c)
+            width = dimensions[letter].width if letter in dimensions and dimensions[letter].width else DEFAULT_COLUMN_WIDTH
+            left += _column_width_points(width)
+        return left
+
+    def row_top(self, row):
+        top = 0.0
+        dimensions = self.ws.row_dimensions
+        for r in range(1, row):
+            height = dimensions[r].height if r in dimensions and dimensions[r].height else DEFAULT_ROW_HEIGHT
+            top += height
+        return top
+
+    def anchor(self, left, top):
+        # Ô chứa điểm (left, top) tính bằng điểm, dùng làm neo cho biểu đồ.
+        column, x = 1, 0.0
+        while column < MAX_COLUMNS:
+            letter = get_column_letter(column)
+            dims = self.ws.column_dimensions
+            width = _column_width_points(dims[letter].width if letter in dims and dims[letter].width
+                                         else DEFAULT_COLUMN_WIDTH)
+            if x + width > left:
+                break
+            x += width
+            column += 1
+        row, y = 1, 0.0
+        while row < MAX_ROWS:
+            dims = self.ws.row_dimensions
+            height = dims[row].height if row in dims and dims[row].height else DEFAULT_ROW_HEIGHT
+            if y + height > top:
+                break
+            y += height
+            row += 1
+        return f"{get_column_letter(column)}{row}"
+
+    def save_charts(self):
+        for obj in self.charts.items:
+            chart = obj.chart.build(self.ws)
+            chart.width = obj.width * 2.54 / 72    # điểm -> cm
+            chart.height = obj.height * 2.54 / 72
+            self.ws.add_chart(chart, self.anchor(obj.left, obj.top))
+        self.charts.items.clear()
+
+    # -- Thành viên VBA -----------------------------------------------------
+
+    def get_name(self):
+        return self.ws.title
+
+    def set_name(self, value):
+        self.ws.title = vba_interp.to_str(value)
+        self.book.dirty = True
+
+    def get_index(self):
+        return self.book.wb.worksheets.index(self.ws) + 1
+
+    def call_cells(self, row=None, column=None):
+        if row is None:
+            return Range(self, 1, 1, MAX_ROWS, MAX_COLUMNS)
+        return Range(self, 1, 1, MAX_ROWS, MAX_COLUMNS).call_cells(row, column)
+
+    def call_range(self, cell1, cell2=None):
+        if cell2 is not None:
+            first, last = self._as_range(cell1), self._as_range(cell2)
+            return Range(self, min(first.row1, last.row1), min(first.col1, last.col1),
+                         max(first.row2, last.row2), max(first.col2, last.col2))
+        return self._as_range(cell1)
+
+    def _as_range(self, value):
+        if isinstance(value, Range):
+            return value
+        address = vba_interp.to_str(value).replace("$", "").strip()
+        try:
+            min_col, min_row, max_col, max_row = range_boundaries(address)
+        except ValueError:
+            raise VBARuntimeError(f"Địa chỉ vùng ô không hợp lệ: {address!r}")
+        if min_row is None:
+            min_row, max_row = 1, MAX_ROWS
+        if min_col is None:
+            min_col, max_col = 1, MAX_COLUMNS
+        return Range(self, min_row, min_col, max_row, max_col)
+
+    def get_rows(self):
+        return Lines(Range(self, 1, 1, MAX_ROWS, MAX_COLUMNS), "row")
+
+    def get_columns(self):
+        return Lines(Range(self, 1, 1, MAX_ROWS, MAX_COLUMNS), "column")
+
+    def get_usedrange(self):
+        return Range(self, 1, 1, self.max_row, self.max_column)
+
+    def call_chartobjects(self, index=None):
+        if index is None:
+            return self.charts
+        return self.charts.call_default(index)
+
+    def call_activate(self):
+        self.book.wb.active = self.book.wb.worksheets.index(self.ws)
+
+    call_select = call_activate
+
+
+class Sheets:
+    """
+    Worksheets / Sheets collection of a workbook.
+    """
+    vba_type_name = "Sheets"
+
+    def __init__(self, book):
+        self.book = book
+
+    def call_default(self, index):
+        index = to_value(index)
+        if isinstance(index, str):
+            for ws in self.book.wb.worksheets:
+                if ws.title.lower() == index.lower():
+                    return self.book.sheet(ws)
+            raise VBARuntimeError(f"Không có trang tính '{index}'")
+        worksheets = self.book.wb.worksheets
+        position = int(to_number(index))
+        if not 1 <= position <= len(worksheets):
+            raise VBARuntimeError(f"Chỉ số trang tính nằm ngoài phạm vi: {position}")
+        return self.book.sheet(worksheets[position - 1])
+
+    call_item = call_default
+
+    def get_count(self):
+        return len(self.book.wb.worksheets)
+
+    def vba_iter(self):
+        return iter([self.book.sheet(ws) for ws in self.book.wb.worksheets])
+
+
+class VBComponents:
+    def __init__(self, book):
+        self.book = book
+
+    def Import(self, macro_file):
+        module, issues = load_macro(macro_file)
+        if issues:
+            raise VBARuntimeError(f"{macro_file}: macro dùng cấu trúc VBA không được backend native hỗ trợ:\n"
+                                  + format_issues(issues))
+        self.book.modules.append(module)
+
+
+class VBProject:
+    def __init__(self, book):
+        self.VBComponents = VBComponents(book)
+
+
+class Workbook:
+    """
+    Workbook loaded with openpyxl; Save() writes it back to its file. Saved is False once the
+    macro has changed it (cells, formats, sheet names, charts) since it was opened or saved.
+    """
+    vba_type_name = "Workbook"
+
+    def __init__(self, path):
+        self.path = path
+        keep_vba = path.lower().endswith((".xlsm", ".xltm"))
+        self.wb = openpyxl.load_workbook(path, keep_vba=keep_vba)
+        self._cached = None
+        self._sheets = {}
+        self.modules = []
+        self.dirty = False
+        self.VBProject = VBProject(self)
+
+    @property
+    def Saved(self):
+        return not self.dirty and not any(sheet.charts.items for sheet in self._sheets.values())
+
+    def sheet(self, ws):
+        sheet = self._sheets.get(id(ws))
+        if sheet is None:
+            sheet = self._sheets[id(ws)] = Sheet(self, ws)
+        return sheet
+
+    def cached_value(self, title, row, column, formula):
+        # Giá trị Excel đã tính cho ô công thức, đọc từ bản data_only của tệp (nạp khi cần).
+        if self._cached is None:
+            self._cached = openpyxl.load_workbook(self.path, data_only=True, read_only=False)
+        try:
+            value = self._cached[title].cell(row=row, column=column).value
+        except KeyError:
+            return formula
+        return formula if value is None else value
+
+    def Save(self):
+        for sheet in self._sheets.values():
+            sheet.save_charts()
+        self.wb.save(self.path)
+        self.dirty = False
+
+    def Close(self, SaveChanges=None):
+        if SaveChanges:
+            self.Save()
+        self.wb.close()
+        self._sheets.clear()
+        self._cached = None
+
+    # -- Thành viên VBA -----------------------------------------------------
+
+    def get_worksheets(self):
+        return Sheets(self)
+
+    get_sheets = get_worksheets
+
+    def get_activesheet(self):
+        return self.sheet(self.wb.active)
+
+    def get_name(self):
+        return os.path.basename(self.path)
+
+    def get_fullname(self):
+        return self.path
+
+    def get_path(self):
+        return os.path.dirname(self.path)
+
+
+class Workbooks:
+    def __init__(self, app):
+        self.app = app
+        self.active = None   # Workbook mở gần nhất (macro chạy trên workbook này)
+
+    def Open(self, path):
+        self.active = Workbook(path)
+        return self.active
+
+
+class NativeExcel:
+    """
+    In-process stand-in for Excel.Application: the COM-like surface used by worker.process_excel_file
+    and the VBA Application object of the macros.
+    """
+    vba_type_name = "Application"
+
+    def __init__(self, output=None):
+        if openpyxl is None:
+            raise RuntimeError("Backend native cần thư viện openpyxl (pip install openpyxl)")
+        self.Visible = False
+        self.Application = self
+        self.Workbooks = Workbooks(self)
+        self.output = output or (lambda text: logger.info(f"[VBA] {text}"))
+        self.worksheet_function = WorksheetFunction()
+        self.settings = {"screenupdating": True, "displayalerts": True, "enableevents": True,
+                         "calculation": XL_CONSTANTS["xlcalculationautomatic"], "statusbar": False}
+
+    def Run(self, macro_name, *args):
+        book = self.Workbooks.active
+        if book is None:
+            raise VBARuntimeError("Không có workbook nào đang mở")
+        # "Module1.Macro" hoặc "'Book.xlsm'!Macro" -> Macro
+        name = macro_name.split("!")[-1].split(".")[-1]
+        for module in book.modules:
+            if name.lower() in module.procedures:
+                interpreter = vba_interp.Interpreter(module, host=self, constants=XL_CONSTANTS, output=self.output)
+                return interpreter.run(name, *args)
+        raise VBARuntimeError(f"Không tìm thấy macro '{macro_name}' trong các module đã nhập")
+
+    def Quit(self):
+        self.Workbooks.active = None
+
+    # -- Thành viên VBA -----------------------------------------------------
+
+    def _book(self):
+        if self.Workbooks.active is None:
+            raise VBARuntimeError("Không có workbook nào đang mở")
+        return self.Workbooks.active
+
+    def get_application(self):
+        return self
+
+    def get_worksheetfunction(self):
+        return self.worksheet_function
+
+    def get_thisworkbook(self):
+        return self._book()
+
+    get_activeworkbook = get_thisworkbook
+
+    def get_activesheet(self):
+        return self._book().get_activesheet()
+
+    def get_worksheets(self):
+        return self._book().get_worksheets()
+
+    get_sheets = get_worksheets
+
+    def call_cells(self, row=None, column=None):
+        return self.get_activesheet().call_cells(row, column)
+
+    def call_range(self, cell1, cell2=None):
+        return self.get_activesheet().call_range(cell1, cell2)
+
+    def get_rows(self):
+        return self.get_activesheet().get_rows()
+
+    def get_columns(self):
+        return self.get_activesheet().get_columns()
+
+    def __getattr__(self, name):
+        # Các cài đặt Application.ScreenUpdating, DisplayAlerts... chỉ được ghi nhớ.
+        for prefix in ("get_", "set_"):
+            if name.startswith(prefix) and name[len(prefix):] in self.__dict__.get("settings", {}):
+                key = name[len(prefix):]
+                if prefix == "get_":
+                    return lambda: self.settings[key]
+                return lambda value: self.settings.__setitem__(key, to_value(value))
+        raise AttributeError(name)
+
+
+# Các lớp tạo nên mô hình đối tượng VBA của backend native.
+MODEL_CLASSES = (NativeExcel, WorksheetFunction, Font, Range, Lines, ChartTitle, Series, Chart, ChartObject,
+                 ChartObjects, Sheet, Sheets, Workbook)
+APPLICATION_SETTINGS = ("screenupdating", "displayalerts", "enableevents", "calculation", "statusbar")
+
+
+def _members(classes):
+    names = set(APPLICATION_SETTINGS)
+    for cls in classes:
+        for attr in dir(cls):
+            for prefix in ("get_", "set_", "call_"):
+                if attr.startswith(prefix):
+                    names.add(attr[len(prefix):])
+    names.discard("default")
+    return names
+
+
+# Tên thành viên đối tượng mà macro có thể dùng (viết thường) và các tên toàn cục của Application.
+SUPPORTED_MEMBERS = frozenset(_members(MODEL_CLASSES))
+APPLICATION_GLOBALS = frozenset(_members((NativeExcel,)))
+
+_macro_cache = {}
+
+
+def load_macro(macro_file):
+    """
+    Parses macro_file (cached per path and modification time) and checks it against the native
+    object model. Returns (module, issues); issues is [(line, message)], empty if it can run here.
+    """
+    path = os.path.abspath(macro_file)
+    key = (path, os.path.getmtime(path))
+    cached = _macro_cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1], cached[2]
+    with open(path, "r", encoding="utf-8-sig", errors="replace") as f:
+        source = f.read()
+    try:
+        module = vba_interp.parse_module(source, os.path.basename(path))
+        issues = vba_interp.check_module(module, SUPPORTED_MEMBERS, APPLICATION_GLOBALS)
+    except vba_interp.VBASyntaxError as e:
+        module, issues = None, [(0, str(e))]
+    _macro_cache[path] = (key, module, issues)
+    return module, issues
+
+
+def check_macro(macro_file, macro_name=None):
+    """
+    Returns the list of reasons (as text) why macro_file cannot run on the native backend,
+    empty when it can. macro_name, if given, must be a procedure of the module.
+    """
+    if openpyxl is None:
+        return ["thiếu thư viện openpyxl (pip install openpyxl)"]
+    try:
+        module, issues = load_macro(macro_file)
+    except OSError as e:
+        return [f"không đọc được {macro_file}: {e}"]
+    reasons = [f"dòng {line}: {message}" if line else message for line, message in issues]
+    if module is not None and macro_name and macro_name.split("!")[-1].split(".")[-1].lower() not in module.procedures:
+        reasons.append(f"không có thủ tục '{macro_name}'")
+    return reasons
+
+
+def format_issues(issues):
+    return "\n".join(f"  dòng {line}: {message}" if line else f"  {message}" for line, message in issues)
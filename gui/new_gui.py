@@ -1,12 +1,12 @@
 # new_gui.py
 
-import logging
 import tkinter as tk
 from tkinter import ttk
-from gv import Gvar as gv, COMMON_WIDGET_STYLE
+from gv import Gvar as gv, COMMON_WIDGET_STYLE, FONT_BASIC
 from gui_actions import action_list  # Import các hàm xử lý sự kiện
-from mpp_logger import get_mp_logger, LOG_LEVELS, TextHandler, PrettyFormatter, DynamicLevelFilter
+from mpp_logger import get_mp_logger, LOG_LEVELS
 from logtext import LogText, ToolTip
+from pool_service import PoolService
 import threading
 
 logger = None
@@ -29,10 +29,13 @@ class MainWindow(tk.Tk):
         # Các biến trạng thái ban đầu
         self.total_files = 0
         self.progress_count = 0
+        self.skipped_files = 0
         self.progress_queue = None
         self.vba_file = None
         self.excel_directory = None
         self.stop_event = threading.Event()
+        # Nhóm worker dùng chung cho mọi lượt chạy, khởi động ở lượt chạy đầu tiên.
+        self.pool_service = PoolService(self.mp_logging, gv.excel_backend)
         self.vba_thread = None
         self.after_id_progress = None
 
@@ -53,6 +56,7 @@ class MainWindow(tk.Tk):
             {"text": "Nạp tập tin VBA", "action": "load_vba_file"},
             {"text": "Chọn thư mục Excel", "action": "load_excel_directory"},
             {"text": "Chạy VBA trên các tập tin Excel", "action": "run_macro_thread"},
+            {"text": "Dừng chạy", "action": "stop_run"},
             {"text": "Thoát ứng dụng", "action": "exit_app"}
         ]
 
@@ -66,6 +70,17 @@ class MainWindow(tk.Tk):
             )
             btn.pack(pady=3, fill="x", anchor="w")
 
+        # Ô chọn "chạy lại tất cả": xử lý cả các tệp không đổi kể từ lần chạy trước
+        gv.force_var = tk.BooleanVar(value=False)
+        force_check = tk.Checkbutton(
+            self.taskbar,
+            text="Chạy lại tất cả",
+            variable=gv.force_var,
+            font=FONT_BASIC,
+        )
+        force_check.pack(pady=3, anchor="w")
+        ToolTip(force_check, text="Xử lý lại cả các tệp đã chạy với macro này và không thay đổi từ lần trước")
+
         # Vùng hiển thị chính bên phải
         right_area = tk.Frame(self, bd=2, relief=tk.SUNKEN, padx=10, pady=10)
         right_area.pack(side="left", fill="both", expand=True)
@@ -84,15 +99,8 @@ class MainWindow(tk.Tk):
         self.progress_label.pack(pady=(0, 5))
         gv.progress_label = self.progress_label
 
-        # Cấu hình handler của logger để hiển thị log lên giao diện
-        if self.mp_logging.listener is not None:
-            self.gui_handler = TextHandler(self.log_container.log_text)
-            gui_formatter = PrettyFormatter(datefmt="%Y-%m-%dT%H:%M:%S%z")
-            self.gui_handler.setFormatter(gui_formatter)
-            # Thêm filter động để quản lý mức độ log
-            self.gui_handler.addFilter(DynamicLevelFilter(logging.DEBUG, True))
-            self.mp_logging.listener.handlers += (self.gui_handler,)
-        else:
+        # Vùng log đọc trực tiếp từ kho log (log_store) mà listener ghi vào, không cần handler riêng cho giao diện
+        if self.mp_logging.listener is None:
             print("Cảnh báo: Không có listener logging nào đang hoạt động.")
 
         # Cập nhật thanh tiến độ định kỳ mỗi 500ms
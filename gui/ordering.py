@@ -0,0 +1,176 @@
+# ordering.py
+"""
+Cost estimation and dispatch ordering of Excel files.
+
+The run finishes when the slowest worker finishes, so dispatching the most expensive
+workbooks first (longest-expected-first) keeps a large file at the end of the list from
+deciding the makespan. Orderings are registered in ORDERINGS by name:
+
+    "fifo"    : keep the discovery (glob) order.
+    "size"    : largest file first, cost estimated from os.stat size.
+    "history" : longest duration recorded for the same job and backend first; files without
+                history fall back to a size-based estimate calibrated on those durations.
+
+Every ordering returns (ordered_files, costs), costs being estimated seconds per file.
+estimate_makespan() simulates the greedy dispatch of those costs on N workers, so the run
+report can compare the estimated and the actual makespan.
+"""
+import os
+import json
+import heapq
+import logging
+
+from gv import CACHE_DIR
+from mpp_logger import LoggingMultiProcess
+
+logger = logging.getLogger(LoggingMultiProcess.MAIN_LOGGER)
+
+# Mô hình chi phí mặc định khi chưa có lịch sử: thời gian cố định mỗi tệp + thời gian theo dung lượng.
+DEFAULT_FILE_OVERHEAD = 1.0            # giây / tệp
+DEFAULT_SECONDS_PER_BYTE = 1.0 / (20 * 1024 * 1024)   # ~20 MB/giây
+
+HISTORY_FILE = os.path.join(CACHE_DIR, "durations.json")
+
+
+def file_size(path):
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
+
+
+class DurationHistory:
+    """
+    Per-file durations recorded by previous runs, persisted as JSON:
+        {"<backend>|<job key>": {absolute path: {"size": bytes, "duration": seconds}}}
+    A duration only predicts another run of the same job (run_manifest.job_key: the .bas file and
+    macro, or the recipe) on the same backend; select() chooses the one record(), lookup() and
+    cost_model() use.
+    """
+    def __init__(self, path=HISTORY_FILE):
+        self.path = path
+        self.entries = {}
+        self.job = ""
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            entries = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Không đọc được lịch sử thời gian xử lý {self.path}: {e}")
+            entries = {}
+        # Lịch sử cũ chỉ theo đường dẫn (không biết job và backend đã đo): bỏ qua.
+        self.entries = {key: files for key, files in entries.items()
+                        if isinstance(files, dict) and "duration" not in files}
+        return self
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Không lưu được lịch sử thời gian xử lý {self.path}: {e}")
+
+    def select(self, backend, job):
+        """
+        Uses the durations of job (run_manifest.job_key) run on backend from now on.
+        """
+        self.job = f"{backend}|{job}"
+        return self
+
+    def record(self, path, size, duration):
+        self.entries.setdefault(self.job, {})[os.path.abspath(path)] = {"size": size, "duration": duration}
+
+    def lookup(self, path, size):
+        """
+        Returns the recorded duration of path for the selected job, or None if unknown or the
+        file size changed.
+        """
+        entry = self.entries.get(self.job, {}).get(os.path.abspath(path))
+        if entry is None or entry.get("size") != size:
+            return None
+        return entry.get("duration")
+
+    def cost_model(self):
+        """
+        Fits duration = overhead + seconds_per_byte * size on the entries of the selected job
+        (least squares), falling back to the defaults when there is not enough data.
+        """
+        points = [(e["size"], e["duration"]) for e in self.entries.get(self.job, {}).values()
+                  if "size" in e and "duration" in e]
+        if not points:
+            return DEFAULT_FILE_OVERHEAD, DEFAULT_SECONDS_PER_BYTE
+        n = len(points)
+        mean_size = sum(p[0] for p in points) / n
+        mean_duration = sum(p[1] for p in points) / n
+        var_size = sum((p[0] - mean_size) ** 2 for p in points)
+        if var_size == 0:
+            # Mọi tệp cùng dung lượng: giữ thời gian cố định mặc định, phần còn lại tính theo dung lượng.
+            overhead = min(DEFAULT_FILE_OVERHEAD, mean_duration)
+            if mean_size == 0:
+                return overhead, DEFAULT_SECONDS_PER_BYTE
+            return overhead, (mean_duration - overhead) / mean_size
+        slope = sum((p[0] - mean_size) * (p[1] - mean_duration) for p in points) / var_size
+        slope = max(slope, 0.0)
+        overhead = max(mean_duration - slope * mean_size, 0.0)
+        return overhead, slope
+
+
+def order_fifo(files, history=None):
+    overhead, per_byte = history.cost_model() if history else (DEFAULT_FILE_OVERHEAD, DEFAULT_SECONDS_PER_BYTE)
+    costs = [overhead + per_byte * file_size(path) for path in files]
+    return list(files), costs
+
+
+def order_by_size(files, history=None):
+    overhead, per_byte = history.cost_model() if history else (DEFAULT_FILE_OVERHEAD, DEFAULT_SECONDS_PER_BYTE)
+    sized = [(file_size(path), path) for path in files]
+    sized.sort(key=lambda item: item[0], reverse=True)
+    return [path for _, path in sized], [overhead + per_byte * size for size, _ in sized]
+
+
+def order_by_history(files, history=None):
+    if history is None:
+        return order_by_size(files)
+    overhead, per_byte = history.cost_model()
+    estimated = []
+    for path in files:
+        size = file_size(path)
+        duration = history.lookup(path, size)
+        estimated.append((duration if duration is not None else overhead + per_byte * size, path))
+    estimated.sort(key=lambda item: item[0], reverse=True)
+    return [path for _, path in estimated], [cost for cost, _ in estimated]
+
+
+# Các chiến lược sắp xếp; có thể đăng ký thêm bằng cách thêm vào từ điển này.
+ORDERINGS = {
+    "fifo": order_fifo,
+    "size": order_by_size,
+    "history": order_by_history,
+}
+
+
+def order_files(files, ordering="history", history=None):
+    """
+    Orders files with the named strategy. Returns (ordered_files, estimated_costs).
+    """
+    strategy = ORDERINGS.get(ordering)
+    if strategy is None:
+        raise ValueError(f"Thứ tự phát tệp không hợp lệ: {ordering} (chọn một trong {', '.join(ORDERINGS)})")
+    return strategy(files, history)
+
+
+def estimate_makespan(costs, num_workers):
+    """
+    Simulates the dispatch of costs, in order, to whichever of num_workers is free first
+    and returns the finishing time of the last worker.
+    """
+    loads = [0.0] * max(num_workers, 1)
+    for cost in costs:
+        heapq.heappush(loads, heapq.heappop(loads) + cost)
+    return max(loads) if loads else 0.0
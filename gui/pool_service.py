@@ -0,0 +1,89 @@
+# pool_service.py
+"""
+Application-wide warm worker pool.
+
+Starting a run used to cost a new set of processes: spawning, re-importing worker / mpp_logger /
+the Excel backend, worker_logging_setup and one Excel start-up per worker. PoolService owns a single
+workerpool.WorkerPool for the lifetime of the application instead: it is started by the first
+run (or by start()), its workers keep their Excel sessions open between runs, and every run is
+submitted to it through run(). The pool is resized to the worker count of each run without a
+restart (an adaptive run starts from the current warm size) and is stopped only by shutdown(),
+when the application exits.
+
+Runs are serialized: the supervisor of a run (scheduler.run_files) is the only reader of the
+pool's result queue, so run() waits for the previous run to finish.
+"""
+import logging
+import threading
+
+import worker
+import backends
+import scheduler
+from workerpool import WorkerPool
+from mpp_logger import LoggingMultiProcess
+
+logger = logging.getLogger(LoggingMultiProcess.MAIN_LOGGER)
+
+
+class PoolService:
+    """
+    Lazily started WorkerPool reused by every run of the application.
+    """
+    def __init__(self, mp_logging, backend=backends.DEFAULT_BACKEND):
+        self.mp_logging = mp_logging
+        self.backend = backend
+        self.pool = None
+        self.runs = 0
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.pool is not None
+
+    def start(self, num_workers):
+        """
+        Starts the pool with num_workers workers, or resizes it if it is already running.
+        Returns the WorkerPool.
+        """
+        if self.pool is None:
+            manager = self.mp_logging.manager
+            self.pool = WorkerPool(num_workers, manager.Queue(), manager.Queue(), manager.Event(),
+                                   self.mp_logging, self.backend).start()
+            logger.info(f"Đã khởi động nhóm worker dùng chung: {num_workers} worker")
+        else:
+            self.pool.resize(num_workers)
+        return self.pool
+
+    def resize(self, num_workers):
+        """
+        Changes the number of workers of the running pool (no effect before it is started).
+        """
+        if self.pool is not None:
+            self.pool.resize(num_workers)
+
+    def run(self, excel_files, num_processes, progress_queue, **kwargs):
+        """
+        Runs excel_files on the warm pool (started on first use) and returns the RunSummary.
+        kwargs are passed on to scheduler.run_files.
+        """
+        concurrency = kwargs.get("concurrency")
+        with self._lock:
+            if concurrency is None:
+                pool = self.start(num_processes)
+            else:
+                # Tự điều chỉnh: giữ số worker đang ấm, lượt chạy bắt đầu đo từ đó.
+                pool = self.pool or self.start(concurrency.min_workers)
+            self.runs += 1
+            logger.info(f"Lượt chạy thứ {self.runs} trên nhóm worker dùng chung ({pool.size} worker)")
+            return scheduler.run_files(excel_files, num_processes, self.mp_logging, progress_queue,
+                                       pool=pool, **kwargs)
+
+    def shutdown(self):
+        """
+        Stops the workers, each closing its Excel session. Called once, when the application exits.
+        """
+        if self.pool is None:
+            return
+        logger.info("Đang dừng nhóm worker dùng chung")
+        self.pool.stop()
+        self.pool = None
@@ -0,0 +1,308 @@
+# recipe_parity.py
+"""
+Parity check of the Python recipes (recipes.py) against the macros they replace.
+
+For every workbook, one copy is processed by the macro run on the VBA interpreter
+(native_excel.NativeExcel, same as the "native" backend) and another copy by the recipe. The two
+results are then compared: every cell value (numbers within a relative tolerance) and number
+format of every sheet, and the charts added (type, title, data and category references, anchor).
+A workbook on which the macro fails must make the recipe fail too.
+
+Without workbook arguments, a set of generated cases covering the edge cases of the macro is
+checked (Total row present or not, label with spaces, empty and numeric-text cells, extra
+columns, header only, text in the data column). As the interpreter may itself differ from Excel,
+the recipe result of the cases listed in EXPECTED_RESULTS is also compared with a known-good
+workbook written from the result Excel gives (worked out by hand from the macro, not by running
+it), and its chart with the expected data and category ranges.
+
+Example:
+    python recipe_parity.py --recipe grand_total_chart
+    python recipe_parity.py C:\\data\\excel --recipe grand_total_chart
+Exit code 0 when every workbook matches (and every known-good result is reproduced), 1 otherwise.
+"""
+import os
+import sys
+import math
+import shutil
+import argparse
+import tempfile
+
+import openpyxl
+
+import recipes
+import native_excel
+
+# Macro tương ứng với mỗi recipe: (tệp .bas tính từ thư mục gốc của dự án, tên macro).
+RECIPE_MACROS = {
+    "grand_total_chart": ("macro_module.bas", "CreateGrandTotalAndChart"),
+}
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Sai số tương đối cho phép khi so sánh số thực.
+REL_TOLERANCE = 1e-12
+
+# Các trường hợp sinh sẵn: tên -> các dòng của trang "Planning".
+GENERATED_CASES = {
+    "total_row": [["Month", "Sales"], ["Jan", 10], ["Feb", 30], ["Mar", 60], ["Total", None]],
+    "no_total_row": [["Month", "Sales", "Region"], ["Jan", 1.5], ["Feb", 2.25, "N"], ["Mar", 4]],
+    "padded_label": [["Month", "Sales"], ["Jan", 5], ["  Total ", 99], ["Apr", 7]],
+    "empty_and_text_numbers": [["Month", "Sales"], ["Jan", None], ["Feb", "12"], ["Mar", 8], ["Apr", ""]],
+    "zero_sum": [["Month", "Sales"], ["Jan", 0], ["Feb", 0]],
+    "header_only": [["Month", "Sales", "Cost", "Margin"]],
+    "total_first": [["Total", "Sales"], ["Jan", 3]],
+    "text_in_data": [["Month", "Sales"], ["Jan", 4], ["Feb", "n/a"]],
+    "wide_table": [["Month"] + [f"C{i}" for i in range(2, 30)]] + [[f"M{r}"] + [r * i for i in range(2, 30)]
+                                                                  for r in range(1, 200)],
+}
+
+
+# Kết quả đúng của macro trong Excel cho một số trường hợp sinh sẵn, viết tay theo macro (không qua
+# trình thông dịch): các dòng của trang "Planning" sau khi chạy, các ô định dạng phần trăm và
+# (vùng dữ liệu, vùng nhãn) của biểu đồ, None nếu không kiểm tra. None thay cho cả kết quả:
+# macro báo lỗi trong Excel (ví dụ Cells(0, 2)), recipe cũng phải báo lỗi.
+EXPECTED_RESULTS = {
+    "grand_total_chart": {
+        "total_row": {
+            "rows": [["Month", "Sales", "Percent"], ["Jan", 10, 0.1], ["Feb", 30, 0.3], ["Mar", 60, 0.6],
+                     ["Grand Total", 100.0]],
+            "percent_cells": ["C2", "C3", "C4"],
+            "chart": ("'Planning'!$C$2:$C$4", "'Planning'!$A$2:$A$4"),
+        },
+        "no_total_row": {
+            "rows": [["Month", "Sales", "Region", "Percent"], ["Jan", 1.5, None, 1.5 / 7.75],
+                     ["Feb", 2.25, "N", 2.25 / 7.75], ["Mar", 4, None, 4 / 7.75], ["Grand Total", 7.75]],
+            "percent_cells": ["D2", "D3", "D4"],
+            "chart": ("'Planning'!$D$2:$D$4", "'Planning'!$A$2:$A$4"),
+        },
+        "padded_label": {
+            "rows": [["Month", "Sales", "Percent"], ["Jan", 5, 1.0], ["Grand Total", 5.0], ["Apr", 7]],
+            "percent_cells": ["C2"],
+            "chart": ("'Planning'!$C$2", "'Planning'!$A$2"),
+        },
+        "zero_sum": {
+            "rows": [["Month", "Sales", "Percent"], ["Jan", 0, 0.0], ["Feb", 0, 0.0], ["Grand Total", 0.0]],
+            "percent_cells": ["C2", "C3"],
+            "chart": ("'Planning'!$C$2:$C$3", "'Planning'!$A$2:$A$3"),
+        },
+        "header_only": {
+            "rows": [["Month", "Sales", "Cost", "Margin", "Percent"], ["Grand Total", 0.0]],
+            "percent_cells": [],
+            "chart": None,
+        },
+        "total_first": None,
+    },
+}
+
+
+def make_case(directory, name, rows):
+    wb = openpyxl.Workbook()
+    wb.active.title = "Other"
+    wb.active["A1"] = "untouched"
+    ws = wb.create_sheet(recipes.PLANNING_SHEET)
+    for r, row in enumerate(rows, 1):
+        for c, value in enumerate(row, 1):
+            ws.cell(row=r, column=c, value=value)
+    path = os.path.join(directory, f"{name}.xlsx")
+    wb.save(path)
+    return path
+
+
+def make_expected(directory, name, expected):
+    """
+    Writes the known-good workbook of a generated case from its EXPECTED_RESULTS entry.
+    """
+    path = make_case(directory, f"{name}.expected", expected["rows"])
+    wb = openpyxl.load_workbook(path)
+    ws = wb[recipes.PLANNING_SHEET]
+    for coordinate in expected["percent_cells"]:
+        ws[coordinate].number_format = recipes.PERCENT_FORMAT
+    wb.save(path)
+    return path
+
+
+def run_macro(path, macro_file, macro_name):
+    app = native_excel.NativeExcel(output=lambda text: None)
+    book = app.Workbooks.Open(path)
+    try:
+        book.VBProject.VBComponents.Import(macro_file)
+        app.Run(macro_name)
+        book.Save()
+    finally:
+        book.Close()
+
+
+def _same_value(a, b):
+    if isinstance(a, float) or isinstance(b, float):
+        if not isinstance(a, (int, float)) or not isinstance(b, (int, float)):
+            return False
+        return math.isclose(a, b, rel_tol=REL_TOLERANCE, abs_tol=1e-15)
+    return a == b
+
+
+def _chart_signature(chart):
+    refs = []
+    for ser in chart.series:
+        val = ser.val.numRef.f if ser.val is not None and ser.val.numRef is not None else None
+        cat = None
+        if ser.cat is not None:
+            cat = (ser.cat.strRef or ser.cat.numRef).f
+        title = ser.tx.strRef.f if ser.tx is not None and ser.tx.strRef is not None else None
+        refs.append((val, cat, title))
+    title = None
+    if chart.title is not None and chart.title.tx is not None and chart.title.tx.rich is not None:
+        title = "".join(run.t for p in chart.title.tx.rich.p for run in (p.r or []))
+    anchor = chart.anchor._from
+    return (type(chart).__name__, getattr(chart, "type", None), getattr(chart, "grouping", None), title,
+            tuple(refs), (anchor.col, anchor.row))
+
+
+def compare_workbooks(expected_path, actual_path, labels=("macro", "recipe"), charts=True):
+    """
+    Returns the list of differences between two workbooks (empty when they match); labels name
+    the two sides in the messages. With charts=False, only cell values and formats are compared.
+    """
+    expected, actual = openpyxl.load_workbook(expected_path), openpyxl.load_workbook(actual_path)
+    diffs = []
+    if expected.sheetnames != actual.sheetnames:
+        return [f"trang tính khác nhau: {expected.sheetnames} / {actual.sheetnames}"]
+    for name in expected.sheetnames:
+        ws_e, ws_a = expected[name], actual[name]
+        rows = max(ws_e.max_row, ws_a.max_row)
+        cols = max(ws_e.max_column, ws_a.max_column)
+        for r in range(1, rows + 1):
+            for c in range(1, cols + 1):
+                cell_e, cell_a = ws_e.cell(row=r, column=c), ws_a.cell(row=r, column=c)
+                if not _same_value(cell_e.value, cell_a.value):
+                    diffs.append(f"{name}!{cell_e.coordinate}: {labels[0]} {cell_e.value!r}, "
+                                 f"{labels[1]} {cell_a.value!r}")
+                elif cell_e.number_format != cell_a.number_format:
+                    diffs.append(f"{name}!{cell_e.coordinate}: định dạng {labels[0]} {cell_e.number_format!r}, "
+                                 f"{labels[1]} {cell_a.number_format!r}")
+        if not charts:
+            continue
+        charts_e = [_chart_signature(ch) for ch in ws_e._charts]
+        charts_a = [_chart_signature(ch) for ch in ws_a._charts]
+        if charts_e != charts_a:
+            diffs.append(f"{name}: biểu đồ {labels[0]} {charts_e}, {labels[1]} {charts_a}")
+    return diffs
+
+
+def check_workbook(path, recipe, macro_file, macro_name, work_dir):
+    """
+    Runs the macro and the recipe on copies of path. Returns (status, details): status is "match",
+    "mismatch", "both_failed" (the macro and the recipe both reject the workbook) or "failure_mismatch".
+    """
+    base = os.path.splitext(os.path.basename(path))[0]
+    macro_copy = os.path.join(work_dir, f"{base}.macro.xlsx")
+    recipe_copy = os.path.join(work_dir, f"{base}.recipe.xlsx")
+    shutil.copyfile(path, macro_copy)
+    shutil.copyfile(path, recipe_copy)
+    macro_error = recipe_error = None
+    try:
+        run_macro(macro_copy, macro_file, macro_name)
+    except Exception as e:
+        macro_error = str(e)
+    try:
+        recipes.apply_recipe(recipe_copy, recipe)
+    except Exception as e:
+        recipe_error = str(e)
+    if macro_error or recipe_error:
+        if macro_error and recipe_error:
+            return "both_failed", [f"macro: {macro_error.splitlines()[0]}", f"recipe: {recipe_error.splitlines()[0]}"]
+        return "failure_mismatch", [f"macro: {macro_error or 'ok'}", f"recipe: {recipe_error or 'ok'}"]
+    diffs = compare_workbooks(macro_copy, recipe_copy)
+    return ("mismatch" if diffs else "match"), diffs
+
+
+def check_expected(path, name, recipe, work_dir):
+    """
+    Applies the recipe to a copy of the generated case path and compares it with the known-good
+    result of EXPECTED_RESULTS. Returns (status, details): status is "expected" or "unexpected".
+    """
+    expected = EXPECTED_RESULTS[recipe][name]
+    copy = os.path.join(work_dir, f"{name}.checked.xlsx")
+    shutil.copyfile(path, copy)
+    try:
+        recipes.apply_recipe(copy, recipe)
+    except Exception as e:
+        error = str(e).splitlines()[0]
+        if expected is None:
+            return "expected", [f"recipe: {error} (Excel cũng báo lỗi)"]
+        return "unexpected", [f"recipe: {error}"]
+    if expected is None:
+        return "unexpected", ["recipe: ok, trong Excel macro báo lỗi"]
+    diffs = compare_workbooks(make_expected(work_dir, name, expected), copy, labels=("đúng", "recipe"),
+                              charts=False)
+    if expected["chart"] is not None:
+        charts = openpyxl.load_workbook(copy)[recipes.PLANNING_SHEET]._charts
+        ranges = [_chart_signature(chart)[4][0][:2] for chart in charts]
+        if ranges != [expected["chart"]]:
+            diffs.append(f"{recipes.PLANNING_SHEET}: biểu đồ đúng {expected['chart']}, recipe {ranges}")
+    return ("unexpected" if diffs else "expected"), diffs
+
+
+def collect(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, f) for f in sorted(os.listdir(path))
+                         if f.lower().endswith((".xlsx", ".xlsm")) and not f.startswith("~$"))
+        else:
+            files.append(path)
+    return files
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm tra recipe cho kết quả giống macro VBA tương ứng.")
+    parser.add_argument("paths", nargs="*", help="Tệp Excel hoặc thư mục (mặc định: các trường hợp sinh sẵn)")
+    parser.add_argument("--recipe", default="grand_total_chart", choices=sorted(RECIPE_MACROS), help="Recipe cần kiểm tra")
+    parser.add_argument("--bas", default=None, help="Tệp .bas của macro (mặc định theo recipe)")
+    parser.add_argument("--macro", default=None, help="Tên macro (mặc định theo recipe)")
+    parser.add_argument("--keep", action="store_true", help="Giữ lại thư mục tạm chứa các bản sao")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    default_bas, default_macro = RECIPE_MACROS[args.recipe]
+    macro_file = os.path.abspath(args.bas or os.path.join(PROJECT_DIR, default_bas))
+    macro_name = args.macro or default_macro
+
+    work_dir = tempfile.mkdtemp(prefix="recipe_parity_")
+    try:
+        expected = {}
+        if args.paths:
+            files = collect(args.paths)
+        else:
+            case_dir = os.path.join(work_dir, "cases")
+            os.makedirs(case_dir)
+            files = [make_case(case_dir, name, rows) for name, rows in GENERATED_CASES.items()]
+            expected = {path: name for path, name in zip(files, GENERATED_CASES)
+                        if name in EXPECTED_RESULTS.get(args.recipe, {})}
+        failed = wrong = 0
+        for path in files:
+            status, details = check_workbook(path, args.recipe, macro_file, macro_name, work_dir)
+            if status in ("mismatch", "failure_mismatch"):
+                failed += 1
+            print(f"{status:16} {path}")
+            for line in details[:20]:
+                print(f"    {line}")
+            if path in expected:
+                status, details = check_expected(path, expected[path], args.recipe, work_dir)
+                if status == "unexpected":
+                    wrong += 1
+                print(f"{status:16} {path} (kết quả đúng)")
+                for line in details[:20]:
+                    print(f"    {line}")
+        print(f"{len(files) - failed}/{len(files)} tệp khớp với macro {macro_name}")
+        if expected:
+            print(f"{len(expected) - wrong}/{len(expected)} tệp cho kết quả đúng như Excel")
+        return 1 if failed or wrong else 0
+    finally:
+        if args.keep:
+            print(f"Thư mục tạm: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
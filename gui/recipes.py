@@ -0,0 +1,149 @@
+# recipes.py
+"""
+Python-native "recipes": the most common workbook transformations implemented in Python instead
+of a .bas macro. A recipe opens the workbook in-process (openpyxl, through native_excel.Workbook),
+reads the sheet into an array once, computes with NumPy and writes the result columns back with
+one bulk range write each (bulk_range.write_range on the native sheet), so it costs no COM round
+trip at all. It is selected per job instead of macro_file / macro_name
+(scheduler.run_files recipe=..., cli.py --recipe, Gvar.recipe) and does not use the Excel session
+of the worker.
+
+RECIPES maps a recipe name to a function(book) applied to a native_excel.Workbook. Each recipe
+reproduces the semantics of the macro it replaces, down to VBA's type conversions and the
+reversed ranges of edge cases; recipe_parity.py checks a recipe against its macro run by the
+VBA interpreter on the same workbooks.
+"""
+import logging
+
+import vba_interp
+import bulk_range
+import native_excel
+from native_excel import Range, Sheets, MAX_ROWS, MAX_COLUMNS, XL_COLUMN_CLUSTERED
+from mpp_logger import LoggingMultiProcess
+
+logger = logging.getLogger(LoggingMultiProcess.MAIN_LOGGER)
+
+# Tham số của recipe "grand_total_chart" (giống macro CreateGrandTotalAndChart trong macro_module.bas).
+PLANNING_SHEET = "Planning"
+TOTAL_LABEL = "Total"
+GRAND_TOTAL_LABEL = "Grand Total"
+PERCENT_HEADER = "Percent"
+PERCENT_FORMAT = "0.00%"
+DATA_COLUMN = 2
+CHART_WIDTH, CHART_HEIGHT = 400, 300
+CHART_TITLE = "Percentage by Month"
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Recipe cần thư viện numpy (pip install numpy)")
+    return numpy
+
+
+def sheet_array(sheet):
+    """
+    Values of the used part of a native_excel.Sheet as a 2-D NumPy object array (row 1 / column 1
+    at index 0), formula cells replaced by their cached values like Sheet.read().
+    """
+    np = _numpy()
+    rows = list(sheet.ws.iter_rows(min_row=1, max_row=sheet.max_row, min_col=1, max_col=sheet.max_column,
+                                   values_only=True))
+    grid = np.empty((sheet.max_row, sheet.max_column), dtype=object)
+    for r, row in enumerate(rows):
+        grid[r, :len(row)] = row
+    formulas = np.frompyfunc(lambda v: isinstance(v, str) and v.startswith("="), 1, 1)(grid).astype(bool)
+    for r, c in zip(*np.nonzero(formulas)):
+        grid[r, c] = sheet.read(r + 1, c + 1)
+    return grid
+
+
+def _filled(np, values):
+    return np.frompyfunc(lambda v: not native_excel._is_empty(v), 1, 1)(values).astype(bool)
+
+
+def last_filled(np, values, edge):
+    """
+    1-based position of the last non-empty value, as Range.End(xlUp / xlToLeft) from the edge of
+    the sheet: 1 when there is none.
+    """
+    filled = np.flatnonzero(_filled(np, values))
+    if len(filled) == 0:
+        return 1
+    return min(int(filled[-1]) + 1, edge)
+
+
+def grand_total_chart(book, sheet_name=PLANNING_SHEET):
+    """
+    Same result as CreateGrandTotalAndChart: finds the "Total" row in column A (or uses the row after
+    the data), writes "Grand Total" and the sum of column B there, adds a "Percent" column formatted
+    0.00% after the last header and a clustered column chart of it. Returns a short summary.
+    """
+    np = _numpy()
+    sheet = Sheets(book).call_default(sheet_name)
+    grid = sheet_array(sheet)
+
+    last_row = last_filled(np, grid[:, 0], MAX_ROWS)
+    last_col = last_filled(np, grid[0, :], MAX_COLUMNS)
+
+    labels = np.frompyfunc(lambda v: vba_interp.to_str(v).strip(" "), 1, 1)(grid[:last_row, 0])
+    matches = np.flatnonzero(labels == TOTAL_LABEL)
+    total_row = int(matches[0]) + 1 if len(matches) else last_row + 1
+
+    # Range(Cells(2, B), Cells(totalRow - 1, B)): Excel đảo hai góc nếu totalRow - 1 < 2.
+    low, high = sorted((2, total_row - 1))
+    column = grid[low - 1:min(high, sheet.max_row), DATA_COLUMN - 1] if DATA_COLUMN <= sheet.max_column else []
+    is_number = np.frompyfunc(lambda v: isinstance(v, (int, float)) and not isinstance(v, bool), 1, 1)
+    numbers = column[is_number(column).astype(bool)] if len(column) else column
+    sum_value = float(np.sum(numbers.astype(float))) if len(numbers) else 0.0
+
+    # Giá trị cột B của các dòng dữ liệu, chuyển kiểu như phép gán vào biến Double của macro.
+    data_rows = max(total_row - 2, 0)
+    values = np.zeros(data_rows)
+    if data_rows:
+        present = grid[1:min(total_row - 1, sheet.max_row), DATA_COLUMN - 1] if DATA_COLUMN <= sheet.max_column \
+            else np.empty(0, dtype=object)
+        values[:len(present)] = np.frompyfunc(lambda v: vba_interp.coerce(v, "double"), 1, 1)(present)
+    percents = values / sum_value if sum_value != 0 else np.zeros(data_rows)
+
+    sheet.write(total_row, 1, GRAND_TOTAL_LABEL)
+    sheet.write(total_row, DATA_COLUMN, sum_value)
+    percent_col = last_col + 1
+    sheet.write(1, percent_col, PERCENT_HEADER)
+    if data_rows:
+        # Cả cột phần trăm trong một lần ghi vùng ô, định dạng đặt một lần cho cả vùng.
+        bulk_range.write_range(sheet, 2, percent_col, percents.reshape(-1, 1))
+        Range(sheet, 2, percent_col, total_row - 1, percent_col).set_numberformat(PERCENT_FORMAT)
+
+    chart_obj = sheet.charts.call_add(sheet.column_left(percent_col + 1), sheet.row_top(2), CHART_WIDTH, CHART_HEIGHT)
+    chart = chart_obj.chart
+    chart.set_charttype(XL_COLUMN_CLUSTERED)
+    chart.call_setsourcedata(Range(sheet, 1, percent_col, total_row - 1, percent_col))
+    chart.call_seriescollection(1).set_xvalues(Range(sheet, 2, 1, total_row - 1, 1))
+    chart.set_hastitle(True)
+    chart.title.set_text(CHART_TITLE)
+    return f"Grand Total dòng {total_row} = {sum_value:g}, {data_rows} dòng phần trăm ở cột {percent_col}"
+
+
+# Các recipe chọn được theo lượt chạy: tên -> hàm(book).
+RECIPES = {
+    "grand_total_chart": grand_total_chart,
+}
+
+
+def apply_recipe(file_path, name):
+    """
+    Opens file_path, applies the recipe name, saves and closes the workbook. Returns the recipe summary.
+    """
+    if name not in RECIPES:
+        raise ValueError(f"Recipe không hợp lệ: {name} (chọn một trong {', '.join(RECIPES)})")
+    if native_excel.openpyxl is None:
+        raise RuntimeError("Recipe cần thư viện openpyxl (pip install openpyxl)")
+    book = native_excel.Workbook(file_path)
+    try:
+        summary = RECIPES[name](book)
+        book.Save()
+    finally:
+        book.Close()
+    return summary
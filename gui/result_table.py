@@ -0,0 +1,131 @@
+# result_table.py
+"""
+Structured results of a run, collected in the parent process.
+
+Workers send them on the result queue together with the progress events (see
+worker.process_queue): the "done" event of a file carries a result record, and, when the macro is
+run per worksheet, a "sheet" event is sent as soon as each worksheet is finished.
+ResultTable aggregates them in memory (scheduler.RunSummary.results) and exports them:
+
+    file rows   path, status, attempts, duration, pid, value (macro return value), modified
+                (workbook changed by the macro; empty when the backend cannot tell), the
+                open / import / run / save / close timings, sheets, error
+    sheet rows  path, sheet, attempt, value, error, duration, pid
+
+    table.export("results.csv")     # file rows; sheet rows in results.sheets.csv
+    table.export("results.jsonl")   # one JSON object per row, "record" = "file" or "sheet"
+"""
+import os
+import csv
+import json
+import datetime
+
+# Các thao tác được đo thời gian trên mỗi tệp (xem worker.process_excel_file).
+PHASES = ("open", "import", "run", "save", "close")
+FILE_FIELDS = ("path", "status", "attempts", "duration", "pid", "value", "modified") + PHASES + ("sheets", "error")
+SHEET_FIELDS = ("path", "sheet", "attempt", "value", "error", "duration", "pid")
+
+
+def plain(value):
+    """
+    A macro return value as something JSON can hold: COM dates become ISO strings, arrays
+    (tuples of rows) become lists, anything else unknown becomes its str().
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+            value = value.replace(tzinfo=None)
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    return str(value)
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+class ResultTable:
+    """
+    In-memory table of the file and sheet records of one run.
+    """
+    def __init__(self):
+        self.files = {}     # path -> dòng kết quả cuối cùng của tệp
+        self.sheets = []
+
+    def add_sheet(self, event):
+        """
+        Records a "sheet" event of a worker.
+        """
+        self.sheets.append({field: event.get(field) for field in SHEET_FIELDS})
+
+    def set_file(self, path, status, attempts, error=None, event=None):
+        """
+        Records the final outcome of a file; event is its last "done" event, if any.
+        """
+        result = (event or {}).get("result") or {}
+        timings = result.get("timings") or {}
+        row = {
+            "path": path, "status": status, "attempts": attempts,
+            "duration": (event["end"] - event["start"]) if event else 0.0,
+            "pid": event["pid"] if event else None,
+            "value": result.get("value"), "modified": result.get("modified"),
+            "sheets": result.get("sheets"), "error": error,
+        }
+        row.update({phase: timings.get(phase) for phase in PHASES})
+        self.files[path] = row
+
+    def file_rows(self):
+        return list(self.files.values())
+
+    def sheet_rows(self):
+        return list(self.sheets)
+
+    def __len__(self):
+        return len(self.files)
+
+    def to_jsonl(self, path):
+        """
+        Writes every file row then every sheet row as JSON lines.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            for kind, rows in (("file", self.file_rows()), ("sheet", self.sheet_rows())):
+                for row in rows:
+                    f.write(json.dumps(dict(record=kind, **row), ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def _write_csv(path, fields, rows):
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({field: _csv_value(row.get(field)) for field in fields})
+
+    def to_csv(self, path):
+        """
+        Writes the file rows to path and, if there are any, the sheet rows to <name>.sheets.csv.
+        Returns the paths written.
+        """
+        self._write_csv(path, FILE_FIELDS, self.file_rows())
+        written = [path]
+        if self.sheets:
+            sheets_path = os.path.splitext(path)[0] + ".sheets.csv"
+            self._write_csv(sheets_path, SHEET_FIELDS, self.sheet_rows())
+            written.append(sheets_path)
+        return written
+
+    def export(self, path):
+        """
+        Writes the table as CSV or JSONL, chosen by the extension of path. Returns the paths written.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        if path.lower().endswith(".csv"):
+            return self.to_csv(path)
+        self.to_jsonl(path)
+        return [path]
@@ -0,0 +1,152 @@
+# run_manifest.py
+"""
+Persistent run manifest for incremental runs.
+
+The manifest of a directory remembers, for every workbook processed successfully, the key
+(size, mtime_ns, content hash or None) it had after processing and the job it was processed
+with (job_key: the hash of the .bas file and the macro name, or the recipe). On the next run,
+files whose key and job are unchanged are skipped, unless the run is forced.
+
+The check is stat-based: os.scandir() returns the directory entries with their stat data
+in one pass and each file costs one dict lookup, so 100k-file directories are checked in
+well under a second. With use_content_hash, a file whose size is unchanged but whose mtime
+moved (copied, touched) is hashed and skipped if its content is the same.
+
+Manifests are stored as JSON under <cache>/manifests/, one per directory.
+"""
+import os
+import json
+import hashlib
+import logging
+
+from gv import CACHE_DIR
+from mpp_logger import LoggingMultiProcess
+
+logger = logging.getLogger(LoggingMultiProcess.MAIN_LOGGER)
+
+MANIFEST_DIR = os.path.join(CACHE_DIR, "manifests")
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_hash(path):
+    """
+    Returns the SHA-256 hex digest of the content of path.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def macro_hash(bas_path):
+    """
+    Returns the hash of the .bas file used for the run, or "" if it cannot be read.
+    """
+    try:
+        return file_hash(bas_path)
+    except OSError:
+        return ""
+
+
+def job_key(bas_path, macro_name, recipe=None):
+    """
+    Identifies what a run does to each workbook: the recipe, or the .bas file (its hash) and
+    the macro run from it. A file is only skipped when it was processed by the same job.
+    """
+    if recipe:
+        return f"recipe:{recipe}"
+    return f"{macro_hash(bas_path)}:{(macro_name or '').lower()}"
+
+
+def scan_excel_files(directory, extension=".xlsx"):
+    """
+    Lists the workbooks of directory with their stat results, in one os.scandir() pass.
+    Returns a list of (path, stat_result) sorted by path.
+    """
+    found = []
+    with os.scandir(os.path.abspath(directory)) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith(extension) and entry.is_file():
+                found.append((entry.path, entry.stat()))
+    found.sort(key=lambda item: item[0])
+    return found
+
+
+def manifest_path_for(directory):
+    name = hashlib.sha1(os.path.abspath(directory).encode("utf-8")).hexdigest()
+    return os.path.join(MANIFEST_DIR, f"{name}.json")
+
+
+class RunManifest:
+    """
+    {absolute path: [size, mtime_ns, content_hash or None, job_key]} of one directory.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+
+    @classmethod
+    def for_directory(cls, directory):
+        return cls(manifest_path_for(directory)).load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Không đọc được manifest {self.path}: {e}")
+            self.entries = {}
+        return self
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Không lưu được manifest {self.path}: {e}")
+
+    def is_unchanged(self, path, st, job, use_content_hash=False):
+        entry = self.entries.get(path)
+        if entry is None or entry[3] != job or entry[0] != st.st_size:
+            return False
+        if entry[1] == st.st_mtime_ns:
+            return True
+        if use_content_hash and entry[2]:
+            try:
+                return file_hash(path) == entry[2]
+            except OSError:
+                return False
+        return False
+
+    def record(self, path, job, use_content_hash=False):
+        """
+        Records the current state of path (to be called after it was processed successfully).
+        """
+        try:
+            st = os.stat(path)
+            content = file_hash(path) if use_content_hash else None
+        except OSError:
+            self.entries.pop(path, None)
+            return
+        self.entries[path] = [st.st_size, st.st_mtime_ns, content, job]
+
+    def split(self, scanned, job, force=False, use_content_hash=False):
+        """
+        Splits scanned [(path, stat_result)] into (paths to process, paths skipped as unchanged).
+        With force, every file is processed.
+        """
+        if force:
+            return [path for path, _ in scanned], []
+        to_process, skipped = [], []
+        for path, st in scanned:
+            if self.is_unchanged(path, st, job, use_content_hash):
+                skipped.append(path)
+            else:
+                to_process.append(path)
+        return to_process, skipped
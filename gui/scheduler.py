@@ -0,0 +1,510 @@
+# scheduler.py
+"""
+Dynamic (work-stealing) scheduling of Excel files over supervised worker processes.
+
+Instead of splitting the file list into cpu_count() fixed slices up front, the files are
+put on a shared task queue in small chunks. Every worker runs worker.process_queue(), which
+pulls the next chunk as soon as it is idle, so one slow workbook only delays its own chunk.
+
+Chunk sizes are guided: large while a lot of work remains, shrinking to single files near
+the end of the run so that the tail is spread over all workers.
+
+Files are dispatched in the order chosen by ordering.order_files (longest-expected-first by
+default) and chunk sizes follow the estimated cost, so an expensive file is handed out alone.
+
+Each worker reports the start and end time of every file on a result queue; RunSummary turns
+these into per-worker busy / idle times and the estimated vs actual makespan for the run report.
+The durations of the files processed successfully are recorded in the DurationHistory used by
+the next run of the same job (macro or recipe) on the same backend. The same queue carries the
+structured results (macro return values, timings, per-sheet records), collected in
+RunSummary.results (result_table.ResultTable).
+
+Errors are isolated per file: a failed workbook is put back on the task queue (after an
+exponential backoff, on a fresh Excel session) until MAX_ATTEMPTS is reached, and the files
+that still fail are written to a failure manifest at the end of the run.
+
+A per-file deadline (FILE_TIMEOUT, overridable per run) guards against macros that never
+return: the worker stuck on such a file is killed with its Excel process and replaced
+(workerpool.WorkerPool), the file is reported as "timeout" and the run goes on.
+
+A run is cancelled cooperatively through stop_event: the task queue is emptied and the
+workers stop starting new files at once; the files being processed either finish, or are
+aborted after cancel_grace seconds. The workers then exit normally and close their Excel
+sessions, and every file that was not processed is reported as "cancelled".
+
+The macro is given per run (macro_file, macro_name, backend): every chunk on the task queue
+carries it as its job, so the same workers could serve runs with different macros. The
+"native" backend runs macros with the in-process VBA interpreter (native_excel.py); a macro it
+cannot run is reported before the run starts and the run goes to the COM backend instead. A job
+may name a Python recipe (recipes.py) instead of a macro; it is applied in-process, without Excel. Callers
+that need each result as soon as it is final (the command-line runner streams them as JSONL)
+pass on_file_done.
+
+By default every run starts its own WorkerPool and stops it at the end. Given a pool (the warm
+pool of pool_service.PoolService), the run uses its queues and workers, resized to
+num_processes, and leaves them running for the next run.
+
+With a concurrency controller (concurrency.AdaptiveConcurrency), num_processes is only the
+upper bound used for chunking: the pool starts small (a shared pool at its current warm size)
+and is resized during the run to the worker count chosen by the controller from the measured
+throughput.
+"""
+import os
+import json
+import time
+import heapq
+import queue
+import logging
+
+import worker
+import backends
+import run_manifest
+from workerpool import WorkerPool
+from mpp_logger import LoggingMultiProcess
+from ordering import DurationHistory, order_files, estimate_makespan, file_size
+from gv import CACHE_DIR
+from result_table import ResultTable
+
+logger = logging.getLogger(LoggingMultiProcess.MAIN_LOGGER)
+
+# Số tệp tối đa trong một lần phát việc cho worker.
+DEFAULT_MAX_CHUNK = 4
+# Số phần mà khối lượng việc còn lại được chia cho mỗi worker khi tính kích thước chunk.
+CHUNK_FACTOR = 4
+# Số lần thử tối đa cho một tệp (lần đầu + các lần thử lại).
+MAX_ATTEMPTS = 3
+# Thời gian chờ trước lần thử lại đầu tiên, nhân đôi sau mỗi lần.
+RETRY_BACKOFF = 2.0
+# Chu kỳ (giây) vòng lặp điều phối kiểm tra hàng đợi kết quả.
+POLL_INTERVAL = 0.2
+# Thời hạn mặc định (giây) cho một tệp; None để tắt watchdog.
+FILE_TIMEOUT = 600.0
+# Thời gian (giây) cho các tệp đang xử lý khi huỷ chạy; None để chờ chúng xong.
+CANCEL_GRACE = 30.0
+
+
+def make_chunks(files, num_workers, max_chunk=DEFAULT_MAX_CHUNK, costs=None):
+    """
+    Splits files, in order, into guided chunks: each chunk holds about
+    remaining_cost / (CHUNK_FACTOR * num_workers) of the work, with 1 to max_chunk files.
+    Without costs every file counts as 1; the last chunks always hold a single file, and so
+    does any file that is expensive on its own.
+    """
+    if costs is None:
+        costs = [1] * len(files)
+    chunks = []
+    start = 0
+    total = len(files)
+    remaining_cost = sum(costs)
+    while start < total:
+        target = remaining_cost / (CHUNK_FACTOR * max(num_workers, 1))
+        end = start + 1
+        chunk_cost = costs[start]
+        while end < total and end - start < max_chunk and chunk_cost + costs[end] <= target:
+            chunk_cost += costs[end]
+            end += 1
+        chunks.append(files[start:end])
+        remaining_cost -= chunk_cost
+        start = end
+    return chunks
+
+
+class WorkerStats:
+    """
+    Busy time and file count of one worker process during a run.
+    """
+    def __init__(self, pid):
+        self.pid = pid
+        self.files = 0
+        self.busy = 0.0
+
+    def add(self, start, end):
+        self.files += 1
+        self.busy += max(0.0, end - start)
+
+
+class RunSummary:
+    """
+    Collects the per-file events sent by the workers and reports busy / idle time per worker,
+    the final outcome of every file (ok / failed / timeout / cancelled, with the number of
+    attempts) and the retries. results holds the result records of the files and sheets.
+    """
+    def __init__(self, total_files=0, num_workers=0, ordering="fifo", estimated_makespan=None):
+        self.total_files = total_files
+        self.num_workers = num_workers
+        self.ordering = ordering
+        self.estimated_makespan = estimated_makespan
+        self.workers = {}
+        self.events = []
+        self.outcomes = {}
+        self.results = ResultTable()
+        self.retried = 0
+        self.cancelled_run = False
+        self.concurrency = None
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def record(self, event):
+        """
+        Records a "done" event (or a synthesized one for a timed-out / crashed file).
+        """
+        if event["status"] == "cancelled" and event["start"] == event["end"]:
+            return  # tệp chưa được bắt đầu: không tính vào thời gian bận của worker
+        self.events.append(event)
+        stats = self.workers.get(event["pid"])
+        if stats is None:
+            stats = self.workers[event["pid"]] = WorkerStats(event["pid"])
+        stats.add(event["start"], event["end"])
+
+    def set_outcome(self, path, status, attempts, error=None):
+        self.outcomes[path] = {"status": status, "attempts": attempts, "error": error}
+
+    @property
+    def failed(self):
+        return {path: o for path, o in self.outcomes.items() if o["status"] in ("failed", "timeout")}
+
+    @property
+    def cancelled(self):
+        return {path: o for path, o in self.outcomes.items() if o["status"] == "cancelled"}
+
+    @property
+    def timed_out(self):
+        return {path: o for path, o in self.outcomes.items() if o["status"] == "timeout"}
+
+    def write_failure_manifest(self, path):
+        """
+        Writes the files that did not succeed, with their last error and attempt count, as JSON.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        manifest = {
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.finished_at or time.time())),
+            "total_files": self.total_files,
+            "failed": [dict(path=p, **o) for p, o in sorted(self.failed.items())],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=4)
+
+    def finish(self):
+        self.finished_at = time.time()
+
+    @property
+    def wall_time(self):
+        end = self.finished_at if self.finished_at is not None else time.time()
+        return end - self.started_at
+
+    @property
+    def processed(self):
+        return sum(1 for o in self.outcomes.values() if o["status"] == "ok")
+
+    @property
+    def actual_makespan(self):
+        """
+        Time from the first file started to the last file finished (worker start-up excluded).
+        """
+        if not self.events:
+            return 0.0
+        return max(e["end"] for e in self.events) - min(e["start"] for e in self.events)
+
+    def format_lines(self):
+        """
+        Returns the run report as a list of lines, one per worker plus a header line.
+        """
+        wall = self.wall_time
+        lines = [
+            f"Tổng kết: {self.processed}/{self.total_files} tệp thành công, {len(self.failed)} lỗi "
+            f"({len(self.timed_out)} quá hạn), {len(self.cancelled)} huỷ, {self.retried} lần thử lại, {self.num_workers} worker, thời gian chạy {wall:.2f}s"
+        ]
+        if self.estimated_makespan is not None:
+            lines.append(
+                f"  Thứ tự phát tệp '{self.ordering}': makespan ước tính {self.estimated_makespan:.2f}s, "
+                f"thực tế {self.actual_makespan:.2f}s"
+            )
+        for pid in sorted(self.workers):
+            stats = self.workers[pid]
+            idle = max(0.0, wall - stats.busy)
+            busy_pct = (stats.busy / wall * 100) if wall > 0 else 0
+            lines.append(
+                f"  Worker ({pid}): {stats.files} tệp, bận {stats.busy:.2f}s ({busy_pct:.0f}%), "
+                f"rảnh {idle:.2f}s"
+            )
+        if self.concurrency is not None:
+            lines.extend(self.concurrency.format_lines())
+        return lines
+
+
+def run_files(excel_files, num_processes, mp_logging, progress_queue, max_chunk=DEFAULT_MAX_CHUNK,
+              ordering="history", history=None, max_attempts=MAX_ATTEMPTS, retry_backoff=RETRY_BACKOFF,
+              file_timeout=FILE_TIMEOUT, stop_event=None, cancel_grace=CANCEL_GRACE, macro_file=None,
+              macro_name=None, backend=backends.DEFAULT_BACKEND, on_file_done=None, pool=None,
+              concurrency=None, recipe=None, per_sheet=False):
+    """
+    Processes excel_files on num_processes supervised workers fed from a shared task queue.
+
+    Parameters:
+        excel_files (list): paths of the workbooks to process.
+        num_processes (int): number of worker processes.
+        mp_logging (LoggingMultiProcess): provides the shared log queue, log level and Manager.
+        progress_queue: queue receiving one item per file that reached its final outcome.
+        max_chunk (int): upper bound of files handed to a worker at once (1 = one at a time).
+        ordering (str): dispatch order, a key of ordering.ORDERINGS.
+        history (DurationHistory): recorded durations; loaded from the default cache file when None.
+            The job and backend of this run are selected in it, and the durations of the files
+            processed successfully are recorded into it and saved.
+        max_attempts (int): attempts per file before it is reported as failed.
+        retry_backoff (float): delay before the first retry, doubled for each following one.
+        file_timeout (float): deadline in seconds for one file, None to disable the watchdog.
+        stop_event (threading.Event): when set, the run is cancelled (see module docstring).
+        cancel_grace (float): seconds the files in progress may still run after cancellation;
+            None lets them finish.
+        macro_file (str): .bas module imported into every workbook (worker.DEFAULT_MACRO_FILE when None).
+        macro_name (str): macro run on every workbook (worker.DEFAULT_MACRO_NAME when None).
+        backend (str): Excel automation backend, a key of backends.BACKENDS. With "native", the macro
+            is checked first (native_excel.check_macro) and the run falls back to "com" if it uses
+            constructs the interpreter does not support.
+        recipe (str): name of a Python recipe (recipes.RECIPES) applied to every workbook instead of
+            the macro; macro_file, macro_name and backend are then not used.
+        per_sheet (bool): run the macro once per worksheet with its name (like RunVBA(sheetName))
+            and collect one result record per worksheet.
+        on_file_done (callable): called in the supervisor with {"path", "status", "duration", "pid",
+            "attempts", "error", "result"} once per file, when its final outcome is known; result is
+            the record returned by worker.process_excel_file, or None.
+
+    Returns:
+        RunSummary: per-file outcomes, per-worker busy / idle times and estimated vs actual makespan.
+    """
+    if backend not in backends.BACKENDS:
+        raise ValueError(f"Backend không hợp lệ: {backend} (chọn một trong {', '.join(backends.BACKENDS)})")
+    job = {
+        "macro_file": os.path.abspath(macro_file or worker.DEFAULT_MACRO_FILE),
+        "macro_name": macro_name or worker.DEFAULT_MACRO_NAME,
+        "backend": backend,
+        "recipe": recipe,
+        "per_sheet": per_sheet,
+    }
+    if recipe is not None:
+        import recipes
+        if recipe not in recipes.RECIPES:
+            raise ValueError(f"Recipe không hợp lệ: {recipe} (chọn một trong {', '.join(recipes.RECIPES)})")
+        logger.info(f"Áp dụng recipe '{recipe}' thay cho macro")
+    elif backend == "native":
+        # Macro dùng cấu trúc mà trình thông dịch không hỗ trợ: cả lượt chạy chuyển sang COM.
+        import native_excel
+        reasons = native_excel.check_macro(job["macro_file"], job["macro_name"])
+        if reasons:
+            logger.warning(f"Backend native không chạy được {job['macro_file']}, chuyển sang COM:\n  "
+                           + "\n  ".join(reasons))
+            job["backend"] = backend = "com"
+    if history is None:
+        history = DurationHistory().load()
+    history.select(job["backend"], run_manifest.job_key(job["macro_file"], job["macro_name"], recipe))
+    excel_files, costs = order_files(excel_files, ordering, history)
+    chunk_workers = num_processes
+    if concurrency is not None:
+        chunk_workers = concurrency.max_workers
+        # Nhóm worker dùng chung: bắt đầu từ số worker đang ấm thay vì thu nhỏ nó về min_workers.
+        num_processes = concurrency.start(workers=pool.size if pool is not None else None)
+    estimated = estimate_makespan(costs, chunk_workers)
+    logger.info(f"Thứ tự phát tệp '{ordering}': makespan ước tính {estimated:.2f}s")
+
+    summary = RunSummary(len(excel_files), num_processes, ordering, estimated)
+    summary.concurrency = concurrency
+    owns_pool = pool is None
+    if owns_pool:
+        task_queue = mp_logging.manager.Queue()
+        result_queue = mp_logging.manager.Queue()
+        cancel_event = mp_logging.manager.Event()
+    else:
+        task_queue, result_queue, cancel_event = pool.task_queue, pool.result_queue, pool.cancel_event
+        cancel_event.clear()
+        while True:
+            # Bỏ các sự kiện muộn của lượt chạy trước (worker bị dừng khi huỷ, ...).
+            try:
+                result_queue.get_nowait()
+            except queue.Empty:
+                break
+
+    chunks = make_chunks(excel_files, chunk_workers, max_chunk, costs)
+    for chunk in chunks:
+        task_queue.put((job, [(file_path, 0) for file_path in chunk]))
+    logger.info(f"Đã xếp {len(excel_files)} tệp thành {len(chunks)} phần việc cho {num_processes} worker")
+
+    if owns_pool:
+        pool = WorkerPool(num_processes, task_queue, result_queue, cancel_event, mp_logging, backend).start()
+    else:
+        pool.resize(num_processes)
+
+    pending = set(excel_files)
+    retry_heap = []
+    held = {}        # pid -> {path: attempt} các tệp worker đã nhận nhưng chưa xong
+    in_flight = {}   # pid -> sự kiện "start" của tệp worker đang xử lý
+    cancel_started = None
+
+    def report(file_path, status, attempts, error=None, event=None):
+        # Kết quả cuối cùng của một tệp: ghi vào tổng kết, cập nhật tiến trình, gọi on_file_done.
+        summary.set_outcome(file_path, status, attempts, error)
+        summary.results.set_file(file_path, status, attempts, error, event)
+        pending.discard(file_path)
+        progress_queue.put(1)
+        if on_file_done is not None:
+            on_file_done({
+                "path": file_path, "status": status,
+                "duration": (event["end"] - event["start"]) if event else 0.0,
+                "pid": event["pid"] if event else None, "attempts": attempts, "error": error,
+                "result": event.get("result") if event else None,
+            })
+
+    def finish_attempt(event):
+        # Ghi nhận kết quả một lần thử: thành công, đưa vào hàng đợi thử lại, hoặc lỗi cuối cùng.
+        summary.record(event)
+        file_path, attempts = event["path"], event["attempt"] + 1
+        if event["status"] == "cancelled":
+            attempts -= 1
+        if event["status"] == "failed" and attempts < max_attempts and cancel_started is None:
+            delay = retry_backoff * (2 ** (attempts - 1))
+            summary.retried += 1
+            logger.warning(f"Tệp lỗi (lần {attempts}/{max_attempts}), thử lại sau {delay:.1f}s: "
+                           f"{file_path}: {event['error']}")
+            heapq.heappush(retry_heap, (time.time() + delay, file_path, attempts))
+            return
+        if event["status"] in ("failed", "timeout"):
+            logger.error(f"Tệp {event['status']} sau {attempts} lần thử: {file_path}: {event['error']}")
+        report(file_path, event["status"], attempts, event["error"], event)
+
+    def release_worker(pid, reason, status):
+        # Worker pid không còn: kết thúc tệp đang xử lý với status, trả các tệp chưa bắt đầu về hàng đợi.
+        started = in_flight.pop(pid, None)
+        tasks = held.pop(pid, {})
+        if started is not None:
+            tasks.pop(started["path"], None)
+            finish_attempt({"type": "done", "pid": pid, "path": started["path"], "start": started["start"],
+                            "end": time.time(), "status": status, "error": reason,
+                            "attempt": started["attempt"]})
+        if tasks and cancel_started is None:
+            task_queue.put((job, list(tasks.items())))
+        else:
+            for file_path, attempt in tasks.items():
+                cancel_file(file_path, attempt)
+
+    def cancel_file(file_path, attempts):
+        report(file_path, "cancelled", attempts)
+
+    def handle_event(event, exited=()):
+        # Một sự kiện của worker; exited: pid các worker đã thoát nhưng sự kiện cuối vẫn cần xử lý.
+        pid = event["pid"]
+        if pid not in pool.workers and pid not in exited:
+            return  # sự kiện muộn của một worker đã bị dừng
+        if event["type"] == "take":
+            held.setdefault(pid, {}).update(dict(event["tasks"]))
+        elif event["type"] == "release":
+            # Worker được yêu cầu thoát (bớt worker) trả lại các tệp chưa bắt đầu của phần việc.
+            tasks = held.get(pid, {})
+            for file_path, attempt in event["tasks"]:
+                tasks.pop(file_path, None)
+            if cancel_started is None:
+                task_queue.put((job, list(event["tasks"])))
+            else:
+                for file_path, attempt in event["tasks"]:
+                    cancel_file(file_path, attempt)
+        elif event["type"] == "start":
+            in_flight[pid] = event
+        elif event["type"] == "sheet":
+            summary.results.add_sheet(event)
+        else:
+            in_flight.pop(pid, None)
+            held.get(pid, {}).pop(event["path"], None)
+            finish_attempt(event)
+
+    # Vòng lặp điều phối: nhận sự kiện từ worker, đưa tệp lỗi vào hàng đợi thử lại (có backoff),
+    # giám sát thời hạn từng tệp và chỉ kết thúc khi mọi tệp đã có kết quả cuối cùng.
+    while pending:
+        now = time.time()
+        if stop_event is not None and stop_event.is_set() and cancel_started is None:
+            # Huỷ: worker không nhận tệp mới nữa, các tệp còn trong hàng đợi và chờ thử lại bị huỷ.
+            cancel_started = now
+            summary.cancelled_run = True
+            cancel_event.set()
+            logger.warning("Đang huỷ: không phát thêm tệp mới, chờ các tệp đang xử lý"
+                           + (f" tối đa {cancel_grace:.0f}s" if cancel_grace is not None else " xong"))
+            sentinels = 0
+            while True:
+                try:
+                    chunk = task_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if chunk is None:
+                    sentinels += 1  # yêu cầu thoát dành cho worker, trả lại sau
+                    continue
+                for file_path, attempt in chunk[1]:
+                    cancel_file(file_path, attempt)
+            for _ in range(sentinels):
+                task_queue.put(None)
+            for _, file_path, attempt in retry_heap:
+                cancel_file(file_path, attempt)
+            retry_heap.clear()
+        if cancel_started is not None and cancel_grace is not None and now - cancel_started > cancel_grace:
+            for pid, started in list(in_flight.items()):
+                logger.warning(f"Hết thời gian chờ khi huỷ, dừng worker ({pid}): {started['path']}")
+                pool.kill(pid, started.get("excel_pid"))
+                release_worker(pid, "cancelled", "cancelled")
+
+        while retry_heap and retry_heap[0][0] <= now:
+            _, file_path, attempt = heapq.heappop(retry_heap)
+            task_queue.put((job, [(file_path, attempt)]))
+
+        if file_timeout is not None:
+            for pid, started in list(in_flight.items()):
+                if now - started["start"] > file_timeout:
+                    logger.critical(f"Tệp vượt quá thời hạn {file_timeout:.0f}s, dừng worker ({pid}): "
+                                    f"{started['path']}")
+                    if cancel_started is None:
+                        pool.replace(pid, started.get("excel_pid"))
+                    else:
+                        pool.kill(pid, started.get("excel_pid"))
+                    release_worker(pid, f"timeout after {file_timeout:.0f}s", "timeout")
+        for pid in pool.reap():
+            release_worker(pid, "worker process died", "failed")
+            if cancel_started is None:
+                pool.spawn()
+        retired = pool.take_retired()
+        if retired:
+            # Worker đã thoát theo yêu cầu: xử lý hết các sự kiện nó đã gửi (tệp xong, tệp trả lại)
+            # trước khi trả các tệp nó còn giữ về hàng đợi.
+            while True:
+                try:
+                    handle_event(result_queue.get_nowait(), retired)
+                except queue.Empty:
+                    break
+            for pid in retired:
+                release_worker(pid, "worker retired", "failed")
+        if concurrency is not None and cancel_started is None:
+            target = concurrency.update(now, len(excel_files) - len(pending), len(pending))
+            if target != pool.size:
+                pool.resize(target)
+
+        try:
+            event = result_queue.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            continue
+        handle_event(event)
+
+    if concurrency is not None:
+        summary.num_workers = concurrency.workers
+    if owns_pool:
+        pool.stop()
+    summary.finish()
+
+    # Chỉ các tệp xử lý thành công: thời gian của lần lỗi, hết hạn hay bị hủy không dự báo được lượt sau.
+    for event in summary.events:
+        if event["status"] == "ok" and summary.outcomes.get(event["path"], {}).get("status") == "ok":
+            history.record(event["path"], file_size(event["path"]), event["end"] - event["start"])
+    history.save()
+
+    if summary.failed:
+        manifest_path = os.path.join(CACHE_DIR, "failures",
+                                     time.strftime("failed_%Y%m%d_%H%M%S.json", time.localtime(summary.finished_at)))
+        try:
+            summary.write_failure_manifest(manifest_path)
+            logger.error(f"{len(summary.failed)} tệp lỗi, danh sách lưu tại: {manifest_path}")
+        except OSError as e:
+            logger.error(f"Không ghi được danh sách tệp lỗi {manifest_path}: {e}")
+    return summary
@@ -1,13 +1,35 @@
+import sys
+import threading
+
 import excel_vba
 
-# Define the path to your .bas VBA script and the list of Excel file paths.
+# Define the path to your .bas VBA script and the list of Excel file paths
+# (or pass them on the command line: python test_cpp_lib.py script.bas file1.xlsx file2.xlsx).
 vba_script = r"C:\path\to\your_script.bas"
 excel_files = [
     r"C:\path\to\file1.xlsx",
     r"C:\path\to\file2.xlsx",
     # add other files as needed
 ]
+if len(sys.argv) > 2:
+    vba_script, excel_files = sys.argv[1], sys.argv[2:]
+
+print(f"excel_vba ({excel_vba.IMPLEMENTATION})")
+
+
+def on_sheet(record):
+    # Called for every worksheet as soon as its macro returns; Python keeps running meanwhile.
+    if record.ok:
+        print(f"{record.path} [{record.sheet}]: macro returned {record.result}")
+    else:
+        print(f"{record.path} [{record.sheet}]: error {record.error}")
+
+
+# Press Enter to cancel before the next worksheet.
+cancel = excel_vba.CancelToken()
+threading.Thread(target=lambda: sys.stdin.readline() and cancel.cancel(), daemon=True).start()
 
-results = excel_vba.run_vba_on_all_files(vba_script, excel_files)
-for result in results:
-    print("Macro returned:", result)
+results = excel_vba.run_vba_on_all_files(vba_script, excel_files, callback=on_sheet, cancel=cancel)
+failed = [r for r in results if not r.ok]
+print(f"{len(results) - len(failed)} worksheets processed, {len(failed)} errors"
+      + (" (cancelled)" if cancel.cancelled else ""))
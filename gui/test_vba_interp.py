@@ -0,0 +1,294 @@
+# test_vba_interp.py
+"""
+Tests of the VBA subset interpreter (vba_interp.py) and of the object model of the native backend
+(native_excel.py) it runs against: parsing, control flow, argument passing, Range.End,
+WorksheetFunction.Sum, NumberFormat and check_module().
+
+    python -m pytest gui/test_vba_interp.py
+"""
+import pytest
+
+import vba_interp
+from vba_interp import parse_module, check_module, Interpreter, VBARuntimeError
+
+
+def run(source, name="Main", *args):
+    """
+    Runs procedure name of source; returns (its result, the lines of Debug.Print / MsgBox).
+    """
+    output = []
+    result = Interpreter(parse_module(source), output=output.append).run(name, *args)
+    return result, output
+
+
+# -- Analyse ------------------------------------------------------------------
+
+def test_parse_procedures_and_declarations():
+    module = parse_module('''
+Option Explicit
+Dim counter As Long
+Const LIMIT = 10
+
+Public Sub Main(ByVal a As Long, Optional b As String = "x")
+    Dim i As Long, s As String
+End Sub
+
+Private Function Twice(n As Double) As Double
+    Twice = n * 2
+End Function
+''')
+    assert set(module.procedures) == {"main", "twice"}
+    main = module.procedures["main"]
+    assert main.kind == "sub"
+    assert [(p[0], p[1], p[2], p[4]) for p in main.params] == [("a", "long", False, True), ("b", "string", True, False)]
+    assert {name for name, _, _ in main.locals} == {"i", "s"}
+    assert module.procedures["twice"].kind == "function"
+    assert module.procedures["twice"].return_type == "double"
+    assert [name for name, _, _ in module.variables] == ["counter", "limit"]
+    assert module.issues == []
+
+
+def test_function_result_and_module_variables():
+    result, _ = run('''
+Dim total As Long
+Function Add(a As Long, b As Long) As Long
+    total = total + 1
+    Add = a + b
+End Function
+Function Main() As Long
+    Main = Add(2, 3) * 10 + total
+End Function
+''')
+    assert result == 51
+
+
+def test_with_block():
+    _, output = run('''
+Sub Main()
+    With Debug
+        .Print "inside"
+    End With
+End Sub
+''')
+    assert output == ["inside"]
+
+
+# -- Luồng điều khiển -----------------------------------------------------------
+
+def test_for_next_with_step():
+    _, output = run('''
+Sub Main()
+    Dim i As Long, s As String
+    For i = 10 To 1 Step -3
+        s = s & i & ","
+    Next i
+    Debug.Print s
+    Debug.Print i
+    s = ""
+    For i = 1 To 5 Step 2
+        s = s & i
+    Next
+    Debug.Print s
+End Sub
+''')
+    assert output == ["10,7,4,1,", "-2", "135"]
+
+
+@pytest.mark.parametrize("value, expected", [(5, "small"), (50, "medium"), (500, "large")])
+def test_if_elseif_else(value, expected):
+    result, _ = run('''
+Function Main(x As Long) As String
+    If x < 10 Then
+        Main = "small"
+    ElseIf x < 100 Then
+        Main = "medium"
+    Else
+        Main = "large"
+    End If
+End Function
+''', "Main", value)
+    assert result == expected
+
+
+# -- Truyền tham số -------------------------------------------------------------
+
+BYREF_SOURCE = '''
+Dim g As Long
+Sub Inc(x As Long)
+    x = x + 1
+End Sub
+Sub IncByRef(ByRef x As Long)
+    x = x + 1
+End Sub
+Sub IncByVal(ByVal x As Long)
+    x = x + 1
+End Sub
+Function Main() As String
+    Dim n As Long
+    n = 1
+    Inc n
+    Main = Main & n
+    Call Inc(n)
+    Main = Main & n
+    IncByRef n
+    Main = Main & n
+    IncByVal n
+    Main = Main & n
+    Inc (n)
+    Main = Main & n
+    Inc n + 0
+    Main = Main & n
+    Inc g
+    Main = Main & g
+End Function
+'''
+
+
+def test_arguments_are_byref_by_default():
+    # ByRef khi không ghi gì; ByVal, biểu thức và tham số trong ngoặc "Inc (n)" truyền theo giá trị.
+    result, _ = run(BYREF_SOURCE)
+    assert result == "2344441"
+
+
+def test_byref_named_argument_and_function_call():
+    result, _ = run('''
+Function Twice(x As Long) As Long
+    x = x * 2
+    Twice = x
+End Function
+Function Main() As String
+    Dim m As Long, r As Long
+    m = 3
+    r = Twice(x:=m)
+    Main = m & "," & r
+End Function
+''')
+    assert result == "6,6"
+
+
+# -- Mô hình đối tượng của backend native ---------------------------------------------
+
+@pytest.fixture
+def workbook(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Data"
+    for row in (["Month", "Sales"], ["Jan", 10], ["Feb", 20.5], ["Mar", "n/a"], ["Apr", 4]):
+        ws.append(row)
+    path = str(tmp_path / "book.xlsx")
+    wb.save(path)
+    return path
+
+
+def run_native(path, tmp_path, source, name="Main"):
+    """
+    Runs procedure name of source on the workbook at path with the native backend, saves it and
+    returns (the macro result, the reloaded openpyxl workbook, the Debug.Print lines).
+    """
+    import openpyxl
+    import native_excel
+    macro_file = tmp_path / "macro.bas"
+    macro_file.write_text(source, encoding="utf-8")
+    output = []
+    app = native_excel.NativeExcel(output=output.append)
+    book = app.Workbooks.Open(path)
+    try:
+        book.VBProject.VBComponents.Import(str(macro_file))
+        result = app.Run(name)
+        book.Save()
+    finally:
+        book.Close()
+    return result, openpyxl.load_workbook(path), output
+
+
+def test_end_xlup_and_worksheet_function_sum(workbook, tmp_path):
+    result, wb, _ = run_native(workbook, tmp_path, '''
+Function Main() As String
+    Dim ws As Worksheet, lastRow As Long, lastCol As Long
+    Set ws = ThisWorkbook.Worksheets("Data")
+    lastRow = ws.Cells(ws.Rows.Count, "A").End(xlUp).Row
+    lastCol = ws.Cells(1, ws.Columns.Count).End(xlToLeft).Column
+    ws.Cells(lastRow + 1, 2).Value = Application.WorksheetFunction.Sum(ws.Range("B2:B" & lastRow))
+    Main = lastRow & "," & lastCol
+End Function
+''')
+    assert result == "5,2"
+    # Sum bỏ qua ô chữ trong vùng, như Excel.
+    assert wb["Data"]["B6"].value == 34.5
+
+
+def test_number_format(workbook, tmp_path):
+    _, wb, output = run_native(workbook, tmp_path, '''
+Sub Main()
+    Dim fmt As String
+    With ThisWorkbook.Worksheets("Data")
+        .Range("B2:B3").NumberFormat = "0.00%"
+        fmt = .Cells(2, 2).NumberFormat
+    End With
+    Debug.Print fmt
+End Sub
+''')
+    assert output == ["0.00%"]
+    ws = wb["Data"]
+    assert ws["B2"].number_format == "0.00%"
+    assert ws["B3"].number_format == "0.00%"
+    assert ws["B5"].number_format == "General"
+
+
+def test_runtime_error_reports_the_line(workbook, tmp_path):
+    with pytest.raises(VBARuntimeError, match="Dòng 4"):
+        run_native(workbook, tmp_path, '''
+Sub Main()
+    Dim d As Double
+    d = ThisWorkbook.Worksheets("Data").Range("B4").Value
+End Sub
+''')
+
+
+# -- check_module ---------------------------------------------------------------
+
+def test_check_module_reports_unsupported_constructs():
+    module = parse_module('''
+Sub Main()
+    Dim x As Long
+    GoTo Done
+    x = Foo(1)
+    ActiveSheet.Shapes.AddPicture "a.png"
+Done:
+End Sub
+''')
+    issues = check_module(module, members={"activesheet"})
+    messages = [message for _, message in issues]
+    assert [line for line, _ in issues] == sorted(line for line, _ in issues)
+    assert any("goto" in message.lower() for message in messages)
+    assert any("'foo'" in message for message in messages)
+    assert any(".shapes" in message for message in messages)
+    with pytest.raises(VBARuntimeError):
+        Interpreter(module).run("Main")
+
+
+def test_check_module_reports_array_element_passed_byref():
+    module = parse_module('''
+Sub Inc(x As Long)
+    x = x + 1
+End Sub
+Sub Show(x As Long)
+    Debug.Print x
+End Sub
+Sub Main()
+    Dim data
+    data = ActiveSheet.Range("A1:B2").Value
+    Inc data(1, 1)
+    Show data(1, 1)
+End Sub
+''')
+    issues = check_module(module, members={"activesheet", "range", "value"})
+    assert len(issues) == 1
+    assert "ByRef" in issues[0][1] and "Inc" in issues[0][1]
+
+
+def test_check_module_accepts_supported_module():
+    module = parse_module(BYREF_SOURCE)
+    assert check_module(module) == []
+    assert vba_interp.BUILTINS
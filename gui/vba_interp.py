@@ -0,0 +1,1675 @@
+# vba_interp.py
+"""
+Interpreter for a subset of VBA, used by the "native" backend (native_excel.py) to run .bas
+macros on workbooks loaded in-process, without Excel.
+
+Supported subset
+    Module       Sub / Function (Public, Private; ByVal, ByRef, Optional parameters with
+                 defaults; As types), module-level Dim / Const, Option lines, Attribute lines,
+                 comments (' and Rem), line continuations ( _) and ':' statement separators.
+    Statements   Dim / Static / Const, Set, assignment (Let), Call and call statements with or
+                 without parentheses and with named arguments (Name:=value),
+                 If / ElseIf / Else / End If (block and single-line), For / Next (Step),
+                 For Each / Next, Do [While|Until] ... Loop [While|Until], While / Wend,
+                 Select Case (values, "a To b", "Is <op> x", Case Else), With / End With,
+                 Exit For / Do / Sub / Function, On Error Resume Next / On Error GoTo 0.
+    Expressions  numbers (including &H hex), strings, True / False / Nothing / Empty,
+                 + - * / \\ Mod ^ &, = <> < > <= >=, Is, Not / And / Or / Xor,
+                 member access, calls and indexing of the 2-D arrays returned by Range.Value.
+    Functions    see BUILTINS (string, conversion and math functions, IsEmpty, IsNumeric,
+                 LBound / UBound, MsgBox and Debug.Print, which write to the log).
+
+Objects come from the host (native_excel.NativeExcel): a member Name of a Python object is
+looked up as its get_name / set_name / call_name method (lower case), so the supported object
+model is exactly what the host classes define. Unqualified names that are not variables,
+procedures or built-in functions (Cells, Range, Worksheets, ThisWorkbook, ...) are members of
+the host application object, as in Excel.
+
+Not supported: arrays declared with Dim x(...) / ReDim, GoTo / GoSub and labels,
+On Error GoTo <label>, Resume, user-defined types, Declare, Enum, class modules and events,
+UserForms, file I/O statements, New. Parameters are ByRef unless declared ByVal, as in VBA: a
+variable passed as is (not in parentheses, not an expression) receives the final value of the
+parameter when the procedure returns; an array element passed to a ByRef parameter that the
+procedure assigns is not written back, and check_module() reports it.
+check_module() lists the unsupported constructs and the unknown object members and functions of
+a module before it is run, so the job can be sent to the COM backend instead.
+"""
+import re
+import math
+import datetime
+
+
+class VBASyntaxError(Exception):
+    pass
+
+
+class VBARuntimeError(Exception):
+    pass
+
+
+class _ControlFlow(Exception):
+    pass
+
+
+class _ExitLoop(_ControlFlow):
+    def __init__(self, kind):
+        super().__init__(kind)
+        self.kind = kind
+
+
+class _ExitProcedure(_ControlFlow):
+    pass
+
+
+# Hằng số VBA dùng chung (không phụ thuộc Excel); hằng số xl... do host cung cấp.
+VBA_CONSTANTS = {
+    "vbcrlf": "\r\n", "vbcr": "\r", "vblf": "\n", "vbnewline": "\r\n", "vbtab": "\t",
+    "vbnullstring": "", "vbtrue": -1, "vbfalse": 0,
+    "vbokonly": 0, "vbokcancel": 1, "vbyesno": 4, "vbok": 1, "vbcancel": 2, "vbyes": 6, "vbno": 7,
+    "vbinformation": 64, "vbexclamation": 48, "vbcritical": 16, "vbquestion": 32,
+    "vbbinarycompare": 0, "vbtextcompare": 1,
+}
+
+# Giá trị mặc định của biến theo kiểu khai báo.
+TYPE_DEFAULTS = {
+    "byte": 0, "integer": 0, "long": 0, "longlong": 0, "longptr": 0,
+    "single": 0.0, "double": 0.0, "currency": 0.0, "decimal": 0.0,
+    "string": "", "boolean": False,
+}
+INTEGER_TYPES = ("byte", "integer", "long", "longlong", "longptr")
+FLOAT_TYPES = ("single", "double", "currency", "decimal")
+
+# Câu lệnh không được hỗ trợ (từ khoá đầu dòng).
+UNSUPPORTED_STATEMENTS = {
+    "goto", "gosub", "return", "resume", "redim", "erase", "type", "declare", "enum", "event",
+    "raiseevent", "open", "close", "print", "put", "get", "input", "line", "stop", "end", "implements",
+    "property", "lset", "rset", "mid",
+}
+
+
+# ---------------------------------------------------------------------------
+# Tách dòng và từ tố
+# ---------------------------------------------------------------------------
+
+TOKEN_RE = re.compile(r"""
+    (?P<ws>[ \t]+)
+  | (?P<str>"(?:[^"]|"")*")
+  | (?P<num>&[Hh][0-9A-Fa-f]+&?|(?:\d+\.\d*|\.\d+|\d+)(?:[eE][+-]?\d+)?[#!@%]?)
+  | (?P<id>\[[^\]]+\]|[A-Za-z_][A-Za-z0-9_]*[$%]?)
+  | (?P<op>:=|<>|<=|>=|[-+*/\\^&=<>(),.:])
+""", re.X)
+
+
+def _split_line(text):
+    """
+    Removes the comment of a physical line and splits it on ':' statement separators.
+    A single-line If keeps its ':' separated statements (they belong to the If).
+    """
+    segments, current, in_string, i = [], [], False, 0
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            current.append(ch)
+            if ch == '"':
+                if i + 1 < len(text) and text[i + 1] == '"':
+                    current.append('"')
+                    i += 1
+                else:
+                    in_string = False
+        elif ch == '"':
+            in_string = True
+            current.append(ch)
+        elif ch == "'":
+            break
+        elif ch == ":" and not (i + 1 < len(text) and text[i + 1] == "="):
+            segment = "".join(current)
+            head = segment.strip().lower()
+            if head.startswith("if ") and re.search(r"\bthen\b\s*\S", head):
+                current.append(ch)   # If một dòng: giữ nguyên phần còn lại
+            else:
+                segments.append(segment)
+                current = []
+        else:
+            current.append(ch)
+        i += 1
+    segments.append("".join(current))
+    result = []
+    for segment in segments:
+        segment = segment.strip()
+        if segment and not re.match(r"(?i)rem(\s|$)", segment):
+            result.append(segment)
+    return result
+
+
+def tokenize(text, line):
+    tokens, pos = [], 0
+    while pos < len(text):
+        m = TOKEN_RE.match(text, pos)
+        if m is None:
+            raise VBASyntaxError(f"Dòng {line}: ký tự không hợp lệ {text[pos]!r}")
+        pos = m.end()
+        kind = m.lastgroup
+        value = m.group(kind)
+        if kind == "ws":
+            continue
+        if kind == "str":
+            tokens.append(("str", value[1:-1].replace('""', '"')))
+        elif kind == "num":
+            tokens.append(("num", _parse_number(value)))
+        elif kind == "id":
+            if value.startswith("["):
+                value = value[1:-1]
+            value = value.rstrip("$%")
+            tokens.append(("id", value.lower(), value))
+        else:
+            tokens.append(("op", value))
+    return tokens
+
+
+def _parse_number(text):
+    if text[0] == "&":
+        return int(text[2:].rstrip("&"), 16)
+    text = text.rstrip("#!@%")
+    if any(c in text for c in ".eE"):
+        return float(text)
+    return int(text)
+
+
+def logical_lines(source):
+    """
+    Yields (line_number, tokens) for every statement of source.
+    """
+    physical = source.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    buffer, start = "", None
+    for number, text in enumerate(physical, 1):
+        if start is None:
+            start = number
+        stripped = text.rstrip()
+        if stripped.endswith(" _") or stripped == "_":
+            buffer += stripped[:-1] + " "
+            continue
+        buffer += text
+        for segment in _split_line(buffer):
+            yield start, tokenize(segment, start)
+        buffer, start = "", None
+    if buffer:
+        for segment in _split_line(buffer):
+            yield start, tokenize(segment, start)
+
+
+# ---------------------------------------------------------------------------
+# Phân tích cú pháp
+# ---------------------------------------------------------------------------
+
+class Procedure:
+    def __init__(self, name, kind, params, return_type, line):
+        self.name = name            # tên viết thường
+        self.display_name = name
+        self.kind = kind            # "sub" hoặc "function"
+        self.params = params        # [(tên, kiểu, optional, biểu thức mặc định, byval)]
+        self.return_type = return_type
+        self.body = []
+        self.locals = []            # [(tên, kiểu, biểu thức const hoặc None)], khai báo ở bất kỳ đâu trong thân
+        self.line = line
+
+
+class Module:
+    def __init__(self, name):
+        self.name = name
+        self.procedures = {}
+        self.variables = []         # [(tên, kiểu, biểu thức const hoặc None)]
+        self.issues = []            # [(dòng, mô tả)] các cấu trúc không được hỗ trợ
+
+
+def _strip_line(message, line):
+    # Bỏ tiền tố "Dòng N: " khi số dòng đã được ghi riêng.
+    prefix = f"Dòng {line}: "
+    return message[len(prefix):] if message.startswith(prefix) else message
+
+
+def _kw(tok, *words):
+    return tok is not None and tok[0] == "id" and tok[1] in words
+
+
+def _op(tok, *ops):
+    return tok is not None and tok[0] == "op" and tok[1] in ops
+
+
+class _TokenStream:
+    def __init__(self, tokens, line):
+        self.tokens = tokens
+        self.pos = 0
+        self.line = line
+
+    def peek(self, offset=0):
+        i = self.pos + offset
+        return self.tokens[i] if i < len(self.tokens) else None
+
+    def next(self):
+        tok = self.peek()
+        if tok is None:
+            raise VBASyntaxError(f"Dòng {self.line}: câu lệnh kết thúc bất ngờ")
+        self.pos += 1
+        return tok
+
+    def at_end(self):
+        return self.pos >= len(self.tokens)
+
+    def accept_kw(self, *words):
+        if _kw(self.peek(), *words):
+            return self.next()
+        return None
+
+    def accept_op(self, *ops):
+        if _op(self.peek(), *ops):
+            return self.next()
+        return None
+
+    def expect_kw(self, *words):
+        tok = self.accept_kw(*words)
+        if tok is None:
+            raise VBASyntaxError(f"Dòng {self.line}: cần '{words[0]}'")
+        return tok
+
+    def expect_op(self, op):
+        if self.accept_op(op) is None:
+            raise VBASyntaxError(f"Dòng {self.line}: cần '{op}'")
+
+    def expect_name(self):
+        tok = self.next()
+        if tok[0] != "id":
+            raise VBASyntaxError(f"Dòng {self.line}: cần một tên")
+        return tok[1]
+
+
+# Độ ưu tiên toán tử hai ngôi (cao hơn = gắn chặt hơn); Not là một ngôi giữa And và so sánh.
+BINARY_PRECEDENCE = [
+    ({"xor"}, "kw"),
+    ({"or"}, "kw"),
+    ({"and"}, "kw"),
+    (None, "not"),
+    ({"=", "<>", "<", ">", "<=", ">=", "is", "like"}, "cmp"),
+    ({"&"}, "op"),
+    ({"+", "-"}, "op"),
+    ({"mod"}, "kw"),
+    ({"\\"}, "op"),
+    ({"*", "/"}, "op"),
+]
+
+
+class ExpressionParser:
+    def __init__(self, stream):
+        self.s = stream
+
+    def parse(self, level=0):
+        if level == len(BINARY_PRECEDENCE):
+            return self.parse_unary()
+        ops, kind = BINARY_PRECEDENCE[level]
+        if kind == "not":
+            if self.s.accept_kw("not"):
+                return ("not", self.parse(level))
+            return self.parse(level + 1)
+        left = self.parse(level + 1)
+        while True:
+            tok = self.s.peek()
+            if tok is None:
+                return left
+            name = tok[1] if tok[0] in ("op", "id") else None
+            if name not in ops:
+                return left
+            self.s.next()
+            left = ("bin", name, left, self.parse(level + 1))
+
+    def parse_unary(self):
+        if self.s.accept_op("-"):
+            return ("neg", self.parse_unary())
+        if self.s.accept_op("+"):
+            return self.parse_unary()
+        return self.parse_power()
+
+    def parse_power(self):
+        left = self.parse_postfix()
+        while self.s.accept_op("^"):
+            if self.s.accept_op("-"):
+                right = ("neg", self.parse_postfix())
+            else:
+                right = self.parse_postfix()
+            left = ("bin", "^", left, right)
+        return left
+
+    def parse_postfix(self, allow_call=True):
+        expr = self.parse_primary()
+        while True:
+            if self.s.accept_op("."):
+                expr = ("member", expr, self.s.expect_name())
+            elif allow_call and _op(self.s.peek(), "("):
+                self.s.next()
+                expr = ("call", expr, self.parse_args(")"))
+            else:
+                return expr
+
+    def parse_primary(self):
+        tok = self.s.next()
+        kind = tok[0]
+        if kind == "num" or kind == "str":
+            return ("const", tok[1])
+        if kind == "op":
+            if tok[1] == "(":
+                expr = self.parse()
+                self.s.expect_op(")")
+                return _paren(expr)
+            if tok[1] == ".":
+                return ("member", None, self.s.expect_name())   # thành viên của khối With
+            raise VBASyntaxError(f"Dòng {self.s.line}: toán tử '{tok[1]}' không đúng chỗ")
+        name = tok[1]
+        if name == "true":
+            return ("const", True)
+        if name == "false":
+            return ("const", False)
+        if name in ("nothing", "empty", "null"):
+            return ("const", None)
+        if name == "new":
+            raise VBASyntaxError(f"Dòng {self.s.line}: 'New' không được hỗ trợ")
+        return ("name", name)
+
+    def parse_args(self, closing=None):
+        """
+        Parses a comma-separated argument list up to closing (or the end of the statement).
+        Returns [(name or None, expression or None for a missing argument)].
+        """
+        args = []
+        if closing and self.s.accept_op(closing):
+            return args
+        while True:
+            tok = self.s.peek()
+            if tok is None or (closing and _op(tok, closing)) or _op(tok, ","):
+                args.append((None, None))
+            elif tok[0] == "id" and _op(self.s.peek(1), ":="):
+                self.s.next()
+                self.s.next()
+                args.append((tok[1], self.parse()))
+            else:
+                args.append((None, self.parse()))
+            if self.s.accept_op(","):
+                continue
+            break
+        if closing:
+            self.s.expect_op(closing)
+        if args == [(None, None)]:
+            return []
+        return args
+
+
+def _paren(expr):
+    # Biến đặt trong ngoặc là một biểu thức: truyền theo giá trị, không nhận lại giá trị ByRef.
+    return ("paren", expr) if expr is not None and expr[0] == "name" else expr
+
+
+def _parse_type(s):
+    if s.accept_kw("as"):
+        if s.accept_kw("new"):
+            raise VBASyntaxError(f"Dòng {s.line}: 'As New' không được hỗ trợ")
+        name = s.expect_name()
+        while s.accept_op("."):
+            name = s.expect_name()
+        return name
+    return "variant"
+
+
+class ModuleParser:
+    def __init__(self, source, name):
+        self.lines = list(logical_lines(source))
+        self.pos = 0
+        self.module = Module(name)
+        self.proc = None
+
+    def parse(self):
+        while self.pos < len(self.lines):
+            line, tokens = self.lines[self.pos]
+            self.pos += 1
+            s = _TokenStream(tokens, line)
+            head = s.peek()
+            if _kw(head, "option", "attribute", "defint", "deflng", "defstr", "defdbl", "defbool", "defvar"):
+                continue
+            while s.accept_kw("public", "private", "friend", "global"):
+                pass
+            static = s.accept_kw("static")
+            if _kw(s.peek(), "sub", "function"):
+                self.parse_procedure(s, line)
+            elif _kw(s.peek(), "property"):
+                self.module.issues.append((line, "Property Get/Let/Set không được hỗ trợ"))
+                self.skip_to_end("property")
+            elif _kw(s.peek(), "dim", "const") or static or (s.pos > 0 and s.peek() is not None and s.peek()[0] == "id"):
+                try:
+                    self.module.variables.extend(self.parse_declaration(s))
+                except VBASyntaxError as e:
+                    self.module.issues.append((line, _strip_line(str(e), line)))
+            elif _kw(s.peek(), "type", "enum", "declare", "event", "implements"):
+                self.module.issues.append((line, f"'{s.peek()[2]}' không được hỗ trợ"))
+                if _kw(s.peek(), "type", "enum"):
+                    self.skip_to_end(s.peek()[1])
+            else:
+                self.module.issues.append((line, "câu lệnh ngoài thủ tục"))
+        return self.module
+
+    def skip_to_end(self, word):
+        while self.pos < len(self.lines):
+            _, tokens = self.lines[self.pos]
+            self.pos += 1
+            if len(tokens) >= 2 and _kw(tokens[0], "end") and _kw(tokens[1], word):
+                return
+
+    def parse_declaration(self, s):
+        """
+        Dim / Const / Static / Public / Private declaration: returns [(name, type, const expr or None)].
+        """
+        is_const = bool(s.accept_kw("const"))
+        s.accept_kw("dim")
+        if s.accept_kw("const"):
+            is_const = True
+        declared = []
+        while True:
+            name = s.expect_name()
+            if _op(s.peek(), "("):
+                raise VBASyntaxError(f"Dòng {s.line}: mảng (Dim {name}(...)) không được hỗ trợ")
+            var_type = _parse_type(s).lower()
+            init = None
+            if is_const:
+                s.expect_op("=")
+                init = ExpressionParser(s).parse()
+            declared.append((name, var_type, init))
+            if not s.accept_op(","):
+                break
+        if not s.at_end():
+            raise VBASyntaxError(f"Dòng {s.line}: khai báo không hợp lệ")
+        return declared
+
+    def parse_procedure(self, s, line):
+        kind = s.next()[1]
+        name_tok = s.next()
+        proc = Procedure(name_tok[1], kind, [], None, line)
+        proc.display_name = name_tok[2]
+        if s.accept_op("("):
+            if not s.accept_op(")"):
+                while True:
+                    optional = bool(s.accept_kw("optional"))
+                    byval = bool(s.accept_kw("byval"))
+                    s.accept_kw("byref")
+                    if s.accept_kw("paramarray"):
+                        self.module.issues.append((line, "ParamArray không được hỗ trợ"))
+                    pname = s.expect_name()
+                    if s.accept_op("("):
+                        s.expect_op(")")
+                        self.module.issues.append((line, f"tham số mảng '{pname}' không được hỗ trợ"))
+                    ptype = _parse_type(s).lower()
+                    default = ExpressionParser(s).parse() if s.accept_op("=") else None
+                    proc.params.append((pname, ptype, optional, default, byval))
+                    if not s.accept_op(","):
+                        break
+                s.expect_op(")")
+        if kind == "function":
+            proc.return_type = _parse_type(s).lower()
+        self.proc = proc
+        proc.body = self.parse_block(("end " + kind,))[0]
+        self.proc = None
+        self.module.procedures[proc.name] = proc
+
+    # -- Khối lệnh ---------------------------------------------------------
+
+    def _terminator(self, tokens, terminators):
+        # Trả về tên kết thúc khối (ví dụ "end if", "next", "else") nếu dòng là một kết thúc khối.
+        if not tokens or tokens[0][0] != "id":
+            return None
+        first = tokens[0][1]
+        second = tokens[1][1] if len(tokens) > 1 and tokens[1][0] == "id" else None
+        for term in terminators:
+            words = term.split()
+            if words[0] == first and (len(words) == 1 or words[1] == second):
+                return term
+        return None
+
+    def parse_block(self, terminators):
+        """
+        Parses statements until one of terminators; returns (body, terminator, tokens of that line).
+        """
+        body = []
+        while self.pos < len(self.lines):
+            line, tokens = self.lines[self.pos]
+            self.pos += 1
+            term = self._terminator(tokens, terminators)
+            if term is not None:
+                return body, term, _TokenStream(tokens, line)
+            try:
+                stmt = self.parse_statement(tokens, line)
+            except VBASyntaxError as e:
+                message = _strip_line(str(e), line)
+                self.module.issues.append((line, message))
+                stmt = ("unsupported", line, message)
+            if stmt is not None:
+                body.append(stmt)
+        raise VBASyntaxError(f"Thiếu '{terminators[-1]}' (thủ tục bắt đầu ở dòng "
+                             f"{self.proc.line if self.proc else '?'})")
+
+    def declare_locals(self, declared):
+        if self.proc is not None:
+            self.proc.locals.extend(declared)
+
+    def parse_statement(self, tokens, line):
+        s = _TokenStream(tokens, line)
+        head = s.peek()
+        word = head[1] if head[0] == "id" else None
+
+        if word in ("dim", "static", "const"):
+            if word == "static":
+                s.next()
+            declared = self.parse_declaration(s)
+            self.declare_locals(declared)
+            consts = [(n, t, e) for n, t, e in declared if e is not None]
+            return ("const", line, consts) if consts else None
+        if word == "set":
+            s.next()
+            target = ExpressionParser(s).parse_postfix()
+            s.expect_op("=")
+            return ("set", line, target, self._rest_expr(s))
+        if word == "let":
+            s.next()
+            word = None
+        if word == "call":
+            s.next()
+            expr = ExpressionParser(s).parse_postfix()
+            return ("call", line, expr, None)
+        if word == "if":
+            return self.parse_if(s, line)
+        if word == "for":
+            return self.parse_for(s, line)
+        if word == "do":
+            return self.parse_do(s, line)
+        if word == "while":
+            s.next()
+            cond = self._rest_expr(s)
+            body = self.parse_block(("wend",))[0]
+            return ("do", line, "while", cond, None, None, body)
+        if word == "select":
+            return self.parse_select(s, line)
+        if word == "with":
+            s.next()
+            expr = self._rest_expr(s)
+            body = self.parse_block(("end with",))[0]
+            return ("with", line, expr, body)
+        if word == "exit":
+            s.next()
+            kind = s.expect_name()
+            if kind not in ("for", "do", "sub", "function"):
+                raise VBASyntaxError(f"Dòng {line}: 'Exit {kind}' không được hỗ trợ")
+            return ("exit", line, kind)
+        if word == "on":
+            s.next()
+            s.expect_kw("error")
+            if s.accept_kw("resume"):
+                s.expect_kw("next")
+                return ("onerror", line, True)
+            s.expect_kw("goto")
+            tok = s.next()
+            if tok[0] == "num" and tok[1] == 0:
+                return ("onerror", line, False)
+            raise VBASyntaxError(f"Dòng {line}: 'On Error GoTo <nhãn>' không được hỗ trợ")
+        if word in UNSUPPORTED_STATEMENTS and not _op(s.peek(1), "=", "."):
+            raise VBASyntaxError(f"Dòng {line}: câu lệnh '{head[2]}' không được hỗ trợ")
+        if head[0] == "id" and len(tokens) == 2 and _op(tokens[1], ":"):
+            raise VBASyntaxError(f"Dòng {line}: nhãn '{head[2]}' không được hỗ trợ")
+
+        # Gán giá trị hoặc gọi thủ tục.
+        target = ExpressionParser(s).parse_postfix()
+        if s.accept_op("="):
+            return ("assign", line, target, self._rest_expr(s))
+        if s.at_end():
+            if target[0] == "call":
+                # "Inc (n)" không có Call: ngoặc bao quanh tham số, n được truyền theo giá trị.
+                target = ("call", target[1], [(name, _paren(e)) for name, e in target[2]])
+            return ("call", line, target, None)
+        return ("call", line, target, ExpressionParser(s).parse_args())
+
+    def _rest_expr(self, s):
+        expr = ExpressionParser(s).parse()
+        if not s.at_end():
+            raise VBASyntaxError(f"Dòng {s.line}: thừa nội dung sau biểu thức")
+        return expr
+
+    def parse_if(self, s, line):
+        s.next()
+        cond = ExpressionParser(s).parse()
+        s.expect_kw("then")
+        if not s.at_end():
+            return self.parse_single_line_if(s, line, cond)
+        branches, else_body = [], None
+        body, term, ts = self.parse_block(("elseif", "else", "end if"))
+        branches.append((cond, body))
+        while term == "elseif":
+            ts.next()
+            cond = ExpressionParser(ts).parse()
+            ts.expect_kw("then")
+            body, term, ts = self.parse_block(("elseif", "else", "end if"))
+            branches.append((cond, body))
+        if term == "else":
+            else_body = self.parse_block(("end if",))[0]
+        return ("if", line, branches, else_body)
+
+    def parse_single_line_if(self, s, line, cond):
+        # If cond Then a: b Else c: d  (các câu lệnh cách nhau bởi ':')
+        parts, current, depth = {"then": [], "else": []}, "then", 0
+        segment = []
+        for tok in s.tokens[s.pos:]:
+            if _op(tok, "("):
+                depth += 1
+            elif _op(tok, ")"):
+                depth -= 1
+            if depth == 0 and _kw(tok, "else"):
+                if segment:
+                    parts[current].append(segment)
+                segment, current = [], "else"
+            elif depth == 0 and _op(tok, ":"):
+                if segment:
+                    parts[current].append(segment)
+                segment = []
+            else:
+                segment.append(tok)
+        if segment:
+            parts[current].append(segment)
+        then_body = [st for st in (self.parse_statement(seg, line) for seg in parts["then"]) if st]
+        else_body = [st for st in (self.parse_statement(seg, line) for seg in parts["else"]) if st] or None
+        return ("if", line, [(cond, then_body)], else_body)
+
+    def parse_for(self, s, line):
+        s.next()
+        if s.accept_kw("each"):
+            var = s.expect_name()
+            s.expect_kw("in")
+            collection = self._rest_expr(s)
+            body = self.parse_block(("next",))[0]
+            return ("foreach", line, var, collection, body)
+        var = s.expect_name()
+        s.expect_op("=")
+        ep = ExpressionParser(s)
+        start = ep.parse()
+        s.expect_kw("to")
+        end = ep.parse()
+        step = ep.parse() if s.accept_kw("step") else None
+        body = self.parse_block(("next",))[0]
+        return ("for", line, var, start, end, step, body)
+
+    def parse_do(self, s, line):
+        s.next()
+        pre_kind = pre_cond = None
+        tok = s.accept_kw("while", "until")
+        if tok:
+            pre_kind, pre_cond = tok[1], self._rest_expr(s)
+        body, _, ts = self.parse_block(("loop",))
+        ts.next()
+        post_kind = post_cond = None
+        tok = ts.accept_kw("while", "until")
+        if tok:
+            post_kind, post_cond = tok[1], self._rest_expr(ts)
+        return ("do", line, pre_kind, pre_cond, post_kind, post_cond, body)
+
+    def parse_select(self, s, line):
+        s.next()
+        s.expect_kw("case")
+        subject = self._rest_expr(s)
+        cases, else_body = [], None
+        # Bỏ qua các dòng trước Case đầu tiên (chỉ có thể là chú thích, đã bị loại bỏ).
+        _, term, ts = self.parse_block(("case", "end select"))
+        while term == "case":
+            ts.next()
+            if ts.accept_kw("else"):
+                else_body, term, ts = self.parse_block(("end select",))
+                break
+            conditions = []
+            ep = ExpressionParser(ts)
+            while True:
+                if ts.accept_kw("is"):
+                    op = ts.next()[1]
+                    conditions.append(("is", op, ep.parse()))
+                else:
+                    low = ep.parse()
+                    if ts.accept_kw("to"):
+                        conditions.append(("range", low, ep.parse()))
+                    else:
+                        conditions.append(("value", low))
+                if not ts.accept_op(","):
+                    break
+            body, term, ts = self.parse_block(("case", "end select"))
+            cases.append((conditions, body))
+        return ("select", line, subject, cases, else_body)
+
+
+def parse_module(source, name="module"):
+    """
+    Parses the source of a .bas module. Unsupported constructs are collected in module.issues
+    (they raise VBARuntimeError only if executed); malformed code raises VBASyntaxError.
+    """
+    return ModuleParser(source, name).parse()
+
+
+# ---------------------------------------------------------------------------
+# Chuyển kiểu và toán tử
+# ---------------------------------------------------------------------------
+
+def _default_value(obj):
+    # Thuộc tính mặc định của đối tượng (ví dụ Range.Value) khi dùng như một giá trị.
+    getter = getattr(obj, "get_value", None)
+    if getter is not None:
+        return getter()
+    return obj
+
+
+def is_object(value):
+    return value is not None and not isinstance(value, (bool, int, float, str, datetime.datetime, datetime.date))
+
+
+def to_value(value):
+    return _default_value(value) if is_object(value) else value
+
+
+def to_number(value):
+    value = to_value(value)
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return -1 if value else 0
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        text = value.strip()
+        if text == "":
+            raise VBARuntimeError("Không khớp kiểu: chuỗi rỗng không phải số")
+        try:
+            return int(text)
+        except ValueError:
+            try:
+                return float(text)
+            except ValueError:
+                raise VBARuntimeError(f"Không khớp kiểu: {value!r} không phải số")
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.toordinal() - 693594   # số ngày kể từ 30/12/1899 như Excel
+    raise VBARuntimeError(f"Không khớp kiểu: {type(value).__name__}")
+
+
+def to_str(value):
+    value = to_value(value)
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "True" if value else "False"
+    if isinstance(value, float):
+        if value.is_integer() and abs(value) < 1e15:
+            return str(int(value))
+        return format(value, ".15g")
+    return str(value)
+
+
+def to_bool(value):
+    value = to_value(value)
+    if isinstance(value, str):
+        if value.strip().lower() in ("true", "false"):
+            return value.strip().lower() == "true"
+        return to_number(value) != 0
+    return bool(to_number(value))
+
+
+def is_numeric(value):
+    value = to_value(value)
+    if isinstance(value, (bool, int, float)) or value is None:
+        return True
+    if isinstance(value, str):
+        try:
+            float(value.strip())
+            return value.strip() != ""
+        except ValueError:
+            return False
+    return False
+
+
+def coerce(value, var_type):
+    """
+    Converts value for a variable declared As var_type (Variant and object types keep it as is).
+    """
+    if var_type in INTEGER_TYPES:
+        number = to_number(value)
+        return int(round(number)) if isinstance(number, float) else int(number)
+    if var_type in FLOAT_TYPES:
+        return float(to_number(value))
+    if var_type == "string":
+        return to_str(value)
+    if var_type == "boolean":
+        return to_bool(value)
+    return value
+
+
+def _vba_round_int(value):
+    number = to_number(value)
+    return int(round(number)) if isinstance(number, float) else int(number)
+
+
+def _arith(op, a, b):
+    if op == "+":
+        va, vb = to_value(a), to_value(b)
+        if isinstance(va, str) and isinstance(vb, str):
+            return va + vb
+        return to_number(va) + to_number(vb)
+    if op == "&":
+        return to_str(a) + to_str(b)
+    x, y = to_number(a), to_number(b)
+    if op == "-":
+        return x - y
+    if op == "*":
+        return x * y
+    if op == "/":
+        if y == 0:
+            raise VBARuntimeError("Chia cho 0")
+        return x / y
+    if op == "\\":
+        x, y = _vba_round_int(x), _vba_round_int(y)
+        if y == 0:
+            raise VBARuntimeError("Chia cho 0")
+        return int(x / y)
+    if op == "mod":
+        x, y = _vba_round_int(x), _vba_round_int(y)
+        if y == 0:
+            raise VBARuntimeError("Chia cho 0")
+        return int(math.fmod(x, y))
+    if op == "^":
+        return float(x) ** y
+    raise VBARuntimeError(f"Toán tử không hỗ trợ: {op}")
+
+
+def compare(a, b):
+    """
+    Returns -1, 0 or 1, comparing numerically when both sides are numeric (Empty counts as 0
+    against a number and as "" against a string), as strings otherwise.
+    """
+    a, b = to_value(a), to_value(b)
+    if isinstance(a, str) and isinstance(b, str):
+        return (a > b) - (a < b)
+    if a is None and isinstance(b, str):
+        a = ""
+    elif b is None and isinstance(a, str):
+        b = ""
+    if isinstance(a, str) or isinstance(b, str):
+        if is_numeric(a) and is_numeric(b):
+            x, y = to_number(a), to_number(b)
+            return (x > y) - (x < y)
+        x, y = to_str(a), to_str(b)
+        return (x > y) - (x < y)
+    x, y = to_number(a), to_number(b)
+    return (x > y) - (x < y)
+
+
+def _like(text, pattern):
+    regex, i = [], 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "*":
+            regex.append(".*")
+        elif ch == "?":
+            regex.append(".")
+        elif ch == "#":
+            regex.append(r"\d")
+        elif ch == "[":
+            j = pattern.index("]", i)
+            body = pattern[i + 1:j]
+            regex.append("[^" + re.escape(body[1:]) + "]" if body.startswith("!") else "[" + re.escape(body) + "]")
+            i = j
+        else:
+            regex.append(re.escape(ch))
+        i += 1
+    return re.fullmatch("".join(regex), text, re.S) is not None
+
+
+COMPARISONS = {
+    "=": lambda c: c == 0, "<>": lambda c: c != 0, "<": lambda c: c < 0,
+    ">": lambda c: c > 0, "<=": lambda c: c <= 0, ">=": lambda c: c >= 0,
+}
+
+
+def _logical(op, a, b):
+    a, b = to_value(a), to_value(b)
+    if isinstance(a, bool) and isinstance(b, bool):
+        if op == "and":
+            return a and b
+        if op == "or":
+            return a or b
+        return a != b
+    x, y = _vba_round_int(a), _vba_round_int(b)
+    if op == "and":
+        return x & y
+    if op == "or":
+        return x | y
+    return x ^ y
+
+
+# ---------------------------------------------------------------------------
+# Hàm dựng sẵn
+# ---------------------------------------------------------------------------
+
+class VBAArray:
+    """
+    2-D array with VBA bounds (Range.Value of a multi-cell range is a 1-based array).
+    """
+    def __init__(self, rows, lower=1):
+        self.rows = rows
+        self.lower = lower
+
+    def _index(self, args):
+        if len(args) != 2:
+            raise VBARuntimeError("Mảng 2 chiều cần 2 chỉ số")
+        r, c = (_vba_round_int(a) - self.lower for a in args)
+        if r < 0 or c < 0 or r >= len(self.rows) or (self.rows and c >= len(self.rows[0])):
+            raise VBARuntimeError("Chỉ số nằm ngoài mảng")
+        return r, c
+
+    def call_default(self, *args):
+        r, c = self._index(args)
+        return self.rows[r][c]
+
+    def set_item(self, args, value):
+        r, c = self._index(args)
+        self.rows[r][c] = value
+
+    def bound(self, dimension, upper):
+        size = len(self.rows) if dimension == 1 else (len(self.rows[0]) if self.rows else 0)
+        return self.lower + size - 1 if upper else self.lower
+
+    def vba_iter(self):
+        # For Each duyệt theo cột như VBA
+        for c in range(len(self.rows[0]) if self.rows else 0):
+            for row in self.rows:
+                yield row[c]
+
+
+def _val(text):
+    m = re.match(r"\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?", to_str(text))
+    if not m:
+        return 0
+    number = float(m.group(0))
+    return int(number) if number.is_integer() else number
+
+
+def _instr(*args):
+    if len(args) >= 3:
+        start, text, find = _vba_round_int(args[0]), to_str(args[1]), to_str(args[2])
+    else:
+        start, text, find = 1, to_str(args[0]), to_str(args[1])
+    return text.find(find, start - 1) + 1
+
+
+def _mid(text, start, length=None):
+    text, start = to_str(text), _vba_round_int(start)
+    if length is None:
+        return text[start - 1:]
+    return text[start - 1:start - 1 + _vba_round_int(length)]
+
+
+def _round(value, digits=0):
+    number = round(to_number(value), _vba_round_int(digits))
+    return number
+
+
+def _ubound(array, dimension=1):
+    return array.bound(_vba_round_int(dimension), True)
+
+
+def _lbound(array, dimension=1):
+    return array.bound(_vba_round_int(dimension), False)
+
+
+def _typename(value):
+    if value is None:
+        return "Empty"
+    if isinstance(value, bool):
+        return "Boolean"
+    if isinstance(value, int):
+        return "Long"
+    if isinstance(value, float):
+        return "Double"
+    if isinstance(value, str):
+        return "String"
+    return getattr(value, "vba_type_name", type(value).__name__)
+
+
+BUILTINS = {
+    "trim": lambda s: to_str(s).strip(" "),
+    "ltrim": lambda s: to_str(s).lstrip(" "),
+    "rtrim": lambda s: to_str(s).rstrip(" "),
+    "len": lambda s: len(to_str(s)),
+    "left": lambda s, n: to_str(s)[:_vba_round_int(n)],
+    "right": lambda s, n: to_str(s)[-_vba_round_int(n):] if _vba_round_int(n) > 0 else "",
+    "mid": _mid,
+    "ucase": lambda s: to_str(s).upper(),
+    "lcase": lambda s: to_str(s).lower(),
+    "instr": _instr,
+    "replace": lambda s, find, repl: to_str(s).replace(to_str(find), to_str(repl)),
+    "space": lambda n: " " * _vba_round_int(n),
+    "strcomp": lambda a, b, mode=0: compare(to_str(a).lower(), to_str(b).lower()) if _vba_round_int(mode) == 1
+               else compare(to_str(a), to_str(b)),
+    "chr": lambda n: chr(_vba_round_int(n)),
+    "asc": lambda s: ord(to_str(s)[0]),
+    "cstr": to_str,
+    "clng": lambda v: coerce(v, "long"),
+    "cint": lambda v: coerce(v, "integer"),
+    "cdbl": lambda v: coerce(v, "double"),
+    "csng": lambda v: coerce(v, "single"),
+    "cbool": to_bool,
+    "val": _val,
+    "int": lambda v: math.floor(to_number(v)),
+    "fix": lambda v: math.trunc(to_number(v)),
+    "abs": lambda v: abs(to_number(v)),
+    "sgn": lambda v: (to_number(v) > 0) - (to_number(v) < 0),
+    "sqr": lambda v: math.sqrt(to_number(v)),
+    "round": _round,
+    "isempty": lambda v: to_value(v) is None,
+    "isnumeric": is_numeric,
+    "isobject": is_object,
+    "typename": _typename,
+    "ubound": _ubound,
+    "lbound": _lbound,
+    "now": lambda: datetime.datetime.now(),
+    "date": lambda: datetime.date.today(),
+}
+# Hàm nhận đối tượng nguyên vẹn (không lấy thuộc tính mặc định của tham số).
+OBJECT_BUILTINS = {"isobject", "typename", "ubound", "lbound", "isempty"}
+
+
+class DebugObject:
+    """
+    The Debug object: Debug.Print writes to the interpreter output.
+    """
+    def __init__(self, output):
+        self.output = output
+
+    def call_print(self, *args):
+        self.output(" ".join(to_str(a) for a in args))
+
+
+# ---------------------------------------------------------------------------
+# Trình thông dịch
+# ---------------------------------------------------------------------------
+
+class Frame:
+    def __init__(self, proc):
+        self.proc = proc
+        self.vars = {}
+        self.types = {}
+        self.with_stack = []
+        self.resume_next = False
+
+
+class Interpreter:
+    """
+    Runs the procedures of a parsed Module against a host object model.
+
+    host: the application object (native_excel.NativeExcel); unqualified names that are not
+        variables, procedures or built-ins are looked up as its members.
+    constants: extra named constants (the xl... constants of the host).
+    output: callable receiving the text of Debug.Print and MsgBox.
+    """
+    def __init__(self, module, host=None, constants=None, output=print):
+        self.module = module
+        self.host = host
+        self.output = output
+        self.constants = dict(VBA_CONSTANTS)
+        self.constants.update(constants or {})
+        self.debug = DebugObject(output)
+        self._exec = {
+            "assign": self.exec_assign, "set": self.exec_set, "call": self.exec_call, "const": self.exec_const,
+            "if": self.exec_if, "for": self.exec_for, "foreach": self.exec_foreach, "do": self.exec_do,
+            "select": self.exec_select, "with": self.exec_with, "exit": self.exec_exit,
+            "onerror": self.exec_onerror, "unsupported": self.exec_unsupported,
+        }
+        self._eval = {
+            "const": lambda e, f: e[1], "name": self.eval_name, "member": self.eval_member,
+            "call": self.eval_call, "bin": self.eval_binary, "neg": lambda e, f: -to_number(self.eval(e[1], f)),
+            "not": self.eval_not, "paren": lambda e, f: self.eval(e[1], f),
+        }
+        self.globals = {}
+        self.global_types = {}
+        frame = Frame(None)
+        for name, var_type, init in module.variables:
+            self.global_types[name] = var_type
+            self.globals[name] = self.eval(init, frame) if init is not None else TYPE_DEFAULTS.get(var_type)
+
+    # -- Thủ tục -------------------------------------------------------------
+
+    def run(self, name, *args):
+        """
+        Runs the Sub or Function name (case-insensitive) with positional args; returns its result.
+        """
+        proc = self.module.procedures.get(name.lower())
+        if proc is None:
+            raise VBARuntimeError(f"Không tìm thấy macro '{name}' trong {self.module.name}")
+        return self.invoke(proc, list(args), {})
+
+    def invoke(self, proc, args, kwargs, refs=None, caller=None):
+        """
+        Runs proc with evaluated args / kwargs. refs: ([target or None per positional argument],
+        {name: target or None}) the variables passed as is, which receive the final value of the
+        non-ByVal parameters in caller (the calling frame) when proc returns.
+        """
+        frame = Frame(proc)
+        positional_refs, named_refs = refs or ([], {})
+        write_back = []
+        for index, (pname, ptype, optional, default, byval) in enumerate(proc.params):
+            target = None
+            if index < len(args) and args[index] is not _MISSING:
+                value = args[index]
+                target = positional_refs[index] if index < len(positional_refs) else None
+            elif pname in kwargs:
+                value = kwargs.pop(pname)
+                target = named_refs.get(pname)
+            elif optional:
+                value = self.eval(default, frame) if default is not None else TYPE_DEFAULTS.get(ptype)
+            else:
+                raise VBARuntimeError(f"Thiếu tham số '{pname}' khi gọi {proc.display_name}")
+            frame.types[pname] = ptype
+            frame.vars[pname] = coerce(value, ptype) if value is not None or ptype in TYPE_DEFAULTS else value
+            if target is not None and not byval:
+                write_back.append((pname, target))
+        if len(args) > len(proc.params) or kwargs:
+            raise VBARuntimeError(f"Sai số tham số khi gọi {proc.display_name}")
+        for name, var_type, init in proc.locals:
+            frame.types[name] = var_type
+            frame.vars[name] = TYPE_DEFAULTS.get(var_type) if init is None else None
+        if proc.kind == "function":
+            frame.types[proc.name] = proc.return_type
+            frame.vars[proc.name] = TYPE_DEFAULTS.get(proc.return_type)
+        try:
+            self.exec_block(proc.body, frame)
+        except _ExitProcedure:
+            pass
+        for pname, target in write_back:
+            value = frame.vars.get(pname)
+            self.assign(target, value, caller, is_set=is_object(value))
+        return frame.vars.get(proc.name) if proc.kind == "function" else None
+
+    # -- Câu lệnh -------------------------------------------------------------
+
+    def exec_block(self, body, frame):
+        for stmt in body:
+            try:
+                self._exec[stmt[0]](stmt, frame)
+            except _ControlFlow:
+                raise
+            except VBARuntimeError as e:
+                if frame.resume_next:
+                    continue
+                if str(e).startswith("Dòng "):
+                    raise
+                raise VBARuntimeError(f"Dòng {stmt[1]}: {e}") from None
+            except Exception as e:
+                if frame.resume_next:
+                    continue
+                raise VBARuntimeError(f"Dòng {stmt[1]}: {type(e).__name__}: {e}") from e
+
+    def exec_unsupported(self, stmt, frame):
+        raise VBARuntimeError(stmt[2])
+
+    def exec_const(self, stmt, frame):
+        for name, var_type, init in stmt[2]:
+            frame.vars[name] = coerce(self.eval(init, frame), var_type)
+
+    def exec_assign(self, stmt, frame):
+        self.assign(stmt[2], self.eval(stmt[3], frame), frame)
+
+    def exec_set(self, stmt, frame):
+        self.assign(stmt[2], self.eval(stmt[3], frame), frame, is_set=True)
+
+    def assign(self, target, value, frame, is_set=False):
+        tag = target[0]
+        if tag == "member":
+            obj = self.with_object(frame) if target[1] is None else self.eval(target[1], frame)
+            setter = getattr(obj, "set_" + target[2], None)
+            if setter is None:
+                raise VBARuntimeError(f"Không gán được thuộc tính '{target[2]}' của {_typename(obj)}")
+            # Không dùng Set: lấy thuộc tính mặc định, trừ thuộc tính nhận vùng ô (ví dụ Series.XValues).
+            setter(value if is_set or getattr(setter, "vba_object_arg", False) else to_value(value))
+            return
+        if not is_set:
+            value = to_value(value)
+        if tag == "name":
+            name = target[1]
+            if name in frame.vars or name not in self.globals:
+                var_type = frame.types.get(name)
+                frame.vars[name] = value if is_set else coerce(value, var_type)
+            else:
+                self.globals[name] = value if is_set else coerce(value, self.global_types.get(name))
+            return
+        if tag == "call":
+            callee = target[1]
+            if callee[0] == "name" and isinstance(self.lookup_variable(callee[1], frame), VBAArray):
+                array = self.lookup_variable(callee[1], frame)
+                array.set_item(self.eval_args(target[2], frame)[0], value)
+                return
+            obj = self.eval(target, frame)
+            setter = getattr(obj, "set_value", None)
+            if setter is None:
+                raise VBARuntimeError("Vế trái của phép gán không hợp lệ")
+            setter(value)
+            return
+        raise VBARuntimeError("Vế trái của phép gán không hợp lệ")
+
+    def exec_call(self, stmt, frame):
+        expr, args = stmt[2], stmt[3]
+        if args is None:
+            if expr[0] == "call":
+                self.eval_call(expr, frame)
+            elif expr[0] == "member":
+                self.call_member(self.member_object(expr, frame), expr[2], [], {})
+            else:
+                self.call_name(expr[1], [], {}, frame)
+            return
+        positional, named = self.eval_args(args, frame)
+        if expr[0] == "member":
+            self.call_member(self.member_object(expr, frame), expr[2], positional, named)
+        elif expr[0] == "name":
+            self.call_name(expr[1], positional, named, frame, args)
+        else:
+            self.default_call(self.eval(expr, frame), positional, named)
+
+    def exec_if(self, stmt, frame):
+        for cond, body in stmt[2]:
+            if to_bool(self.eval(cond, frame)):
+                self.exec_block(body, frame)
+                return
+        if stmt[3] is not None:
+            self.exec_block(stmt[3], frame)
+
+    def exec_for(self, stmt, frame):
+        _, _, var, start_expr, end_expr, step_expr, body = stmt
+        start = to_number(self.eval(start_expr, frame))
+        end = to_number(self.eval(end_expr, frame))
+        step = to_number(self.eval(step_expr, frame)) if step_expr is not None else 1
+        self.assign(("name", var), start, frame)
+        try:
+            while True:
+                current = to_number(self.lookup_variable(var, frame))
+                if (step >= 0 and current > end) or (step < 0 and current < end):
+                    break
+                self.exec_block(body, frame)
+                self.assign(("name", var), to_number(self.lookup_variable(var, frame)) + step, frame)
+        except _ExitLoop as e:
+            if e.kind != "for":
+                raise
+
+    def exec_foreach(self, stmt, frame):
+        _, _, var, collection_expr, body = stmt
+        collection = self.eval(collection_expr, frame)
+        iterate = getattr(collection, "vba_iter", None)
+        items = iterate() if iterate is not None else collection
+        try:
+            for item in items:
+                self.assign(("name", var), item, frame, is_set=True)
+                self.exec_block(body, frame)
+        except _ExitLoop as e:
+            if e.kind != "for":
+                raise
+        except TypeError:
+            raise VBARuntimeError(f"For Each không duyệt được {_typename(collection)}")
+
+    def exec_do(self, stmt, frame):
+        _, _, pre_kind, pre_cond, post_kind, post_cond, body = stmt
+
+        def holds(kind, cond):
+            value = to_bool(self.eval(cond, frame))
+            return value if kind == "while" else not value
+
+        try:
+            while True:
+                if pre_kind and not holds(pre_kind, pre_cond):
+                    break
+                self.exec_block(body, frame)
+                if post_kind and not holds(post_kind, post_cond):
+                    break
+        except _ExitLoop as e:
+            if e.kind != "do":
+                raise
+
+    def exec_select(self, stmt, frame):
+        _, _, subject_expr, cases, else_body = stmt
+        subject = self.eval(subject_expr, frame)
+        for conditions, body in cases:
+            for cond in conditions:
+                if cond[0] == "value":
+                    matched = compare(subject, self.eval(cond[1], frame)) == 0
+                elif cond[0] == "range":
+                    matched = (compare(subject, self.eval(cond[1], frame)) >= 0
+                               and compare(subject, self.eval(cond[2], frame)) <= 0)
+                else:
+                    matched = COMPARISONS[cond[1]](compare(subject, self.eval(cond[2], frame)))
+                if matched:
+                    self.exec_block(body, frame)
+                    return
+        if else_body is not None:
+            self.exec_block(else_body, frame)
+
+    def exec_with(self, stmt, frame):
+        frame.with_stack.append(self.eval(stmt[2], frame))
+        try:
+            self.exec_block(stmt[3], frame)
+        finally:
+            frame.with_stack.pop()
+
+    def exec_exit(self, stmt, frame):
+        if stmt[2] in ("sub", "function"):
+            raise _ExitProcedure()
+        raise _ExitLoop(stmt[2])
+
+    def exec_onerror(self, stmt, frame):
+        frame.resume_next = stmt[2]
+
+    # -- Biểu thức ------------------------------------------------------------
+
+    def eval(self, expr, frame):
+        return self._eval[expr[0]](expr, frame)
+
+    def eval_not(self, expr, frame):
+        value = to_value(self.eval(expr[1], frame))
+        if isinstance(value, bool):
+            return not value
+        return ~_vba_round_int(value)
+
+    def eval_binary(self, expr, frame):
+        op = expr[1]
+        a = self.eval(expr[2], frame)
+        b = self.eval(expr[3], frame)
+        if op in COMPARISONS:
+            return COMPARISONS[op](compare(a, b))
+        if op == "is":
+            return a is b or (a is None and b is None)
+        if op == "like":
+            return _like(to_str(a), to_str(b))
+        if op in ("and", "or", "xor"):
+            return _logical(op, a, b)
+        return _arith(op, a, b)
+
+    def with_object(self, frame):
+        if not frame.with_stack:
+            raise VBARuntimeError("Thành viên '.x' nằm ngoài khối With")
+        return frame.with_stack[-1]
+
+    def member_object(self, expr, frame):
+        return self.with_object(frame) if expr[1] is None else self.eval(expr[1], frame)
+
+    def eval_member(self, expr, frame):
+        obj = self.member_object(expr, frame)
+        return self.get_member(obj, expr[2])
+
+    def get_member(self, obj, name):
+        if obj is None:
+            raise VBARuntimeError(f"Biến đối tượng chưa được gán (Nothing) khi truy cập '{name}'")
+        getter = getattr(obj, "get_" + name, None)
+        if getter is not None:
+            return getter()
+        method = getattr(obj, "call_" + name, None)
+        if method is not None:
+            return method()
+        raise VBARuntimeError(f"{_typename(obj)} không hỗ trợ thành viên '{name}'")
+
+    def call_member(self, obj, name, args, kwargs):
+        if obj is None:
+            raise VBARuntimeError(f"Biến đối tượng chưa được gán (Nothing) khi gọi '{name}'")
+        method = getattr(obj, "call_" + name, None)
+        if method is not None:
+            return method(*args, **kwargs)
+        getter = getattr(obj, "get_" + name, None)
+        if getter is not None:
+            value = getter()
+            return self.default_call(value, args, kwargs) if args or kwargs else value
+        raise VBARuntimeError(f"{_typename(obj)} không hỗ trợ thành viên '{name}'")
+
+    def default_call(self, obj, args, kwargs):
+        method = getattr(obj, "call_default", None)
+        if method is None:
+            raise VBARuntimeError(f"{_typename(obj)} không gọi được với tham số")
+        return method(*args, **kwargs)
+
+    def eval_args(self, args, frame):
+        positional, named = [], {}
+        for name, expr in args:
+            value = _MISSING if expr is None else self.eval(expr, frame)
+            if name is None:
+                positional.append(value)
+            else:
+                named[name] = value
+        return positional, named
+
+    def eval_call(self, expr, frame):
+        callee = expr[1]
+        args, kwargs = self.eval_args(expr[2], frame)
+        if callee[0] == "member":
+            return self.call_member(self.member_object(callee, frame), callee[2], args, kwargs)
+        if callee[0] == "name":
+            return self.call_name(callee[1], args, kwargs, frame, expr[2])
+        return self.default_call(self.eval(callee, frame), args, kwargs)
+
+    def lookup_variable(self, name, frame):
+        if name in frame.vars:
+            return frame.vars[name]
+        return self.globals.get(name)
+
+    def references(self, arg_exprs, frame):
+        """
+        The variables of frame (or module variables) passed as is in arg_exprs, as
+        ([target or None per positional argument], {name: target or None}) for invoke().
+        """
+        positional, named = [], {}
+        for name, expr in arg_exprs or ():
+            target = expr if expr is not None and expr[0] == "name" and self.is_variable(expr[1], frame) else None
+            if name is None:
+                positional.append(target)
+            else:
+                named[name] = target
+        return positional, named
+
+    def is_variable(self, name, frame):
+        """
+        True when name is a variable of frame or of the module, declared or not (no Option Explicit).
+        """
+        if name in frame.vars or name in self.globals:
+            return True
+        if name in self.constants or name in self.module.procedures or name in BUILTINS:
+            return False
+        if name in ("msgbox", "debug"):
+            return False
+        return self.host is None or not (hasattr(self.host, "get_" + name) or hasattr(self.host, "call_" + name))
+
+    def call_name(self, name, args, kwargs, frame, arg_exprs=None):
+        # Trong một Function, tên hàm là biến kết quả; gọi kèm tham số là gọi đệ quy.
+        recursive = (args or kwargs) and frame.proc is not None and name == frame.proc.name
+        if (name in frame.vars or name in self.globals) and not recursive:
+            value = self.lookup_variable(name, frame)
+            if is_object(value):
+                return self.default_call(value, args, kwargs)
+            if args or kwargs:
+                raise VBARuntimeError(f"'{name}' không phải hàm hay mảng")
+            return value
+        proc = self.module.procedures.get(name)
+        if proc is not None:
+            return self.invoke(proc, args, kwargs, self.references(arg_exprs, frame), frame)
+        builtin = BUILTINS.get(name)
+        if builtin is not None:
+            if name not in OBJECT_BUILTINS:
+                args = [to_value(a) for a in args]
+            args = [None if a is _MISSING else a for a in args]
+            return builtin(*args, **kwargs)
+        if name == "msgbox":
+            self.output(to_str(args[0]) if args else "")
+            return 1
+        if name == "debug":
+            return self.debug
+        if self.host is not None:
+            return self.call_member(self.host, name, args, kwargs)
+        raise VBARuntimeError(f"Hàm hoặc thủ tục không xác định: '{name}'")
+
+    def eval_name(self, expr, frame):
+        name = expr[1]
+        if name in frame.vars:
+            return frame.vars[name]
+        if name in self.globals:
+            return self.globals[name]
+        if name in self.constants:
+            return self.constants[name]
+        if name == "debug":
+            return self.debug
+        if name in self.module.procedures or name in BUILTINS or name == "msgbox":
+            return self.call_name(name, [], {}, frame)
+        if self.host is not None and (hasattr(self.host, "get_" + name) or hasattr(self.host, "call_" + name)):
+            return self.get_member(self.host, name)
+        return None   # biến chưa khai báo: Empty (như khi không có Option Explicit)
+
+
+class _Missing:
+    def __repr__(self):
+        return "<missing>"
+
+
+_MISSING = _Missing()
+
+
+# ---------------------------------------------------------------------------
+# Kiểm tra trước khi chạy
+# ---------------------------------------------------------------------------
+
+def _walk_expr(expr):
+    if not isinstance(expr, tuple) or not expr:
+        return
+    yield expr
+    tag = expr[0]
+    if tag == "member":
+        yield from _walk_expr(expr[1])
+    elif tag == "call":
+        yield from _walk_expr(expr[1])
+        for _, arg in expr[2]:
+            yield from _walk_expr(arg)
+    elif tag == "bin":
+        yield from _walk_expr(expr[2])
+        yield from _walk_expr(expr[3])
+    elif tag in ("neg", "not", "paren"):
+        yield from _walk_expr(expr[1])
+
+
+def _walk_statements(body):
+    for stmt in body:
+        yield stmt
+        tag = stmt[0]
+        if tag == "if":
+            for _, branch in stmt[2]:
+                yield from _walk_statements(branch)
+            if stmt[3]:
+                yield from _walk_statements(stmt[3])
+        elif tag in ("for",):
+            yield from _walk_statements(stmt[6])
+        elif tag == "foreach":
+            yield from _walk_statements(stmt[4])
+        elif tag == "do":
+            yield from _walk_statements(stmt[6])
+        elif tag == "select":
+            for _, case_body in stmt[3]:
+                yield from _walk_statements(case_body)
+            if stmt[4]:
+                yield from _walk_statements(stmt[4])
+        elif tag == "with":
+            yield from _walk_statements(stmt[3])
+
+
+def _statement_exprs(stmt):
+    tag = stmt[0]
+    if tag in ("assign", "set"):
+        return [stmt[2], stmt[3]]
+    if tag == "call":
+        exprs = [stmt[2]]
+        if stmt[3]:
+            exprs.extend(e for _, e in stmt[3] if e is not None)
+        return exprs
+    if tag == "const":
+        return [e for _, _, e in stmt[2]]
+    if tag == "if":
+        return [cond for cond, _ in stmt[2]]
+    if tag == "for":
+        return [e for e in stmt[3:6] if e is not None]
+    if tag == "foreach":
+        return [stmt[3]]
+    if tag == "do":
+        return [e for e in (stmt[3], stmt[5]) if e is not None]
+    if tag == "select":
+        exprs = [stmt[2]]
+        for conditions, _ in stmt[3]:
+            for cond in conditions:
+                exprs.extend(e for e in cond[1:] if isinstance(e, tuple))
+        return exprs
+    if tag == "with":
+        return [stmt[2]]
+    return []
+
+
+def _assigned_byref(proc):
+    # Tên các tham số ByRef (không ByVal) mà thủ tục gán lại: giá trị phải được ghi về nơi gọi.
+    byref = {p[0] for p in proc.params if not p[4]}
+    assigned = set()
+    for stmt in _walk_statements(proc.body):
+        if stmt[0] in ("assign", "set") and stmt[2][0] == "name":
+            assigned.add(stmt[2][1])
+        elif stmt[0] in ("for", "foreach"):
+            assigned.add(stmt[2])
+    return byref & assigned
+
+
+def _call_sites(stmt):
+    # (tên thủ tục, [(tên tham số hoặc None, biểu thức)]) của các lời gọi theo tên trong câu lệnh.
+    if stmt[0] == "call" and stmt[2][0] == "name" and stmt[3]:
+        yield stmt[2][1], stmt[3]
+    for root in _statement_exprs(stmt):
+        for expr in _walk_expr(root):
+            if expr[0] == "call" and expr[1][0] == "name":
+                yield expr[1][1], expr[2]
+
+
+def check_module(module, members=(), globals_=()):
+    """
+    Lists what would prevent module from running on the interpreter, as [(line, message)]:
+    the unsupported constructs found while parsing, the object members that no host class
+    provides (members: lower-case member names supported by the host), the calls to
+    functions that are neither procedures of the module, built-ins nor host globals, and the
+    array elements passed to a ByRef parameter that the procedure assigns (not written back).
+    """
+    issues = list(module.issues)
+    assigned = {name: _assigned_byref(proc) for name, proc in module.procedures.items()}
+    members = set(members) | {"print"}
+    known_calls = set(module.procedures) | set(BUILTINS) | {"msgbox", "debug"} | set(globals_)
+    for proc in module.procedures.values():
+        variables = {name for name, _, _ in proc.locals} | {p[0] for p in proc.params} | {proc.name}
+        variables |= {name for name, _, _ in module.variables}
+        for stmt in _walk_statements(proc.body):
+            roots = _statement_exprs(stmt)
+            if stmt[0] == "call" and stmt[2][0] == "name":
+                if stmt[2][1] not in known_calls and stmt[2][1] not in variables:
+                    issues.append((stmt[1], f"thủ tục không xác định '{stmt[2][1]}'"))
+            for root in roots:
+                for expr in _walk_expr(root):
+                    if expr[0] == "member" and expr[2] not in members:
+                        issues.append((stmt[1], f"thành viên đối tượng không được hỗ trợ '.{expr[2]}'"))
+                    elif expr[0] == "call" and expr[1][0] == "name":
+                        name = expr[1][1]
+                        if name not in known_calls and name not in variables:
+                            issues.append((stmt[1], f"hàm không xác định '{name}'"))
+            for name, args in _call_sites(stmt):
+                if not assigned.get(name) or name in variables:
+                    continue
+                params = module.procedures[name].params
+                for index, (arg_name, arg) in enumerate(args):
+                    pname = arg_name if arg_name is not None else (params[index][0] if index < len(params) else None)
+                    if (pname in assigned[name] and arg is not None and arg[0] == "call"
+                            and arg[1][0] == "name" and arg[1][1] in variables):
+                        issues.append((stmt[1], f"phần tử mảng '{arg[1][1]}(...)' truyền cho tham số ByRef "
+                                                f"'{pname}' của {module.procedures[name].display_name} "
+                                                f"không được ghi lại"))
+    issues.sort(key=lambda item: item[0])
+    return issues
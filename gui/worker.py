@@ -1,21 +1,40 @@
 # worker.py
 import os
+import time
+import queue
+import signal
 import logging
+from multiprocessing.util import Finalize
 import mpp_logger
 from mpp_logger import get_mp_logger, LoggingMultiProcess, LOG_LEVELS, get_log_level_name
-import win32com.client as win32
+import backends
+from backends import DEFAULT_BACKEND
+from result_table import plain
 
 # Global logger variable for workers.
 logger = None
 
-def worker_logging_setup(shared_queue, shared_log_level):
+# Macro mặc định khi lượt chạy không chỉ định tệp .bas / tên macro.
+DEFAULT_MACRO_FILE = "macro_module.bas"
+DEFAULT_MACRO_NAME = "ProcessWorkbook"
+
+# Phiên Excel dùng chung trong suốt vòng đời của worker (mở một lần, dùng cho mọi tệp): một backends.ExcelBackend.
+session = None
+_excel_finalizer = None
+# Sự kiện huỷ của lượt chạy (process_queue), chuyển cho backend để dừng giữa một tệp.
+_cancel_event = None
+# Chu kỳ (giây) worker đang chờ việc kiểm tra yêu cầu thoát (retire_event).
+RETIRE_POLL = 0.5
+
+def worker_logging_setup(log_channel, shared_log_level):
     """
     Configures the worker process logger.
-    Clears inherited handlers and attaches a QueueHandler that sends logs to the shared queue.
+    Clears inherited handlers and attaches a handler that sends logs to the worker's log channel
+    (mpp_logger.LogChannel, bounded, with its overflow policy).
     """
     worker_logger = logging.getLogger(LoggingMultiProcess.MAIN_LOGGER)
     worker_logger.handlers.clear()
-    new_handler = LoggingMultiProcess.get_worker_handler(shared_queue)
+    new_handler = LoggingMultiProcess.get_worker_handler(log_channel)
     worker_logger.addHandler(new_handler)
     
     worker_logger.setLevel(shared_log_level)
@@ -25,44 +44,236 @@ def worker_logging_setup(shared_queue, shared_log_level):
     logger = worker_logger
     logger.info(f'shared_log_level: {get_log_level_name(shared_log_level)}')
 
-def process_excel_file(file_path):
+def excel_session_setup(backend=DEFAULT_BACKEND):
+    """
+    Starts the worker-lifetime Excel session of the given backend (a key of backends.BACKENDS) if it
+    is not running yet and returns it. The session is stopped by excel_session_teardown() when the
+    worker process exits.
+    """
+    global session, _excel_finalizer
+    if session is not None and session.name != backend:
+        excel_session_teardown()
+    if session is None:
+        new_session = backends.create_backend(backend)
+        new_session.cancel_event = _cancel_event
+        new_session.start()
+        session = new_session
+        if _excel_finalizer is None:
+            # Finalize with an exitpriority is run by multiprocessing when the worker exits normally.
+            _excel_finalizer = Finalize(None, excel_session_teardown, exitpriority=10)
+        if logger:
+            logger.info(f"Worker ({os.getpid()}): Đã khởi động phiên Excel dùng chung (backend {backend}).")
+    return session
+
+def excel_session_teardown():
+    """
+    Stops the worker-lifetime Excel session, if any.
+    """
+    global session
+    if session is None:
+        return
+    try:
+        session.stop()
+        if logger:
+            logger.info(f"Worker ({os.getpid()}): Đã đóng phiên Excel dùng chung.")
+    except Exception as e:
+        print(f"Worker ({os.getpid()}): Lỗi khi đóng Excel: {e}")
+    finally:
+        session = None
+
+def excel_session_restart(backend=DEFAULT_BACKEND):
+    """
+    Stops the current Excel session and starts a fresh one (used before retrying a failed file).
+    """
+    excel_session_teardown()
+    return excel_session_setup(backend)
+
+def excel_process_id():
+    """
+    Returns the OS process id of the worker's Excel instance, so a supervisor can kill a hung Excel.
+    Returns None when it cannot be determined (no session, or a backend without its own process).
+    """
+    if session is None:
+        return None
+    return session.process_id()
+
+def worker_init(log_channel, shared_log_level, backend=DEFAULT_BACKEND):
+    """
+    Pool initializer: sets up logging, then starts the Excel session reused by every file of this worker.
+    """
+    worker_logging_setup(log_channel, shared_log_level)
+    excel_session_setup(backend)
+
+def worker_main(task_queue, result_queue, cancel_event, log_channel, shared_log_level, backend=DEFAULT_BACKEND,
+                retire_event=None):
+    """
+    Entry point of a supervised worker process (see workerpool.WorkerPool):
+    initializes logging and Excel like a Pool worker, then serves the task queue until it receives None
+    or its own retire_event is set.
+    Ctrl+C is ignored here: cancellation is decided by the supervisor and arrives through cancel_event.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker_init(log_channel, shared_log_level, backend)
+    process_queue(task_queue, result_queue, cancel_event, retire_event)
+
+def _lap(timings, phase, start):
+    now = time.time()
+    timings[phase] = now - start
+    return now
+
+def process_excel_file(file_path, macro_file=DEFAULT_MACRO_FILE, macro_name=DEFAULT_MACRO_NAME,
+                       backend=DEFAULT_BACKEND, recipe=None, per_sheet=False, on_sheet=None):
+    """
+    Runs macro_name of macro_file on file_path in the worker's Excel session, or, when recipe is
+    given, applies that Python recipe (recipes.RECIPES) in-process instead, without Excel.
+    With per_sheet (or a backend that always works that way, like cpp), the macro is run once per
+    worksheet with its name and on_sheet(sheet, value, error, duration) is called after each one.
+
+    Returns the result record of the file (see result_table.py):
+        {"value": macro return value (recipe summary), "modified": workbook changed (None if unknown),
+         "timings": {"open", "import", "run", "save", "close"} in seconds, "sheets": worksheets run}
+    """
+    wb = None
+    excel = None
+    timings = {}
+    result = {"value": None, "modified": None, "timings": timings, "sheets": None}
     try:
         print(f"Worker ({os.getpid()}): Bắt đầu xử lý tệp: {file_path}")
         logger.info(f"Worker ({os.getpid()}): Bắt đầu xử lý tệp: {file_path}")
-        
-        excel = win32.gencache.EnsureDispatch("Excel.Application")
-        excel.Visible = False
-        logger.info(f"Mở file {file_path}")
-        wb = excel.Workbooks.Open(os.path.abspath(file_path))
-        
-        macro_file = os.path.abspath("macro_module.bas")
-        logger.info(f"Nhập module VBA từ {macro_file} vào {file_path}")
-        wb.VBProject.VBComponents.Import(macro_file)
-        
-        logger.warning(f"Chạy macro 'ProcessWorkbook' trên {file_path}")
-        excel.Application.Run("ProcessWorkbook")
-        
-        wb.Save()
-        wb.Close()
-        excel.Application.Quit()
+
+        if recipe:
+            import recipes
+            logger.warning(f"Chạy recipe '{recipe}' trên {file_path}")
+            start = time.time()
+            result["value"] = recipes.apply_recipe(os.path.abspath(file_path), recipe)
+            _lap(timings, "run", start)
+            result["modified"] = True
+            logger.info(result["value"])
+        else:
+            excel = excel_session_setup(backend)
+            logger.info(f"Mở file {file_path}")
+            phase = time.time()
+            wb = excel.open(os.path.abspath(file_path))
+            phase = _lap(timings, "open", phase)
+
+            macro_file = os.path.abspath(macro_file)
+            logger.info(f"Nhập module VBA từ {macro_file} vào {file_path}")
+            excel.import_macro(wb, macro_file)
+            phase = _lap(timings, "import", phase)
+
+            logger.warning(f"Chạy macro '{macro_name}' trên {file_path}")
+            if per_sheet or excel.per_sheet:
+                result["sheets"] = excel.run_sheets(wb, macro_name, on_sheet)
+            else:
+                result["value"] = plain(excel.run(wb, macro_name))
+            phase = _lap(timings, "run", phase)
+            result["modified"] = excel.modified(wb)
+
+            excel.save(wb)
+            phase = _lap(timings, "save", phase)
+            # Đóng workbook để cô lập các tệp với nhau; phiên Excel vẫn được giữ lại cho tệp tiếp theo.
+            excel.close(wb)
+            wb = None
+            _lap(timings, "close", phase)
 
         result_message = f"Worker ({os.getpid()}): Đã xử lý thành công {file_path}"
         print(result_message)
         logger.debug(result_message)
-        if '0003' in file_path:
-            raise RuntimeError('CRITICAL LOGGING SHOULD RAISED')
-        return result_message
+        return result
 
+    except backends.Cancelled as e:
+        logger.warning(f"Worker ({os.getpid()}): {e}: {file_path}")
+        if wb is not None:
+            try:
+                excel.close(wb, save_changes=False)
+            except Exception:
+                pass
+        raise
     except Exception as e:
         error_message = f"Worker ({os.getpid()}): Lỗi khi xử lý {file_path}: {str(e)}"
         logger.critical(error_message)
+        if wb is not None:
+            try:
+                excel.close(wb, save_changes=False)
+            except Exception:
+                pass
         raise Exception(error_message)
 
-def process_batch(batch, progress_queue, log_q):
+def process_queue(task_queue, result_queue, cancel_event=None, retire_event=None):
+    """
+    Pulls chunks (job, [(file_path, attempt), ...]) from the shared task_queue until it receives None;
+    job is {"macro_file", "macro_name", "backend", "recipe", "per_sheet"} of the run the chunk belongs to.
+    retire_event is the exit request of this worker alone (workerpool.WorkerPool.retire): it is
+    checked while waiting for a chunk and before each file, and the files of the chunk not started
+    yet are handed back to the supervisor, so a retirement takes effect after the current file.
+    Errors are isolated per file: a failing workbook is reported and the loop goes on with the next one.
+    A retried file (attempt > 0) is processed on a fresh Excel session.
+    Once cancel_event is set, no new file is started: the remaining files are reported as "cancelled".
+    A backend that can stop inside a workbook (cpp) also receives cancel_event and reports that file
+    "cancelled" when it stops there.
+
+    Events sent on result_queue (all carry "type" and "pid"):
+        "take"  : {"tasks"} when a chunk is taken, so the supervisor knows which files this worker holds.
+        "release": {"tasks"} the files of the chunk not started when the worker is asked to retire.
+        "start" : {"path", "attempt", "start", "excel_pid"} before each file, for the per-file deadline.
+        "sheet" : {"path", "attempt", "sheet", "value", "error", "duration"} as soon as each worksheet is
+                  done, when the macro is run per worksheet.
+        "done"  : {"path", "start", "end", "status", "error", "attempt", "result"} after each file, status
+                  being "ok", "failed" or "cancelled" and result the record returned by
+                  process_excel_file (None unless "ok"); the parent decides whether a failed file is retried.
+    Returns the number of files processed successfully by this worker.
+    """
+    global _cancel_event
+    _cancel_event = cancel_event
+    if session is not None:
+        session.cancel_event = cancel_event
     count = 0
-    for file_path in batch:
-        process_excel_file(file_path)
-        count += 1
-        progress_queue.put(1)
-        print(f"Worker ({os.getpid()}): Đã xử lý {file_path} – gửi thông báo cập nhật tiến trình.")
+    retired = False
+    while not retired:
+        if retire_event is not None and retire_event.is_set():
+            break
+        try:
+            chunk = task_queue.get() if retire_event is None else task_queue.get(timeout=RETIRE_POLL)
+        except queue.Empty:
+            continue
+        if chunk is None:
+            break
+        job, tasks = chunk
+        result_queue.put({"type": "take", "pid": os.getpid(), "tasks": tasks})
+        for index, (file_path, attempt) in enumerate(tasks):
+            start = time.time()
+            status, error, result = "ok", None, None
+            cancelled = cancel_event is not None and cancel_event.is_set()
+            if retire_event is not None and retire_event.is_set() and not cancelled:
+                result_queue.put({"type": "release", "pid": os.getpid(), "tasks": tasks[index:]})
+                retired = True
+                break
+            if cancelled:
+                result_queue.put({"type": "done", "pid": os.getpid(), "path": file_path, "start": start,
+                                  "end": start, "status": "cancelled", "error": None, "attempt": attempt,
+                                  "result": None})
+                continue
+
+            def on_sheet(sheet, value, sheet_error, duration, file_path=file_path, attempt=attempt):
+                result_queue.put({"type": "sheet", "pid": os.getpid(), "path": file_path, "attempt": attempt,
+                                  "sheet": sheet, "value": plain(value), "error": sheet_error,
+                                  "duration": duration})
+
+            try:
+                if attempt > 0:
+                    logger.warning(f"Worker ({os.getpid()}): Thử lại lần {attempt} với phiên Excel mới: {file_path}")
+                    excel_session_restart(job["backend"])
+                result_queue.put({"type": "start", "pid": os.getpid(), "path": file_path, "attempt": attempt,
+                                  "start": start, "excel_pid": excel_process_id()})
+                result = process_excel_file(file_path, job["macro_file"], job["macro_name"], job["backend"],
+                                            job.get("recipe"), job.get("per_sheet", False), on_sheet)
+                count += 1
+            except backends.Cancelled as e:
+                status, error = "cancelled", str(e)
+            except Exception as e:
+                status, error = "failed", str(e)
+            result_queue.put({"type": "done", "pid": os.getpid(), "path": file_path, "start": start,
+                              "end": time.time(), "status": status, "error": error, "attempt": attempt,
+                              "result": result})
+            print(f"Worker ({os.getpid()}): Đã xử lý {file_path} ({status}) – gửi thông báo cập nhật tiến trình.")
     return count
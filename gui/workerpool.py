@@ -0,0 +1,196 @@
+# workerpool.py
+"""
+Supervised worker processes for the Excel runs.
+
+multiprocessing.Pool cannot kill one worker and keep going: the task it was running is never
+completed, so pool.join() waits forever. WorkerPool instead owns plain multiprocessing.Process
+objects running worker.worker_main(), so the supervisor (scheduler.run_files) can kill a
+worker stuck on a hung macro together with its Excel process, and start a replacement that
+sets up logging (worker_logging_setup) and Excel again.
+
+The pool outlives a run when it is owned by a PoolService (pool_service.py): its queues and
+warm workers serve the next run, and resize() adds or retires workers without a restart.
+Each worker has its own retire event (not a None on the shared task queue, which a worker would
+only reach after every chunk queued before it): a retired worker exits after the file it is on
+and hands the rest of its chunk back to the supervisor ("release", see worker.process_queue).
+"""
+import os
+import signal
+import logging
+from multiprocessing import Process, Event
+
+import worker
+import backends
+from mpp_logger import LoggingMultiProcess
+
+logger = logging.getLogger(LoggingMultiProcess.MAIN_LOGGER)
+
+# Thời gian (giây) chờ một worker thoát bình thường trước khi buộc dừng nó.
+STOP_TIMEOUT = 30.0
+
+
+def kill_process(pid):
+    """
+    Kills an OS process by pid (TerminateProcess on Windows). Returns True if the signal was sent.
+    """
+    if not pid:
+        return False
+    try:
+        os.kill(pid, signal.SIGTERM)
+        return True
+    except OSError:
+        return False
+
+
+class WorkerPool:
+    """
+    A set of worker processes serving task_queue and reporting on result_queue.
+    """
+    def __init__(self, num_workers, task_queue, result_queue, cancel_event, mp_logging,
+                 backend=backends.DEFAULT_BACKEND):
+        self.num_workers = num_workers
+        self.backend = backend
+        self.task_queue = task_queue
+        self.result_queue = result_queue
+        self.cancel_event = cancel_event
+        self.mp_logging = mp_logging
+        self.workers = {}   # pid -> Process
+        self.channels = {}  # pid -> kênh log của worker (mpp_logger.LogChannel)
+        self.retire_events = {}  # pid -> Event yêu cầu riêng worker đó thoát
+        self.retiring = set()    # pid các worker đã được yêu cầu thoát (resize) nhưng chưa thoát
+        self.retired = []        # pid các worker đã thoát theo yêu cầu, chờ bộ điều phối nhận (take_retired)
+
+    def start(self):
+        for _ in range(self.num_workers):
+            self.spawn()
+        return self
+
+    def spawn(self):
+        """
+        Starts one worker process, with its own log channel, and returns its pid.
+        """
+        channel = self.mp_logging.open_channel()
+        retire_event = Event()
+        proc = Process(
+            target=worker.worker_main,
+            args=(self.task_queue, self.result_queue, self.cancel_event,
+                  channel, self.mp_logging.log_level.value, self.backend, retire_event),
+            daemon=True,
+        )
+        proc.start()
+        self.workers[proc.pid] = proc
+        self.channels[proc.pid] = channel
+        self.retire_events[proc.pid] = retire_event
+        return proc.pid
+
+    def _close_channel(self, pid, killed):
+        channel = self.channels.pop(pid, None)
+        if channel is not None:
+            self.mp_logging.close_channel(channel, abandon=killed)
+
+    def kill(self, pid, excel_pid=None):
+        """
+        Kills the worker pid and, if known, its Excel process.
+        """
+        proc = self.workers.pop(pid, None)
+        self.retire_events.pop(pid, None)
+        self.retiring.discard(pid)
+        if proc is not None:
+            proc.kill()
+            proc.join(timeout=5)
+            self._close_channel(pid, killed=True)
+        if kill_process(excel_pid):
+            logger.warning(f"Đã dừng tiến trình Excel ({excel_pid}) của worker ({pid})")
+
+    def replace(self, pid, excel_pid=None):
+        """
+        Kills the worker pid (and its Excel) and starts a replacement. Returns the new pid.
+        """
+        self.kill(pid, excel_pid)
+        new_pid = self.spawn()
+        logger.warning(f"Đã thay worker ({pid}) bằng worker mới ({new_pid})")
+        return new_pid
+
+    @property
+    def size(self):
+        """
+        Number of workers serving the task queue (those asked to retire excluded).
+        """
+        return len(self.workers) - len(self.retiring)
+
+    def retire(self, pid):
+        """
+        Asks the worker pid to exit after the file it is on; it closes its Excel session first.
+        """
+        event = self.retire_events.get(pid)
+        if event is not None and pid not in self.retiring:
+            event.set()
+            self.retiring.add(pid)
+
+    def resize(self, num_workers):
+        """
+        Grows or shrinks the pool to num_workers without restarting it. Extra workers (the newest
+        ones) are retired: they stop after their current file and release the rest of their chunk.
+        """
+        num_workers = max(num_workers, 1)
+        self.num_workers = num_workers
+        delta = num_workers - self.size
+        for _ in range(delta):
+            self.spawn()
+        if delta < 0:
+            serving = [pid for pid in self.workers if pid not in self.retiring]
+            for pid in serving[delta:]:
+                self.retire(pid)
+        if delta:
+            logger.info(f"Đổi số worker: {num_workers - delta} -> {num_workers}")
+
+    def reap(self):
+        """
+        Removes the workers that exited. Returns the pids of those that exited on their own
+        (crash, killed from outside); workers retired by resize() exit normally and are not returned
+        but kept for take_retired().
+        """
+        dead = []
+        for pid, proc in list(self.workers.items()):
+            if proc.is_alive():
+                continue
+            self.workers.pop(pid)
+            self.retire_events.pop(pid, None)
+            proc.join(timeout=0)
+            self._close_channel(pid, killed=proc.exitcode != 0)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                if proc.exitcode == 0:
+                    logger.info(f"Worker ({pid}) đã thoát (bớt worker)")
+                    self.retired.append(pid)
+                    continue
+            logger.error(f"Worker ({pid}) đã dừng bất thường (exitcode={proc.exitcode})")
+            dead.append(pid)
+        return dead
+
+    def take_retired(self):
+        """
+        The pids of the workers that exited after retire() since the last call. Their last events
+        may still be on the result queue: the supervisor reads them before releasing their files.
+        """
+        retired, self.retired = self.retired, []
+        return retired
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """
+        Asks every worker to exit (its retire event) so each can close its Excel session, then
+        kills the workers that did not exit within timeout.
+        """
+        for pid in list(self.workers):
+            self.retire(pid)
+        for pid, proc in list(self.workers.items()):
+            proc.join(timeout=timeout)
+            if proc.is_alive():
+                logger.error(f"Worker ({pid}) không thoát sau {timeout:.0f}s, buộc dừng.")
+                proc.kill()
+                proc.join(timeout=5)
+            self._close_channel(pid, killed=proc.exitcode != 0)
+        self.workers.clear()
+        self.retire_events.clear()
+        self.retiring.clear()
+        self.retired = []
@@ -2,10 +2,10 @@
 Module: Excel Batch Processor
 Mô tả:
     - Lấy tất cả các file Excel (.xlsx) từ một thư mục cụ thể sử dụng thư viện glob.
-    - Chia danh sách file thành các nhóm (batch) dựa trên số lõi CPU trừ đi 2 (ít nhất 1 lõi).
-    - Mỗi tiến trình sẽ xử lý một batch file Excel: mở file, nhập module VBA từ file macro_module.bas,
-      chạy macro 'ProcessWorkbook', lưu và đóng file.
-    - In ra kết quả xử lý của từng file.
+    - Dùng số tiến trình bằng số lõi CPU trừ đi 2 (ít nhất 1 lõi).
+    - Các file được phát từng cái một từ hàng đợi chung: tiến trình nào rảnh sẽ lấy file kế tiếp,
+      mở file, nhập module VBA từ file macro_module.bas, chạy macro 'ProcessWorkbook', lưu và đóng file.
+    - In ra kết quả xử lý của từng file và thời gian bận/rảnh của từng tiến trình.
 Yêu cầu:
     - Chạy trên Windows có cài đặt Microsoft Excel.
     - Cài đặt thư viện pywin32 (pip install pywin32).
@@ -24,31 +24,66 @@ Nhập module VBA từ file macro_module.bas và chạy macro ProcessWorkbook.
 
 Lưu và đóng file Excel, trả về thông báo kết quả xử lý.
 
-process_batch(batch):
+process_file_timed(file_path):
 
-Hàm nhận vào một batch (danh sách file) và gọi hàm xử lý cho từng file, trả về danh sách kết quả.
+Hàm gọi xử lý cho một file và trả về kèm pid của worker cùng thời điểm bắt đầu/kết thúc.
 
 Khối if name == "main":
 
 Sử dụng glob để lấy danh sách file Excel từ thư mục chỉ định.
 
-Tính số lõi CPU cần dùng (số lõi trừ đi 2) và chia danh sách file thành các batch, đảm bảo phân bổ phần dư.
+Tính số lõi CPU cần dùng (số lõi trừ đi 2).
 
-Sử dụng multiprocessing.Pool để xử lý các batch song song và in kết quả xử lý từng file.
+Sử dụng multiprocessing.Pool.imap_unordered (chunksize=1) để phát từng file cho worker đang rảnh,
+in kết quả xử lý từng file và bảng tổng kết thời gian bận/rảnh của mỗi worker.
 
 Mã nguồn trên giúp tự động hoá việc xử lý nhiều file Excel đồng thời, tối ưu tài nguyên CPU và dễ dàng bảo trì, mở rộng nếu cần.
 """
 
 import os
 import glob
+import time
+import pywintypes
 import win32com.client as win32
 from multiprocessing import Pool
+from multiprocessing.util import Finalize
+
+# Instance Excel dùng chung cho toàn bộ vòng đời của tiến trình worker
+excel = None
+
+
+def init_excel_session():
+    """
+    Hàm khởi tạo (initializer) của Pool: mở Excel một lần cho mỗi tiến trình worker.
+    Excel sẽ được đóng bởi close_excel_session() khi tiến trình worker kết thúc.
+    """
+    global excel
+    if excel is None:
+        # Khởi tạo instance Excel và ẩn giao diện người dùng
+        excel = win32.gencache.EnsureDispatch("Excel.Application")
+        excel.Visible = False
+        Finalize(None, close_excel_session, exitpriority=10)
+    return excel
+
+
+def close_excel_session():
+    """
+    Thoát instance Excel dùng chung của tiến trình worker.
+    """
+    global excel
+    if excel is not None:
+        try:
+            excel.Application.Quit()
+        except Exception:
+            pass  # Excel có thể đã chết: chỉ cần bỏ instance này
+        finally:
+            excel = None
 
 
 def process_excel_file(file_path):
     """
     Mở file Excel, nhập module VBA từ file macro_module.bas, chạy macro 'ProcessWorkbook',
-    lưu và đóng file.
+    lưu và đóng file. Instance Excel của worker được dùng lại cho mọi file.
 
     Parameters:
         file_path (str): Đường dẫn đến file Excel cần xử lý.
@@ -56,10 +91,9 @@ def process_excel_file(file_path):
     Returns:
         str: Thông báo kết quả xử lý cho file.
     """
+    wb = None
     try:
-        # Khởi tạo instance Excel và ẩn giao diện người dùng
-        excel = win32.gencache.EnsureDispatch("Excel.Application")
-        excel.Visible = False
+        excel = init_excel_session()
 
         # Mở file Excel theo đường dẫn tuyệt đối
         wb = excel.Workbooks.Open(os.path.abspath(file_path))
@@ -73,31 +107,37 @@ def process_excel_file(file_path):
         # Chạy macro 'ProcessWorkbook' được định nghĩa trong file macro_module.bas
         excel.Application.Run("ProcessWorkbook")
 
-        # Lưu thay đổi, đóng workbook và thoát Excel
+        # Lưu thay đổi và đóng workbook (Excel được giữ lại cho file tiếp theo)
         wb.Save()
         wb.Close()
-        excel.Application.Quit()
+        wb = None
 
         return f"Processed: {file_path}"
     except Exception as e:
+        if wb is not None:
+            try:
+                wb.Close(SaveChanges=False)
+            except Exception:
+                pass
+        if isinstance(e, pywintypes.com_error):
+            # Lỗi COM/RPC: Excel dùng chung có thể đã chết, file kế tiếp sẽ mở một instance mới.
+            close_excel_session()
         return f"Error processing {file_path}: {e}"
 
 
-def process_batch(batch):
+def process_file_timed(file_path):
     """
-    Xử lý một batch các file Excel.
+    Xử lý một file và đo thời gian, để tính thời gian bận/rảnh của từng worker.
 
     Parameters:
-        batch (list): Danh sách đường dẫn file Excel cần xử lý trong batch.
+        file_path (str): Đường dẫn đến file Excel cần xử lý.
 
     Returns:
-        list: Danh sách thông báo kết quả xử lý cho từng file trong batch.
+        tuple: (pid của worker, thời điểm bắt đầu, thời điểm kết thúc, thông báo kết quả).
     """
-    results = []
-    for file_path in batch:
-        result = process_excel_file(file_path)
-        results.append(result)
-    return results
+    start = time.time()
+    result = process_excel_file(file_path)
+    return os.getpid(), start, time.time(), result
 
 
 if __name__ == "__main__":
@@ -111,29 +151,27 @@ if __name__ == "__main__":
         print("No Excel files found in the specified directory.")
     else:
         # Xác định số lõi CPU cần dùng: tổng số lõi trừ đi 2 (ít nhất 1 lõi)
-        num_cores = os.cpu_count() - 2
+        num_cores = (os.cpu_count() or 1) - 2
         if num_cores < 1:
             num_cores = 1
 
         total_files = len(excel_files)
 
-        # Chia danh sách file thành các batch, mỗi batch xử lý bởi một tiến trình riêng
-        batches = []
-        batch_size = total_files // num_cores  # Số file tối thiểu trên mỗi batch
-        remainder = total_files % num_cores  # Phần dư file sau khi chia đều
-
-        start = 0
-        for i in range(num_cores):
-            # Nếu có dư, thêm 1 file vào các batch đầu tiên
-            end = start + batch_size + (1 if i < remainder else 0)
-            batches.append(excel_files[start:end])
-            start = end
-
-        # Xử lý các batch đồng thời bằng multiprocessing Pool
-        with Pool(processes=num_cores) as pool:
-            batch_results = pool.map(process_batch, batches)
-
-        # In kết quả ra màn hình (flatten danh sách kết quả)
-        for batch in batch_results:
-            for result in batch:
-                print(result)
+        # Phát từng file một (chunksize=1) từ hàng đợi chung của Pool: worker nào rảnh sẽ lấy
+        # file kế tiếp, nên một file lớn/chậm không giữ chân cả một nhóm file đã chia sẵn.
+        # (close() + join() thay vì "with", để các worker thoát bình thường và đóng Excel của mình)
+        run_start = time.time()
+        pool = Pool(processes=num_cores, initializer=init_excel_session)
+        busy = {}
+        for pid, start, end, result in pool.imap_unordered(process_file_timed, excel_files, chunksize=1):
+            busy.setdefault(pid, []).append(end - start)
+            print(result)
+        pool.close()
+        pool.join()
+        wall = time.time() - run_start
+
+        # Tổng kết thời gian bận/rảnh của từng worker
+        print(f"Tổng kết: {total_files} file, {num_cores} worker, thời gian chạy {wall:.2f}s")
+        for pid, durations in sorted(busy.items()):
+            busy_time = sum(durations)
+            print(f"  Worker ({pid}): {len(durations)} file, bận {busy_time:.2f}s, rảnh {max(0.0, wall - busy_time):.2f}s")
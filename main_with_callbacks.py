@@ -22,13 +22,14 @@ def DEBUG_LOG(message):
         caller = inspect.stack()[1].function
         print(f"[DEBUG] [{caller}] {message}")
 
-def process_excel_file(file_path):
+def process_excel_file(file_path, excel):
     """
     Xử lý một file Excel bằng cách mở file, nhập module VBA từ file macro_module.bas,
     chạy macro 'ProcessWorkbook', lưu và đóng file.
 
     Tham số:
         file_path (str): Đường dẫn đến file Excel cần xử lý.
+        excel: Instance Excel dùng chung cho cả batch (không bị thoát sau mỗi file).
 
     Trả về:
         str: Thông báo cho biết file đã được xử lý thành công.
@@ -36,11 +37,8 @@ def process_excel_file(file_path):
     Ném ra:
         Exception: Nếu có bất kỳ lỗi nào xảy ra trong quá trình xử lý.
     """
+    wb = None
     try:
-        DEBUG_LOG(f"Khởi tạo Excel cho {file_path}")
-        excel = win32.gencache.EnsureDispatch("Excel.Application")
-        excel.Visible = False
-
         DEBUG_LOG(f"Mở file {file_path}")
         wb = excel.Workbooks.Open(os.path.abspath(file_path))
         
@@ -54,7 +52,7 @@ def process_excel_file(file_path):
         
         wb.Save()
         wb.Close()
-        excel.Application.Quit()
+        wb = None
         
         result = f"Đã xử lý: {file_path}"
         DEBUG_LOG(result)
@@ -62,6 +60,8 @@ def process_excel_file(file_path):
     except Exception as e:
         error_msg = f"Lỗi khi xử lý {file_path}: {e}"
         DEBUG_LOG(error_msg)
+        if wb is not None:
+            wb.Close(SaveChanges=False)
         raise Exception(error_msg)
 
 def process_batch_callback(batch, success_callback, error_callback):
@@ -84,19 +84,26 @@ def process_batch_callback(batch, success_callback, error_callback):
     """
     batch_change_count = 0
     DEBUG_LOG(f"Bắt đầu xử lý batch với {len(batch)} file")
-    
-    for file_path in batch:
-        DEBUG_LOG(f"Đang xử lý file: {file_path}")
-        try:
-            result = process_excel_file(file_path)
-            batch_change_count += 1
-            global_results.append(result)
-            # Gọi hàm callback khi xử lý thành công file
-            success_callback(file_path, result)
-        except Exception as e:
-            # Gọi hàm callback khi có lỗi xảy ra trong file
-            error_callback(file_path, e)
-            global_results.append(f"Lỗi: {file_path}: {e}")
+
+    # Khởi tạo Excel một lần cho cả batch, mỗi file chỉ mở/đóng workbook của mình
+    DEBUG_LOG("Khởi tạo Excel cho batch")
+    excel = win32.gencache.EnsureDispatch("Excel.Application")
+    excel.Visible = False
+    try:
+        for file_path in batch:
+            DEBUG_LOG(f"Đang xử lý file: {file_path}")
+            try:
+                result = process_excel_file(file_path, excel)
+                batch_change_count += 1
+                global_results.append(result)
+                # Gọi hàm callback khi xử lý thành công file
+                success_callback(file_path, result)
+            except Exception as e:
+                # Gọi hàm callback khi có lỗi xảy ra trong file
+                error_callback(file_path, e)
+                global_results.append(f"Lỗi: {file_path}: {e}")
+    finally:
+        excel.Application.Quit()
     
     DEBUG_LOG(f"Hoàn thành xử lý batch. Tổng số thay đổi thành công: {batch_change_count}")
     print(f"Batch hoàn thành: {batch_change_count} thay đổi đã được xử lý.")